@@ -28,6 +28,9 @@ if not INSTALL_PHASE:
     from PyMimircache.cacheReader.plainReader import PlainReader
 
     from PyMimircache.profiler.cLRUProfiler import CLRUProfiler as CLRUProfiler
+    from PyMimircache.profiler.pyLRUProfiler import PyLRUProfiler
+    from PyMimircache.profiler.counterStacksProfiler import CounterStacksProfiler
+    from PyMimircache.profiler.incrementalLRUProfiler import IncrementalLRUProfiler
     from PyMimircache.profiler.cGeneralProfiler import CGeneralProfiler
     from PyMimircache.profiler.pyGeneralProfiler import PyGeneralProfiler
     from PyMimircache.profiler.cHeatmap import CHeatmap
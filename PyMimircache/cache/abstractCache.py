@@ -5,16 +5,43 @@
 """
 
 import abc
+import functools
+import numpy as np
+from PyMimircache.cacheReader.requestItem import RequestBatch
+
+
+def _accept_batch(access):
+    """
+    wrap the access of a cache, so that a RequestBatch given to access is passed to access_batch
+
+    :param access: the access method of a cache class
+    :return: the wrapped access method, the original one is its __wrapped__
+    """
+
+    @functools.wraps(access)
+    def wrapper(self, req_item, **kwargs):
+        if isinstance(req_item, RequestBatch):
+            return self.access_batch(req_item, **kwargs)
+        return access(self, req_item, **kwargs)
+    return wrapper
+
 
 class Cache:
     __metaclass__ = abc.ABCMeta
     all = ["access",
+           "access_batch",
            "get",
            "access",
            "evict",
            "_update",
            "_insert"]
 
+    def __init_subclass__(cls, **kwargs):
+        # every access defined by a cache accepts a RequestBatch, see access_batch
+        super().__init_subclass__(**kwargs)
+        if "access" in cls.__dict__:
+            cls.access = _accept_batch(cls.__dict__["access"])
+
     def __init__(self, cache_size, **kwargs):
         self.cache_size = cache_size
         if self.cache_size <= 0:
@@ -40,6 +67,23 @@ class Cache:
         """
         raise NotImplementedError("access is not implemented")
 
+    def access_batch(self, req_batch, **kwargs):
+        """
+        access all requests of a RequestBatch in order, access of every cache accepts a RequestBatch
+        and calls this, only item_id is passed to access, the size, op and real_time columns are not used
+
+        :param **kwargs: passed to access
+        :param req_batch: a RequestBatch
+        :return: a numpy bool array, whether each request is a hit
+        """
+
+        access = self.access
+        if hasattr(access, "__wrapped__"):
+            # the requests are not batches, skip the check in every access
+            access = access.__wrapped__.__get__(self)
+        return np.fromiter((access(req_id, **kwargs) for req_id in req_batch.item_id.tolist()),
+                           dtype=bool, count=len(req_batch))
+
     @abc.abstractmethod
     def has(self, req_item, **kwargs):
         """
@@ -7,6 +7,8 @@ this module contains the CacheLine class, which describes a cacheLine
 
 
 class CacheLine:
+    __slots__ = ("_item_id", "_size", "_op", "_cost")
+
     def __init__(self, item_id, size=1, op=None, cost=-1, **kwargs):
         self._item_id = item_id
         self._size = size
@@ -7,10 +7,18 @@
 """
 
 from abc import ABC, abstractmethod
+import io
 import os
+import numpy as np
+from itertools import islice
 from collections import defaultdict
 from PyMimircache.const import ALLOW_C_MIMIRCACHE, INSTALL_PHASE
-from multiprocessing import Manager, Lock
+from PyMimircache.cacheReader.offsetIndex import get_offset_index
+from PyMimircache.cacheReader.compressedFile import get_compression
+from PyMimircache.cacheReader.tracePartition import RangeFile, get_text_partitions
+from PyMimircache.cacheReader.requestItem import RequestBatch
+from PyMimircache.utils.fileLock import FileLock, fcntl
+from PyMimircache.utils.printing import *
 
 if ALLOW_C_MIMIRCACHE and not INSTALL_PHASE:
     import PyMimircache.CMimircache.CacheReader as c_cacheReader
@@ -31,6 +39,8 @@ class AbstractReader(ABC):
         :param block_unit_size:     block size for storage system, 0 when disabled
         :param disk_sector_size:    size of disk sector
         :param open_c_reader:       whether open c reader
+        :param lock:                the lock shared by copies of this reader in other processes,
+                                        if None, a lock of the trace file is created when it is first used
         """
 
         self.file_loc = file_loc
@@ -44,20 +54,58 @@ class AbstractReader(ABC):
         if self.disk_sector_size != 0:
             assert data_type == 'l', "block size option only support on block request(data type l)"
         assert (os.path.exists(file_loc)), "data file({}) does not exist".format(file_loc)
+        # gzip, bz2 or xz if the trace is compressed, compressed traces are opened with open_trace
+        self.compression = get_compression(file_loc)
+        if self.compression and ALLOW_C_MIMIRCACHE and open_c_reader:
+            WARNING("C reader does not support compressed trace {}, only Python reader is used".format(file_loc))
 
         self.support_real_time = False
         self.support_size = False
+        # whether the reader reads the trace file itself, so it can be split and seeked by byte offset
+        # (get_partitions, time_slice, offset index), wrapper readers leave it False
+        self.support_partitions = False
         self.already_load_rd = False
 
-        self.lock = lock
-        if self.lock is None:
-            self._mp_manager = Manager()
-            self.lock = self._mp_manager.Lock()
+        self._lock = lock
+
+        # the byte range [begin, end) read by this reader, None for the whole trace, see get_partitions
+        self.byte_range = None
+
+        # text readers set this to use an offset index, see cacheReader/offsetIndex
+        self.use_offset_index = False
+        # whether a newly built offset index is saved next to the trace
+        self.save_offset_index = False
+        self.offset_index = None
+        # (offset index, the time of each request recorded in it), see get_time_index
+        self._time_index = None
 
         self.counter = 0
         self.num_of_req = -1
         self.num_of_uniq_req = -1
 
+    @property
+    def lock(self):
+        """
+        the lock is created lazily, so constructing or copying a reader does not start any process,
+        it is a FileLock of the trace, which only holds a path and can be sent to other processes,
+        on platforms without fcntl it falls back to the lock of a multiprocessing Manager
+
+        :return: the lock
+        """
+
+        if self._lock is None:
+            if fcntl is not None:
+                self._lock = FileLock.for_file(self.file_loc)
+            else:
+                from multiprocessing import Manager
+                self._mp_manager = Manager()
+                self._lock = self._mp_manager.Lock()
+        return self._lock
+
+    @lock.setter
+    def lock(self, lock):
+        self._lock = lock
+
     def reset(self):
         """
         reset the read location back to beginning, similar as rewind in POSIX
@@ -70,10 +118,15 @@ class AbstractReader(ABC):
     def get_num_of_req(self):
         """
         count the number of requests in the trace, fast for binary type trace,
-        for plain/csv type trace, this is slow
+        for plain/csv type trace, this is slow unless the offset index is used
         :return: the number of requests in the trace
         """
 
+        # the offset index is rebuilt if the trace has grown
+        if self.use_offset_index and not self.c_reader:
+            self.num_of_req = self.get_offset_index().num_of_req
+            return self.num_of_req
+
         if self.num_of_req > 0:
             return self.num_of_req
 
@@ -130,7 +183,15 @@ class AbstractReader(ABC):
         :return: the request label or a list of information
         """
 
-        self.trace_file.seek(-max_req_size, 2)
+        if self.use_offset_index:
+            offset_index = self.get_offset_index()
+            self.trace_file.seek(offset_index.get_offset(max(offset_index.num_of_req - 1, 0))[0])
+        else:
+            pos = self.trace_file.seek(-max_req_size, 2)
+            # the line at pos may be partial, move to the beginning of the next line
+            if pos > (self.byte_range[0] if self.byte_range else 0):
+                self.trace_file.seek(pos - 1)
+                self.trace_file.readline()
 
         if label_only:
             read_func = self.read_one_req
@@ -146,6 +207,19 @@ class AbstractReader(ABC):
         self.reset()
         return last
 
+    def read_req_batch(self, n):
+        """
+        read at most n requests from current position as a RequestBatch, readers with read_batch
+        fill all the columns they have (size, op, real_time), other readers only fill item_id
+
+        :param n: the max number of requests
+        :return: a RequestBatch, empty at the end of trace
+        """
+
+        if hasattr(self, "read_batch"):
+            return RequestBatch.from_records(self.read_batch(n))
+        return RequestBatch(list(islice(iter(self.read_one_req, None), n)))
+
     def skip_n_req(self, n):
         """
         an efficient way to skip N requests from current position
@@ -155,6 +229,168 @@ class AbstractReader(ABC):
 
         pass
 
+    def get_offset_index(self):
+        """
+        the offset index of the trace, it is loaded or built the first time it is used
+        and rebuilt if the trace has changed, this resets the reader if the index is (re)loaded
+
+        :return: an OffsetIndex
+        """
+
+        if not self.support_partitions:
+            raise RuntimeError("{} does not read a trace file, it has no offset index".format(
+                self.__class__.__name__))
+        if self.offset_index is None or not self.offset_index.is_valid(self.file_loc):
+            self.reset()
+            self.offset_index = get_offset_index(self.file_loc, begin=self.trace_file.tell(),
+                                                 save=self.save_offset_index)
+        return self.offset_index
+
+    def get_partitions(self, num_of_partitions):
+        """
+        split the trace into at most num_of_partitions byte ranges of about the same size,
+        each range begins at the beginning of a line, this works for line based (plain and csv) traces,
+        the global id of the first request in each range is found with the offset index
+
+        :param num_of_partitions: the max number of partitions
+        :return: a list of (begin, end, first_req, num_of_req), see cacheReader/tracePartition
+        """
+
+        if not self.support_partitions:
+            raise RuntimeError("{} can not be partitioned".format(self.__class__.__name__))
+        assert self.byte_range is None, "a reader of a byte range can not be partitioned"
+        partitions = get_text_partitions(self.trace_file, self.get_offset_index(), num_of_partitions)
+        self.reset()
+        return partitions
+
+    def get_sub_reader_params(self, partition):
+        """
+        the parameters of a reader of one partition, they can be sent to a worker process
+        to create the reader with reader.__class__(**params)
+
+        :param partition: a partition from get_partitions
+        :return: a dictionary containing all parameters
+        """
+
+        params = self.get_params()
+        params["open_c_reader"] = False
+        params["byte_range"] = tuple(partition[:2])
+        return params
+
+    def get_sub_reader(self, partition):
+        """
+        a reader of the requests in one partition, the c reader is not opened
+
+        :param partition: a partition from get_partitions
+        :return: a reader of the same class
+        """
+
+        reader = self.__class__(**self.get_sub_reader_params(partition))
+        reader.num_of_req = partition[3]
+        return reader
+
+    def get_time_index(self):
+        """
+        a sparse timestamp index of a text trace, the time of every request recorded in the offset index,
+        it is built by reading one line at each recorded offset and rebuilt with the offset index,
+        this resets the reader
+
+        :return: a numpy double array, the i-th value is the time of request i*interval
+        """
+
+        assert self.support_real_time, "{} does not have a time column".format(self.__class__.__name__)
+        offset_index = self.get_offset_index()
+        if self._time_index is None or self._time_index[0] is not offset_index:
+            times = np.empty(len(offset_index.offsets), dtype=np.double)
+            for i, offset in enumerate(offset_index.offsets.tolist()):
+                self.trace_file.seek(offset)
+                times[i] = self.read_time_req()[0]
+            self._time_index = (offset_index, times)
+            self.reset()
+        return self._time_index[1]
+
+    def _find_time(self, t):
+        """
+        find the first request with time no earlier than t, requests must be sorted by time,
+        the recorded request before t is found in the time index, then at most interval lines are read
+
+        :param t: a timestamp
+        :return: (offset, request id) of the request, (end of trace, num_of_req) if all requests are earlier than t
+        """
+
+        times = self.get_time_index()
+        offset_index = self.get_offset_index()
+        i = int(np.searchsorted(times, t, side="left")) - 1
+        if i < 0:
+            return offset_index.begin, 0
+
+        self.trace_file.seek(int(offset_index.offsets[i]))
+        req_id = i * offset_index.interval
+        pos = self.trace_file.tell()
+        req = self.read_time_req()
+        while req is not None and req[0] < t:
+            req_id += 1
+            pos = self.trace_file.tell()
+            req = self.read_time_req()
+        if req is None:
+            pos = self.trace_file.seek(0, io.SEEK_END)
+        self.reset()
+        return pos, req_id
+
+    def time_slice(self, begin_time, end_time):
+        """
+        a reader of the requests with time in [begin_time, end_time), requests must be sorted by time,
+        the first and last request are found by binary search (binary traces) or the time index (text traces),
+        so the trace is not scanned from the beginning, the c reader is not opened
+
+        :param begin_time: the begin of the time window
+        :param end_time: the end (excluded) of the time window
+        :return: a reader of the same class
+        """
+
+        if not self.support_partitions:
+            raise RuntimeError("{} can not be sliced by time".format(self.__class__.__name__))
+        assert self.support_real_time, "{} does not have a time column".format(self.__class__.__name__)
+        assert self.byte_range is None, "a reader of a byte range can not be sliced"
+        assert begin_time <= end_time, "begin time {} is later than end time {}".format(begin_time, end_time)
+        begin, first_req = self._find_time(begin_time)
+        end, next_req = self._find_time(end_time)
+        return self.get_sub_reader((begin, end, first_req, next_req - first_req))
+
+    def _open_byte_range(self, byte_range):
+        """
+        limit the opened trace to a byte range, the offset index is not used
+        because it records offsets of the whole trace
+
+        :param byte_range: (begin, end) or None for the whole trace
+        """
+
+        if byte_range is not None:
+            self.byte_range = tuple(byte_range)
+            self.trace_file = RangeFile(self.trace_file, *self.byte_range)
+            self.use_offset_index = False
+
+    def _skip_n_req_with_offset_index(self, n):
+        """
+        skip N requests from current position using the offset index, this only works
+        when the current position is a request recorded in the index, such as right after reset
+
+        :param n: the number of requests to skip
+        :return: whether the requests are skipped
+        """
+
+        pos = self.trace_file.tell()
+        offset_index = self.get_offset_index()
+        req_id = offset_index.get_req_id(pos)
+        if req_id == -1:
+            self.trace_file.seek(pos)
+            return False
+
+        offset, num_of_lines = offset_index.get_offset(min(req_id + n, offset_index.num_of_req))
+        self.trace_file.seek(offset)
+        for i in range(num_of_lines):
+            self.read_one_req()
+        return True
 
     def __iter__(self):
         return self
@@ -189,6 +425,14 @@ class AbstractReader(ABC):
         """
         pass
 
+    def read_size_req(self):
+        """
+        read one request with its size in the form of (request label, size),
+        readers with a size column override this
+        :return: a tuple of (request label, size)
+        """
+        raise RuntimeError("{} does not support request size".format(self.__class__.__name__))
+
     @abstractmethod
     def copy(self, open_c_reader=False):
         """
@@ -9,13 +9,70 @@
 
 import io
 import os
+import re
+import mmap
 import struct
+import numpy as np
 
 from PyMimircache.const import ALLOW_C_MIMIRCACHE, INSTALL_PHASE
+from PyMimircache.utils.printing import *
 
 if ALLOW_C_MIMIRCACHE and not INSTALL_PHASE:
     import PyMimircache.CMimircache.CacheReader as c_cacheReader
 from PyMimircache.cacheReader.abstractReader import AbstractReader
+from PyMimircache.cacheReader.compressedFile import open_trace
+from PyMimircache.cacheReader.tracePartition import get_record_partitions
+
+
+# struct format character -> numpy kind, the size is from struct as it depends on byte order mode
+_STRUCT_TO_NUMPY = {"c": "S", "?": "b", "b": "i", "B": "u", "h": "i", "H": "u", "i": "i", "I": "u",
+                    "l": "i", "L": "u", "q": "i", "Q": "u", "n": "i", "N": "u", "e": "f", "f": "f", "d": "f"}
+# the name of fields in init_params, other fields are named by their column (f1, f2 ...)
+_FIELD_NAMES = ("label", "real_time", "size", "op")
+
+
+def fmt_to_dtype(fmt, init_params=None):
+    """
+    convert a struct format string into a numpy structured dtype with the same layout,
+    the offset of each field is computed by struct, so padding and alignment are the same as struct
+
+    :param fmt: struct format string
+    :param init_params: if given, the fields of label, real_time, size and op are named as the key,
+                    other fields are named by column number beginning from 1, such as f1, f2
+    :return: a numpy dtype
+    """
+
+    byte_order = fmt[0] if fmt and fmt[0] in "@=<>!" else "@"
+    endian = {"@": "=", "=": "=", "<": "<", ">": ">", "!": ">"}[byte_order]
+    column_names = {}
+    for name in _FIELD_NAMES:
+        if init_params and init_params.get(name, -1) != -1:
+            column_names[init_params[name]] = name
+
+    names, formats, offsets = [], [], []
+    prefix = fmt[:1] if byte_order == fmt[:1] else ""
+    for count, char in re.findall(r"(\d*)([a-zA-Z?])", fmt[len(prefix):]):
+        count = int(count) if count else 1
+        if char == "x":
+            prefix += "{}x".format(count)
+            continue
+        if char == "p" or char == "P" or (char not in _STRUCT_TO_NUMPY and char != "s"):
+            raise RuntimeError("format character {} is not supported in batch read".format(char))
+        repeat = 1 if char == "s" else count
+        if char == "s":
+            np_type = np.dtype("S{}".format(count))
+        else:
+            kind = _STRUCT_TO_NUMPY[char]
+            np_type = np.dtype("{}{}".format(kind, struct.calcsize(byte_order + char)))
+            if kind in "iuf":
+                np_type = np_type.newbyteorder(endian)
+        for _ in range(repeat):
+            prefix += "{}s".format(count) if char == "s" else char
+            column = len(names) + 1
+            names.append(column_names.get(column, "f{}".format(column)))
+            formats.append(np_type)
+            offsets.append(struct.calcsize(prefix) - np_type.itemsize)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": struct.calcsize(fmt)})
 
 
 class BinaryReader(AbstractReader):
@@ -23,7 +80,8 @@ class BinaryReader(AbstractReader):
     BinaryReader class for reading binary trace
     """
     all = ["read_one_req", "read_complete_req", "get_num_of_req", "skip_n_req",
-           "lines", "read_time_req", "reset", "copy", "get_params"]
+           "read_batch", "iter_batches", "get_records", "get_column",
+           "get_partitions", "get_sub_reader", "time_slice", "lines", "read_time_req", "reset", "copy", "get_params"]
 
     def __init__(self, file_loc, init_params, data_type='c',
                  block_unit_size=0, disk_sector_size=0, open_c_reader=True, **kwargs):
@@ -53,7 +111,11 @@ class BinaryReader(AbstractReader):
         :param block_unit_size:     block size for storage system, 0 when disabled
         :param disk_sector_size:    size of disk sector
         :param open_c_reader:       whether open c reader
-        :param kwargs:              not used now
+        :param kwargs:              use_mmap (read the trace through a read-only np.memmap of records instead
+                                    of buffered file reads, processes reading the same trace share the page cache),
+                                    data_offset (the number of bytes before the first record, such as a header),
+                                    byte_range ((begin, end), only read the records in the range,
+                                    see get_partitions, it overrides data_offset)
         """
 
         super(BinaryReader, self).__init__(file_loc, data_type, block_unit_size, disk_sector_size,
@@ -67,22 +129,40 @@ class BinaryReader(AbstractReader):
         self.fmt = init_params['fmt']
         # this number begins from 1, so need to reduce by one before use
         self.label_column = init_params['label']
-        self.time_column = init_params.get("real_time", )
-        self.size_column = init_params.get("size", )
-
-        self.trace_file = open(file_loc, 'rb')
+        self.time_column = init_params.get("real_time", -1)
+        self.size_column = init_params.get("size", -1)
+
+        self.use_mmap = kwargs.get("use_mmap", False)
+        if self.use_mmap and self.compression:
+            WARNING("compressed trace {} can not be memory mapped".format(file_loc))
+            self.use_mmap = False
+        self.data_offset = kwargs.get("data_offset", 0)
+        self.support_partitions = True
+        self.trace_file = open_trace(file_loc)
+        self.trace_file.seek(self.data_offset)
         self.struct_instance = struct.Struct(self.fmt)
         self.record_size = struct.calcsize(self.fmt)
-        self.trace_file_size = os.path.getsize(self.file_loc)
-        assert self.trace_file_size % self.record_size == 0, \
-            "file size ({}) is not multiple of record size ({})".format(self.trace_file_size, self.record_size)
+        self.dtype = fmt_to_dtype(self.fmt, init_params)
+        if self.compression:
+            self.trace_file_size = self.trace_file.get_size()
+        else:
+            self.trace_file_size = os.path.getsize(self.file_loc)
+        if kwargs.get("byte_range") is not None:
+            # the range is read as if it were the whole trace between data_offset and the end of file
+            assert kwargs["byte_range"][1] <= self.trace_file_size, "byte range is beyond the end of trace"
+            self.data_offset, self.trace_file_size = kwargs["byte_range"]
+            self._open_byte_range(kwargs["byte_range"])
+        assert (self.trace_file_size - self.data_offset) % self.record_size == 0, \
+            "data size ({}) is not multiple of record size ({})".format(
+                self.trace_file_size - self.data_offset, self.record_size)
 
         if self.time_column != -1:
             self.support_real_time = True
         if self.size_column != -1:
             self.support_size = True
 
-        if ALLOW_C_MIMIRCACHE and open_c_reader:
+        if ALLOW_C_MIMIRCACHE and open_c_reader and not self.compression and self.byte_range is None:
+            assert self.data_offset == 0, "C reader can not skip the first {} bytes".format(self.data_offset)
             # the data type here is not real data type, it will auto correct in C
             self.c_reader = c_cacheReader.setup_reader(file_loc, 'b', data_type=self.data_type,
                                                                  block_unit_size=block_unit_size,
@@ -90,10 +170,45 @@ class BinaryReader(AbstractReader):
                                                                  init_params=init_params)
         self.get_num_of_req()
 
-        # this might cause problem on Windows and it does give any performance gain
-        # self.mm = mmap.mmap(self.trace_file.fileno(), 0, mmap.MAP_SHARED, mmap.PROT_READ)
-        # self.trace_file_original = self.trace_file
-        # self.trace_file = self.mm
+        # the records mapped into memory and the index of next record, only used with use_mmap,
+        # single records are read from the raw map, which shares the same pages with the records
+        self.records = None
+        self.raw_map = None
+        self.position = 0
+        if self.use_mmap and self.num_of_req > 0:
+            self.records = self.get_records()
+            self.raw_map = mmap.mmap(self.trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_partitions(self, num_of_partitions):
+        """
+        split the trace into at most num_of_partitions byte ranges of about the same number of records
+
+        :param num_of_partitions: the max number of partitions
+        :return: a list of (begin, end, first_req, num_of_req), see cacheReader/tracePartition
+        """
+
+        return get_record_partitions(self.data_offset, self.get_num_of_req(), self.record_size, num_of_partitions)
+
+    def _find_time(self, t):
+        """
+        binary search the first request with time no earlier than t, requests must be sorted by time,
+        only log(N) records are read
+
+        :param t: a timestamp
+        :return: (offset, request id) of the request, (end of trace, num_of_req) if all requests are earlier than t
+        """
+
+        assert self.time_column != -1, "you need to provide time in order to use this function"
+        lo, hi = 0, self.get_num_of_req()
+        while lo < hi:
+            mid = (lo + hi) // 2
+            self.trace_file.seek(self.data_offset + mid * self.record_size)
+            if float(self.struct_instance.unpack(self.trace_file.read(self.record_size))[self.time_column - 1]) < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        self.reset()
+        return self.data_offset + lo * self.record_size, lo
 
     def get_num_of_req(self):
         """
@@ -105,9 +220,105 @@ class BinaryReader(AbstractReader):
         if self.num_of_req > 0:
             return self.num_of_req
 
-        self.num_of_req = self.trace_file_size // self.record_size
+        self.num_of_req = (self.trace_file_size - self.data_offset) // self.record_size
         return self.num_of_req
 
+    def get_records(self):
+        """
+        all records of the trace as a read-only np.memmap with the dtype from fmt_to_dtype,
+        the records are not read until accessed, and the same pages are shared by all processes,
+        note that the label is the raw value without block_unit_size conversion
+
+        :return: a numpy structured array (np.memmap) of all records,
+                    a compressed trace can not be mapped, so it is decompressed into memory
+        """
+
+        if self.records is not None:
+            return self.records
+        if self.num_of_req == 0:
+            # an empty file can not be mapped
+            return np.zeros(0, dtype=self.dtype)
+        if self.compression:
+            pos = self.trace_file.tell()
+            self.trace_file.seek(self.data_offset)
+            b = self.trace_file.read(self.num_of_req * self.record_size)
+            self.trace_file.seek(pos)
+            return np.frombuffer(b, dtype=self.dtype, count=self.num_of_req)
+        return np.memmap(self.file_loc, dtype=self.dtype, mode="r", offset=self.data_offset,
+                         shape=(self.num_of_req, ))
+
+    def get_column(self, name):
+        """
+        a column of all records, such as label, real_time, size, op or f1, f2 ...,
+        it is a zero-copy view of the memory mapped trace, except for label with block_unit_size conversion
+
+        :param name: the name of the column
+        :return: a numpy array
+        """
+
+        column = self.get_records()[name]
+        if name == "label" and self.data_type == 'l' and self.block_unit_size != 0 and self.disk_sector_size != 0:
+            column = column.astype(np.int64) * self.disk_sector_size // self.block_unit_size
+        return column
+
+    def _convert_label(self, batch):
+        """
+        convert the label of a batch of records with block_unit_size and disk_sector_size,
+        the label is widened to int64 first, because label * disk_sector_size may not fit in the label format
+
+        :param batch: a numpy structured array with the dtype from fmt_to_dtype
+        :return: a new numpy structured array, label is int64 and the other fields are the same
+        """
+
+        dtype = np.dtype([(name, np.int64 if name == "label" else batch.dtype.fields[name][0])
+                          for name in batch.dtype.names])
+        converted = np.empty(len(batch), dtype=dtype)
+        for name in batch.dtype.names:
+            converted[name] = batch[name]
+        converted["label"] *= self.disk_sector_size
+        converted["label"] //= self.block_unit_size
+        return converted
+
+    def __getitem__(self, index):
+        """
+        random access to requests by index or slice
+
+        :param index: an int index or a slice
+        :return: the label of the request, or a numpy array of labels for slice
+        """
+
+        label = self.get_records()["label"][index]
+        if not isinstance(index, slice):
+            label = label.item()
+        if self.data_type == 'l' and self.block_unit_size != 0 and self.disk_sector_size != 0:
+            if isinstance(index, slice):
+                label = label.astype(np.int64)
+            label = label * self.disk_sector_size // self.block_unit_size
+        return label
+
+    def _read_bytes(self, n=1):
+        """
+        read the raw bytes of at most n records from current position
+
+        :param n: the number of records
+        :return: bytes, empty at the end of trace
+        """
+
+        if self.raw_map is None:
+            return self.trace_file.read(self.record_size * n)
+        begin = self.data_offset + self.position * self.record_size
+        b = self.raw_map[begin: min(begin + n * self.record_size, self.trace_file_size)]
+        self.position += len(b) // self.record_size
+        return b
+
+    def reset(self):
+        """
+        reset the read location back to beginning, similar as rewind in POSIX
+        """
+        super().reset()
+        self.trace_file.seek(self.data_offset)
+        self.position = 0
+
     def read_one_req(self):
         """
         read one request, only return the label of the request
@@ -116,7 +327,7 @@ class BinaryReader(AbstractReader):
 
         super().read_one_req()
 
-        b = self.trace_file.read(self.record_size)
+        b = self._read_bytes()
         if b and len(b):
             ret = self.struct_instance.unpack(b)[self.label_column - 1]
             if self.data_type == 'l':
@@ -136,7 +347,7 @@ class BinaryReader(AbstractReader):
 
         super().read_one_req()
 
-        b = self.trace_file.read(self.record_size)
+        b = self._read_bytes()
         if len(b):
             ret = list(self.struct_instance.unpack(b))
             if self.block_unit_size != 0 and self.disk_sector_size != 0:
@@ -152,7 +363,13 @@ class BinaryReader(AbstractReader):
         :return: a list of all info in the request
         """
 
-        return super().read_last_req(label_only, max_req_size=self.record_size)
+        if self.records is not None:
+            self.position = self.num_of_req - 1
+        else:
+            self.trace_file.seek(-self.record_size, 2)
+        last = self.read_one_req() if label_only else self.read_complete_req()
+        self.reset()
+        return last
 
 
     def lines(self):
@@ -162,12 +379,12 @@ class BinaryReader(AbstractReader):
         :return: a list of information of current request
         """
 
-        b = self.trace_file.read(self.record_size)
+        b = self._read_bytes()
         while len(b):
             ret = list(self.struct_instance.unpack(b))
             if self.block_unit_size != 0 and self.disk_sector_size != 0:
                 ret[self.label_column - 1] = ret[self.label_column - 1] * self.disk_sector_size // self.block_unit_size
-            b = self.trace_file.read(self.record_size)
+            b = self._read_bytes()
             yield ret
 
     def read_time_req(self):
@@ -179,7 +396,7 @@ class BinaryReader(AbstractReader):
         assert self.time_column != -1, "you need to provide time in order to use this function"
         super().read_one_req()
 
-        b = self.trace_file.read(self.record_size)
+        b = self._read_bytes()
         if len(b):
             ret = self.struct_instance.unpack(b)
             try:
@@ -197,6 +414,63 @@ class BinaryReader(AbstractReader):
         else:
             return None
 
+    def read_size_req(self):
+        """
+        return size information for the request in the form of (request label, size)
+        :return: a tuple of (request label, size)
+        """
+
+        assert self.size_column != -1, "you need to provide size in order to use this function"
+        super().read_one_req()
+
+        b = self._read_bytes()
+        if len(b):
+            ret = self.struct_instance.unpack(b)
+            obj = ret[self.label_column - 1]
+            if self.data_type == 'l' and self.block_unit_size != 0 and self.disk_sector_size != 0:
+                obj = int(obj) * self.disk_sector_size // self.block_unit_size
+            return obj, int(ret[self.size_column - 1])
+        else:
+            return None
+
+    def read_batch(self, n):
+        """
+        read at most n requests from current position as a numpy structured array, whose dtype is
+        from fmt_to_dtype, the fields of label, real_time, size and op are named as in init_params,
+        other fields are named by column number (f1, f2 ...),
+        label is converted with block_unit_size and disk_sector_size in the same way as read_one_req
+
+        :param n: the max number of requests
+        :return: a numpy structured array, empty at the end of trace, with use_mmap,
+                    it is a read-only view of the mapped trace unless label needs conversion,
+                    a converted label is int64
+        """
+
+        if self.records is not None:
+            # a read-only view of the mapped records, copied only when the label needs conversion
+            batch = self.records[self.position: self.position + n]
+            self.position += len(batch)
+        else:
+            b = self.trace_file.read(self.record_size * n)
+            batch = np.frombuffer(b, dtype=self.dtype, count=len(b) // self.record_size).copy()
+        if self.data_type == 'l' and self.block_unit_size != 0 and self.disk_sector_size != 0:
+            batch = self._convert_label(batch)
+        self.counter += len(batch)
+        return batch
+
+    def iter_batches(self, n):
+        """
+        a generator of batches of at most n requests from current position till the end of trace
+
+        :param n: the number of requests in one batch
+        :return: a generator of numpy structured arrays
+        """
+
+        batch = self.read_batch(n)
+        while len(batch):
+            yield batch
+            batch = self.read_batch(n)
+
     def skip_n_req(self, n):
         """
         skip N requests from current position
@@ -204,7 +478,10 @@ class BinaryReader(AbstractReader):
         :param n: the number of requests to skip
         """
 
-        self.trace_file.seek(struct.calcsize(self.fmt) * n, io.SEEK_CUR)
+        if self.records is not None:
+            self.position = min(self.position + n, self.num_of_req)
+        else:
+            self.trace_file.seek(struct.calcsize(self.fmt) * n, io.SEEK_CUR)
 
     def copy(self, open_c_reader=False):
         """
@@ -217,7 +494,8 @@ class BinaryReader(AbstractReader):
 
         return BinaryReader(self.file_loc, self.init_params, data_type=self.data_type,
                             block_unit_size=self.block_unit_size, disk_sector_size=self.disk_sector_size,
-                            open_c_reader=open_c_reader, lock=self.lock)
+                            open_c_reader=open_c_reader, lock=self.lock, use_mmap=self.use_mmap,
+                            data_offset=self.data_offset, byte_range=self.byte_range)
 
     def get_params(self):
         """
@@ -232,16 +510,21 @@ class BinaryReader(AbstractReader):
             "block_unit_size": self.block_unit_size,
             "disk_sector_size": self.disk_sector_size,
             "open_c_reader": self.open_c_reader,
-            "lock": self.lock
+            "lock": self.lock,
+            "use_mmap": self.use_mmap,
+            "data_offset": self.data_offset,
+            "byte_range": self.byte_range
         }
 
-    def read_one_element_mmap(self):
+    def close(self):
         """
-        wip
-        :return:
+        close reader, the memory mapped records are released
         """
-
-        pass
+        self.records = None
+        if getattr(self, "raw_map", None) is not None:
+            self.raw_map.close()
+            self.raw_map = None
+        super().close()
 
     def __next__(self):
         super().__next__()
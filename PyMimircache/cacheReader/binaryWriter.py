@@ -45,6 +45,17 @@ class TraceBinaryWriter:
         b = self.structIns.pack(*value)
         self.ofile.write(b)
 
+    def write_batch(self, records):
+        """
+        write many records at once
+
+        :param records: a numpy structured array with the same layout as fmt, see binaryReader.fmt_to_dtype
+
+        """
+        assert records.dtype.itemsize == self.structIns.size, \
+            "record size {} does not match fmt {}".format(records.dtype.itemsize, self.fmt)
+        self.ofile.write(records.tobytes())
+
 
     def close(self):
         """
@@ -0,0 +1,389 @@
+# coding=utf-8
+"""
+    transparent reading of gzip, bz2 and xz compressed traces
+
+    a compressed trace is read through CompressedFile, which decompresses it as a stream,
+    so sequential scans never write the decompressed trace to disk.
+    Seeking backward or far forward in a stream needs to decompress from the beginning,
+    so CompressedFile uses a block index of the independently compressed members (streams) in the file,
+    which is built in one pass and kept in memory, a seek then only decompresses from the beginning
+    of the member that contains the position. Like the offset index, the block index is only saved next to
+    the trace as <trace>.blocks.npz when asked (see SAVE_OFFSET_INDEX in const), a saved index is loaded if it exists
+
+    gzip, bz2 and xz all allow concatenated members, and standard tools read them as one file,
+    a trace compressed as a single member can be rewritten into independent blocks with write_blocks,
+    so that the block index is useful
+
+"""
+
+import os
+import io
+import bz2
+import gzip
+import lzma
+import zlib
+import numpy as np
+from PyMimircache.const import SAVE_OFFSET_INDEX
+from PyMimircache.utils.printing import *
+
+
+BLOCK_INDEX_SUFFIX = ".blocks.npz"
+# the size of decompressed data in one member written by write_blocks
+DEF_COMPRESSED_BLOCK_SIZE = 4 * 1024 ** 2
+# forward seeks shorter than this decompress the data in between instead of using the block index
+_SEEK_FORWARD_LIMIT = 1024 ** 2
+_SCAN_CHUNK_SIZE = 1024 ** 2
+
+_MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "xz"))
+_EXTENSIONS = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz"}
+
+
+def _open_stream(compression, fileobj):
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    elif compression == "bz2":
+        return bz2.BZ2File(fileobj, mode="rb")
+    else:
+        return lzma.LZMAFile(fileobj, mode="rb")
+
+
+def _new_decompressor(compression):
+    if compression == "gzip":
+        return zlib.decompressobj(zlib.MAX_WBITS | 16)
+    elif compression == "bz2":
+        return bz2.BZ2Decompressor()
+    else:
+        return lzma.LZMADecompressor()
+
+
+def _compress(compression, data):
+    if compression == "gzip":
+        return gzip.compress(data)
+    elif compression == "bz2":
+        return bz2.compress(data)
+    else:
+        return lzma.compress(data, format=lzma.FORMAT_XZ)
+
+
+def get_compression(file_loc):
+    """
+    detect the compression of a file by its magic number
+
+    :param file_loc: location of the file
+    :return: gzip, bz2, xz, or None if it is not compressed
+    """
+
+    with open(file_loc, "rb") as ifile:
+        head = ifile.read(6)
+    for magic, compression in _MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_trace(file_loc, save_index=SAVE_OFFSET_INDEX):
+    """
+    open a trace for binary reading, compressed traces are opened as CompressedFile
+
+    :param file_loc: location of the trace
+    :param save_index: whether the block index of a compressed trace is saved next to it, see CompressedFile
+    :return: a file object
+    """
+
+    compression = get_compression(file_loc)
+    if compression is None:
+        return open(file_loc, "rb")
+    return CompressedFile(file_loc, compression, save_index=save_index)
+
+
+class BlockIndex:
+    """
+    compressed and decompressed offsets of the members of a compressed file
+
+    """
+    all = ["build", "load", "save", "is_valid", "find"]
+
+    def __init__(self, comp_offsets, decomp_offsets, decomp_size, file_size, file_mtime):
+        """
+        :param comp_offsets: a numpy int64 array of the offsets of members in the compressed file
+        :param decomp_offsets: a numpy int64 array of the offsets of members in the decompressed data
+        :param decomp_size: the size of decompressed data
+        :param file_size: the size of the compressed file when the index is built
+        :param file_mtime: the modification time (ns) of the compressed file when the index is built
+        """
+
+        self.comp_offsets = np.asarray(comp_offsets, dtype=np.int64)
+        self.decomp_offsets = np.asarray(decomp_offsets, dtype=np.int64)
+        self.decomp_size = decomp_size
+        self.file_size = file_size
+        self.file_mtime = file_mtime
+
+    @classmethod
+    def build(cls, file_loc, compression=None):
+        """
+        decompress the file once and record where each member begins
+
+        :param file_loc: location of the compressed file
+        :param compression: gzip, bz2 or xz, detected if not given
+        :return: a BlockIndex
+        """
+
+        if compression is None:
+            compression = get_compression(file_loc)
+        stat = os.stat(file_loc)
+        comp_offsets, decomp_offsets = [0], [0]
+        decompressor = _new_decompressor(compression)
+        decomp_pos = 0
+        with open(file_loc, "rb") as ifile:
+            data = ifile.read(_SCAN_CHUNK_SIZE)
+            while data:
+                decomp_pos += len(decompressor.decompress(data))
+                if not decompressor.eof:
+                    data = ifile.read(_SCAN_CHUNK_SIZE)
+                    continue
+                # the rest of data belongs to next member
+                data = decompressor.unused_data
+                comp_pos = ifile.tell() - len(data)
+                if not data:
+                    data = ifile.read(_SCAN_CHUNK_SIZE)
+                if data.strip(b"\0"):
+                    comp_offsets.append(comp_pos)
+                    decomp_offsets.append(decomp_pos)
+                    decompressor = _new_decompressor(compression)
+                else:
+                    # zero padding at the end of file
+                    break
+
+        DEBUG("built block index of {} members for {}".format(len(comp_offsets), file_loc))
+        return cls(comp_offsets, decomp_offsets, decomp_pos, stat.st_size, stat.st_mtime_ns)
+
+    @classmethod
+    def load(cls, file_loc):
+        """
+        load the index saved next to the compressed file
+
+        :param file_loc: location of the compressed file
+        :return: a BlockIndex, None if there is no index or it does not match the file
+        """
+
+        index_loc = file_loc + BLOCK_INDEX_SUFFIX
+        if not os.path.exists(index_loc):
+            return None
+        try:
+            with np.load(index_loc, allow_pickle=False) as saved:
+                decomp_size, file_size, file_mtime = saved["stat"].tolist()
+                index = cls(saved["comp_offsets"], saved["decomp_offsets"], decomp_size, file_size, file_mtime)
+        except (OSError, ValueError, KeyError) as e:
+            WARNING("failed to load block index {}: {}".format(index_loc, e))
+            return None
+        return index if index.is_valid(file_loc) else None
+
+    def save(self, file_loc):
+        """
+        save the index next to the compressed file, the file is written atomically
+
+        :param file_loc: location of the compressed file
+        :return: whether the index is saved
+        """
+
+        index_loc = file_loc + BLOCK_INDEX_SUFFIX
+        tmp_loc = "{}.tmp.{}".format(index_loc, os.getpid())
+        try:
+            with open(tmp_loc, "wb") as ofile:
+                np.savez(ofile, comp_offsets=self.comp_offsets, decomp_offsets=self.decomp_offsets,
+                         stat=np.array([self.decomp_size, self.file_size, self.file_mtime], dtype=np.int64))
+            os.replace(tmp_loc, index_loc)
+        except OSError as e:
+            DEBUG("block index of {} is not saved: {}".format(file_loc, e))
+            if os.path.exists(tmp_loc):
+                os.remove(tmp_loc)
+            return False
+        return True
+
+    def is_valid(self, file_loc):
+        """
+        :param file_loc: location of the compressed file
+        :return: whether the file is unchanged since the index is built
+        """
+
+        stat = os.stat(file_loc)
+        return stat.st_size == self.file_size and stat.st_mtime_ns == self.file_mtime
+
+    def find(self, pos):
+        """
+        :param pos: a position in the decompressed data
+        :return: (compressed offset, decompressed offset) of the member that contains pos
+        """
+
+        i = max(int(np.searchsorted(self.decomp_offsets, pos, side="right")) - 1, 0)
+        return int(self.comp_offsets[i]), int(self.decomp_offsets[i])
+
+    def __repr__(self):
+        return "BlockIndex ({} members, {} bytes decompressed)".format(len(self.comp_offsets), self.decomp_size)
+
+
+def get_block_index(file_loc, compression=None, save=SAVE_OFFSET_INDEX):
+    """
+    load the saved block index of a compressed file, build it if it does not exist or is out of date
+
+    :param file_loc: location of the compressed file
+    :param compression: gzip, bz2 or xz, detected if not given
+    :param save: whether save a newly built index next to the compressed file
+    :return: a BlockIndex
+    """
+
+    index = BlockIndex.load(file_loc)
+    if index is None:
+        index = BlockIndex.build(file_loc, compression)
+        if save:
+            index.save(file_loc)
+    return index
+
+
+class CompressedFile:
+    """
+    a read-only binary file object of the decompressed data of a compressed file,
+    it supports read, readline, seek and tell like a file opened with open(file_loc, "rb")
+
+    """
+    all = ["read", "readline", "seek", "tell", "get_size", "get_block_index", "close"]
+
+    def __init__(self, file_loc, compression=None, save_index=SAVE_OFFSET_INDEX):
+        """
+        :param file_loc: location of the compressed file
+        :param compression: gzip, bz2 or xz, detected if not given
+        :param save_index: whether save the block index next to the compressed file when it is built
+        """
+
+        self.file_loc = file_loc
+        self.save_index = save_index
+        self.compression = compression if compression is not None else get_compression(file_loc)
+        assert self.compression is not None, "{} is not a compressed file".format(file_loc)
+        self.raw_file = open(file_loc, "rb")
+        self.block_index = None
+        # the decompressed offset of the beginning of current stream
+        self.stream_begin = 0
+        self.stream = _open_stream(self.compression, self.raw_file)
+
+    def _reopen(self, comp_offset, decomp_offset):
+        """
+        start a new stream at the beginning of a member
+
+        :param comp_offset: the offset of the member in the compressed file
+        :param decomp_offset: the offset of the member in the decompressed data
+        """
+
+        # closing the stream does not close raw_file, which is passed in as a file object
+        self.stream.close()
+        self.raw_file.seek(comp_offset)
+        self.stream = _open_stream(self.compression, self.raw_file)
+        self.stream_begin = decomp_offset
+
+    def get_block_index(self):
+        """
+        :return: the block index, it is loaded or built the first time it is used
+        """
+
+        if self.block_index is None:
+            self.block_index = get_block_index(self.file_loc, self.compression, save=self.save_index)
+        return self.block_index
+
+    def get_size(self):
+        """
+        :return: the size of decompressed data
+        """
+        return self.get_block_index().decomp_size
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+    def readline(self, size=-1):
+        return self.stream.readline(size)
+
+    def tell(self):
+        return self.stream_begin + self.stream.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """
+        move to a position in the decompressed data, short forward seeks decompress the data in between,
+        other seeks start from the member that contains the position using the block index
+
+        :param offset: the offset relative to whence
+        :param whence: io.SEEK_SET, io.SEEK_CUR or io.SEEK_END
+        :return: the new position
+        """
+
+        cur = self.tell()
+        if whence == io.SEEK_CUR:
+            offset += cur
+        elif whence == io.SEEK_END:
+            offset += self.get_size()
+        assert offset >= 0, "can not seek to negative position {}".format(offset)
+
+        if not cur <= offset < cur + _SEEK_FORWARD_LIMIT:
+            comp_offset, decomp_offset = self.get_block_index().find(offset)
+            if not decomp_offset <= cur <= offset:
+                self._reopen(comp_offset, decomp_offset)
+        self.stream.seek(offset - self.stream_begin)
+        return offset
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self.stream.close()
+        self.raw_file.close()
+
+    @property
+    def closed(self):
+        return self.raw_file.closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return "CompressedFile({}, {})".format(self.file_loc, self.compression)
+
+
+def write_blocks(ifile_loc, ofile_loc, compression=None, block_size=DEF_COMPRESSED_BLOCK_SIZE,
+                 save_index=SAVE_OFFSET_INDEX):
+    """
+    compress a trace (compressed or not) into independently compressed members, so that
+    it can be read from the middle with the block index
+
+    :param ifile_loc: location of the input trace
+    :param ofile_loc: location of the output trace
+    :param compression: gzip, bz2 or xz, default from the extension of ofile_loc
+    :param block_size: the size of decompressed data in one member
+    :param save_index: whether save the block index next to the output trace
+    :return: the BlockIndex of the output trace
+    """
+
+    if compression is None:
+        compression = _EXTENSIONS.get(os.path.splitext(ofile_loc)[1])
+    assert compression in ("gzip", "bz2", "xz"), "unknown compression {}".format(compression)
+
+    tmp_loc = "{}.tmp.{}".format(ofile_loc, os.getpid())
+    comp_offsets, decomp_offsets = [], []
+    decomp_pos = 0
+    with open_trace(ifile_loc) as ifile, open(tmp_loc, "wb") as ofile:
+        data = ifile.read(block_size)
+        while data:
+            comp_offsets.append(ofile.tell())
+            decomp_offsets.append(decomp_pos)
+            ofile.write(_compress(compression, data))
+            decomp_pos += len(data)
+            data = ifile.read(block_size)
+    os.replace(tmp_loc, ofile_loc)
+
+    stat = os.stat(ofile_loc)
+    index = BlockIndex(comp_offsets or [0], decomp_offsets or [0], decomp_pos, stat.st_size, stat.st_mtime_ns)
+    if save_index:
+        index.save(ofile_loc)
+    return index
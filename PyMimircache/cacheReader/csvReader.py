@@ -5,21 +5,114 @@
     Author: Jason Yang <peter.waynechina@gmail.com> 2016/06
 
 """
+import io
 import string
-from PyMimircache.const import ALLOW_C_MIMIRCACHE, INSTALL_PHASE
+import numpy as np
+from PyMimircache.const import ALLOW_C_MIMIRCACHE, INSTALL_PHASE, SAVE_OFFSET_INDEX
 from PyMimircache.utils.printing import *
 
 if ALLOW_C_MIMIRCACHE and not INSTALL_PHASE:
     import PyMimircache.CMimircache.CacheReader as c_cacheReader
 from PyMimircache.cacheReader.abstractReader import AbstractReader
+from PyMimircache.cacheReader.offsetIndex import get_lines
+from PyMimircache.cacheReader.compressedFile import open_trace
+
+
+# the estimated number of bytes of one line before any line is read
+_DEF_LINE_SIZE = 64
+
+
+class _PushbackFile:
+    """
+    a binary file object with bytes pushed back in front of the current position,
+    read_batch reads past the last line it returns, the lines after it are pushed back
+    instead of seeking backwards, which is slow on compressed traces
+
+    """
+
+    def __init__(self, fileobj, pushback):
+        """
+        :param fileobj: the file object of the trace, its position is after pushback
+        :param pushback: the bytes before the position of fileobj that are not read yet
+        """
+
+        self.fileobj = fileobj
+        self.pushback = pushback
+
+    def read(self, size=-1):
+        data, self.pushback = self.pushback, b""
+        if size is None or size < 0:
+            return data + self.fileobj.read()
+        if len(data) > size:
+            data, self.pushback = data[:size], data[size:]
+            return data
+        return data + self.fileobj.read(size - len(data))
+
+    def readline(self, size=-1):
+        if not self.pushback:
+            return self.fileobj.readline(size)
+        line, sep, self.pushback = self.pushback.partition(b"\n")
+        # pushed back bytes end with a complete line, except at the end of trace
+        return line + sep if sep else line + self.fileobj.readline()
+
+    def tell(self):
+        return self.fileobj.tell() - len(self.pushback)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.tell()
+            whence = io.SEEK_SET
+        self.pushback = b""
+        return self.fileobj.seek(offset, whence)
+
+    def __getattr__(self, name):
+        return getattr(self.fileobj, name)
+
+
+def _get_column(data, starts, ends, delimiter, column):
+    """
+    extract one column of all lines in a block of bytes without looping over lines in Python
+
+    :param data: a numpy uint8 array of bytes
+    :param starts: the begin of each line
+    :param ends: the end of each line
+    :param delimiter: the delimiter in bytes
+    :param column: the column to extract, beginning from 1
+    :return: a numpy bytes array of the column (not stripped)
+    """
+
+    if len(delimiter) != 1:
+        lines = data.tobytes()
+        return np.array([lines[b: e].split(delimiter)[column - 1] for b, e in zip(starts, ends)], dtype=bytes)
+
+    delimiter_pos = np.flatnonzero(data == delimiter[0])
+    # the delimiter before and after the column is the (column-1)-th and column-th delimiter of the line
+    first = np.searchsorted(delimiter_pos, starts)
+    padded_pos = np.append(delimiter_pos, len(data))
+    if column == 1:
+        field_starts = starts
+    else:
+        before = padded_pos[np.minimum(first + column - 2, len(delimiter_pos))]
+        if np.any(before >= ends):
+            raise RuntimeError("line {} has less than {} columns".format(
+                data[starts[np.argmax(before >= ends)]: ends[np.argmax(before >= ends)]].tobytes(), column))
+        field_starts = before + 1
+    field_ends = np.minimum(padded_pos[np.minimum(first + column - 1, len(delimiter_pos))], ends)
+
+    width = max(int(np.max(field_ends - field_starts)), 1) if len(starts) else 1
+    pos = field_starts[:, None] + np.arange(width)
+    chars = np.where(pos < field_ends[:, None], data[np.minimum(pos, len(data) - 1)], 0).astype(np.uint8)
+    # trailing zeros are dropped by numpy bytes type
+    return chars.view("S{}".format(width)).ravel()
 
 
 class CsvReader(AbstractReader):
     """
     CsvReader class
     """
-    all = ["read_one_req", "read_complete_req", "lines_dict",
-           "lines", "read_time_req", "reset", "copy", "get_params"]
+    all = ["read_one_req", "read_complete_req", "lines_dict", "read_batch", "iter_batches",
+           "lines", "read_time_req", "skip_n_req", "get_offset_index", "get_partitions", "get_sub_reader", "time_slice",
+           "reset", "copy", "get_params"]
 
     def __init__(self, file_loc,
                  data_type='c',
@@ -35,20 +128,29 @@ class CsvReader(AbstractReader):
         :param block_unit_size:     block size for storage system, 0 when disabled
         :param disk_sector_size:    size of disk sector
         :param open_c_reader:       bool for whether open reader in C backend
-        :param kwargs:              not used now
+        :param kwargs:              use_offset_index (default True), whether use the offset index
+                                        for seeking, counting requests and reading the last request,
+                                    save_offset_index (default SAVE_OFFSET_INDEX in const), whether save
+                                        the offset index next to the trace as <trace>.offsets.npz
+                                        (and the block index of a compressed trace as <trace>.blocks.npz),
+                                    byte_range ((begin, end), only read the lines in the range, see get_partitions,
+                                        the range does not include the header)
         """
 
         super(CsvReader, self).__init__(file_loc, data_type, block_unit_size, disk_sector_size,
                                         open_c_reader, kwargs.get("lock", None))
+        self.use_offset_index = kwargs.get("use_offset_index", True)
+        self.save_offset_index = kwargs.get("save_offset_index", SAVE_OFFSET_INDEX)
         assert init_params is not None, "please provide init_param for csvReader"
         assert "label" in init_params, "please provide label for csv reader"
 
-        self.trace_file = open(file_loc, 'rb')
+        self.support_partitions = True
+        self.trace_file = open_trace(file_loc, save_index=self.save_offset_index)
         # self.trace_file = open(file_loc, 'r', encoding='utf-8', errors='ignore')
         self.init_params = init_params
         self.label_column = init_params['label']
-        self.time_column = init_params.get("real_time", )
-        self.size_column = init_params.get("size", )
+        self.time_column = init_params.get("real_time", -1)
+        self.size_column = init_params.get("size", -1)
 
         if self.time_column != -1:
             self.support_real_time = True
@@ -59,6 +161,8 @@ class CsvReader(AbstractReader):
         if block_unit_size != 0:
             assert "size" in init_params, "please provide size_column option to consider request size"
 
+        # the average number of bytes of one line, used to decide how much to read in read_batch
+        self.avg_line_size = _DEF_LINE_SIZE
         self.header_bool = init_params.get('header', )
         self.delimiter = init_params.get('delimiter', ",")
         if "delimiter" not in init_params:
@@ -69,8 +173,9 @@ class CsvReader(AbstractReader):
             self.headers = [i.strip(string.whitespace) for i in
                             self.trace_file.readline().decode().split(self.delimiter)]
             # self.trace_file.readline()
+        self._open_byte_range(kwargs.get("byte_range"))
 
-        if ALLOW_C_MIMIRCACHE and open_c_reader:
+        if ALLOW_C_MIMIRCACHE and open_c_reader and not self.compression and self.byte_range is None:
             self.c_reader = c_cacheReader.setup_reader(file_loc, 'c', data_type=data_type,
                                                                  block_unit_size=block_unit_size,
                                                                  disk_sector_size=disk_sector_size,
@@ -181,6 +286,98 @@ class CsvReader(AbstractReader):
         else:
             return None
 
+    def read_size_req(self):
+        """
+        return size information for the request in the form of (request, size)
+        :return: a tuple of (request label, size)
+        """
+
+        assert self.size_column != -1, "you need to provide size in order to use this function"
+        super().read_one_req()
+        line = self.trace_file.readline().decode('utf-8', 'ignore')
+        while line and len(line.strip()) == 0:
+            line = self.trace_file.readline().decode()
+
+        if line:
+            line = line.split(self.delimiter)
+            lbn = line[self.label_column - 1].strip()
+            if self.data_type == 'l':
+                lbn = int(lbn)
+                if self.block_unit_size != 0 and self.disk_sector_size != 0:
+                    lbn = lbn * self.disk_sector_size // self.block_unit_size
+            return lbn, int(float(line[self.size_column - 1]))
+        else:
+            return None
+
+    def read_batch(self, n):
+        """
+        read at most n requests from current position as a numpy structured array, the trace is read in
+        large byte blocks and the columns of all lines are extracted and converted with numpy,
+        the fields are label (int64 if data_type is l, otherwise str), real_time (float64) and
+        size (int64) if the columns are given, blank lines are skipped like read_one_req
+
+        :param n: the max number of requests
+        :return: a numpy structured array, empty at the end of trace
+        """
+
+        buf = b""
+        if isinstance(self.trace_file, _PushbackFile):
+            buf = self.trace_file.pushback
+            self.trace_file = self.trace_file.fileobj
+        while buf.count(b"\n") < n:
+            more = self.trace_file.read((n - buf.count(b"\n")) * self.avg_line_size) + self.trace_file.readline()
+            if not more:
+                break
+            buf += more
+
+        data = np.frombuffer(buf, dtype=np.uint8)
+        starts, ends = get_lines(data)
+        if len(starts) > n:
+            # the lines not returned are read first next time
+            self.trace_file = _PushbackFile(self.trace_file, buf[int(starts[n]):])
+            starts, ends = starts[:n], ends[:n]
+        if len(starts):
+            self.avg_line_size = max(int(ends[-1]) // len(starts), 1)
+
+        delimiter = self.delimiter.encode()
+        label = _get_column(data, starts, ends, delimiter, self.label_column)
+        if self.data_type == 'l':
+            label = label.astype(np.int64)
+            if self.block_unit_size != 0 and self.disk_sector_size != 0:
+                label = label * self.disk_sector_size // self.block_unit_size
+        else:
+            label = np.char.strip(label)
+            try:
+                label = label.astype(str)
+            except UnicodeDecodeError:
+                label = np.char.decode(label, 'utf-8', 'ignore')
+
+        fields = [("label", label)]
+        if self.time_column != -1:
+            fields.append(("real_time", _get_column(data, starts, ends, delimiter, self.time_column)
+                           .astype(np.float64)))
+        if self.size_column != -1:
+            fields.append(("size", _get_column(data, starts, ends, delimiter, self.size_column)
+                           .astype(np.float64).astype(np.int64)))
+        batch = np.empty(len(starts), dtype=[(name, column.dtype) for name, column in fields])
+        for name, column in fields:
+            batch[name] = column
+        self.counter += len(batch)
+        return batch
+
+    def iter_batches(self, n):
+        """
+        a generator of batches of at most n requests from current position till the end of trace
+
+        :param n: the number of requests in one batch
+        :return: a generator of numpy structured arrays
+        """
+
+        batch = self.read_batch(n)
+        while len(batch):
+            yield batch
+            batch = self.read_batch(n)
+
     def skip_n_req(self, n):
         """
         skip N requests from current position
@@ -188,6 +385,8 @@ class CsvReader(AbstractReader):
         :param n: the number of requests to skip
         """
 
+        if self.use_offset_index and self._skip_n_req_with_offset_index(n):
+            return
         for i in range(n):
             self.read_one_req()
 
@@ -196,8 +395,10 @@ class CsvReader(AbstractReader):
         reset reader to initial state
         :return:
         """
+        if isinstance(self.trace_file, _PushbackFile):
+            self.trace_file = self.trace_file.fileobj
         super().reset()
-        if self.header_bool:
+        if self.header_bool and self.byte_range is None:
             self.trace_file.readline()
 
     def copy(self, open_c_reader=False):
@@ -210,7 +411,9 @@ class CsvReader(AbstractReader):
         """
 
         return CsvReader(self.file_loc, self.data_type, self.init_params,
-                         self.block_unit_size, self.disk_sector_size, open_c_reader, lock=self.lock)
+                         self.block_unit_size, self.disk_sector_size, open_c_reader, lock=self.lock,
+                         use_offset_index=self.use_offset_index,
+                         save_offset_index=self.save_offset_index, byte_range=self.byte_range)
 
 
     def get_params(self):
@@ -226,6 +429,9 @@ class CsvReader(AbstractReader):
             "block_unit_size": self.block_unit_size,
             "disk_sector_size": self.disk_sector_size,
             "open_c_reader": self.open_c_reader,
+            "use_offset_index": self.use_offset_index,
+            "save_offset_index": self.save_offset_index,
+            "byte_range": self.byte_range,
             "lock": self.lock
         }
 
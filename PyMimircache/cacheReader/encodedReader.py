@@ -0,0 +1,230 @@
+# coding=utf-8
+"""
+    encode the labels of a trace into dense integer ids (0 ~ number of objects - 1) in one pass,
+    the encoded trace is a binary trace written by TraceBinaryWriter and read by EncodedReader,
+    the id -> label dictionary is saved next to it in <encoded trace>.labels.npz
+
+    simulators and profilers hash int ids much faster than string labels, dense ids can be
+    used as array indexes and take much less memory than strings.
+    The real time and size columns are kept if the original reader supports them
+
+"""
+
+import os
+import json
+import numpy as np
+from PyMimircache.cacheReader.binaryReader import BinaryReader, fmt_to_dtype
+from PyMimircache.cacheReader.binaryWriter import TraceBinaryWriter
+from PyMimircache.utils.artifactCache import get_reader_params
+from PyMimircache.utils.printing import *
+
+
+ENCODED_TRACE_SUFFIX = ".encoded"
+LABEL_FILE_SUFFIX = ".labels.npz"
+# the number of requests encoded together
+_ENCODE_BLOCK_SIZE = 1 << 16
+_ID_FMTS = {"i", "I", "q", "Q"}
+
+
+def iter_blocks(reader, block_size):
+    """
+    read the trace block by block
+
+    :param reader: reader for data input
+    :param block_size: the max number of requests in one block
+    :return: a generator of (labels, real_time, size), real_time and size are None if not supported
+    """
+
+    if hasattr(reader, "iter_batches"):
+        for batch in reader.iter_batches(block_size):
+            names = batch.dtype.names
+            yield batch["label"], \
+                batch["real_time"] if reader.support_real_time and "real_time" in names else None, \
+                batch["size"] if reader.support_size and "size" in names else None
+    else:
+        block = [reader.read_one_req() for _ in range(block_size)]
+        while block[-1] is not None:
+            yield np.array(block), None, None
+            block = [reader.read_one_req() for _ in range(block_size)]
+        block = block[:block.index(None)]
+        if block:
+            yield np.array(block), None, None
+
+
+def encode_labels(labels, id_dict):
+    """
+    map labels to dense ids, new labels get the next ids in sorted order of labels
+
+    :param labels: a numpy array of labels
+    :param id_dict: the dictionary of label -> id, new labels are added
+    :return: a numpy int64 array of ids
+    """
+
+    uniq, inverse = np.unique(labels, return_inverse=True)
+    # setdefault evaluates len(id_dict) before inserting, so a new label gets the next id
+    uniq_ids = np.fromiter((id_dict.setdefault(label, len(id_dict)) for label in uniq.tolist()),
+                           dtype=np.int64, count=len(uniq))
+    return uniq_ids[inverse.ravel()]
+
+
+def _get_trace_desc(reader):
+    """
+    :param reader: reader for data input
+    :return: a description of the trace and reader, an encoded trace is out of date if it changes
+    """
+
+    stat = os.stat(reader.file_loc)
+    return json.dumps({"reader": reader.__class__.__name__, "reader_params": get_reader_params(reader),
+                       "size": stat.st_size, "mtime": stat.st_mtime_ns}, sort_keys=True, default=str)
+
+
+def encode_trace(reader, ofile_loc, id_fmt="q", block_size=_ENCODE_BLOCK_SIZE):
+    """
+    encode the trace into a binary trace of dense ids, ids are given to objects in the order they are
+    first seen (within a block, in sorted order of labels)
+
+    :param reader: reader for data input
+    :param ofile_loc: location of the encoded trace
+    :param id_fmt: the struct format of id, i/I for int32/uint32, q/Q for int64/uint64
+    :param block_size: the number of requests encoded together
+    :return: the number of objects
+    """
+
+    assert id_fmt in _ID_FMTS, "id_fmt must be one of {}, given {}".format(_ID_FMTS, id_fmt)
+    max_id = 2 ** (8 * np.dtype(id_fmt).itemsize - (1 if id_fmt.islower() else 0)) - 1
+
+    reader.reset()
+    with_time = reader.support_real_time and hasattr(reader, "iter_batches")
+    with_size = reader.support_size and hasattr(reader, "iter_batches")
+    fmt = "<" + id_fmt + ("d" if with_time else "") + ("q" if with_size else "")
+    init_params = {"label": 1, "fmt": fmt}
+    if with_time:
+        init_params["real_time"] = 2
+    if with_size:
+        init_params["size"] = 2 + with_time
+    dtype = fmt_to_dtype(fmt, init_params)
+
+    id_dict = {}
+    with TraceBinaryWriter(ofile_loc, fmt) as writer:
+        for labels, real_time, size in iter_blocks(reader, block_size):
+            ids = encode_labels(labels, id_dict)
+            if len(id_dict) - 1 > max_id:
+                raise RuntimeError("{} objects can not be encoded with id format {}".format(len(id_dict), id_fmt))
+
+            records = np.empty(len(labels), dtype=dtype)
+            records["label"] = ids
+            if with_time:
+                records["real_time"] = real_time
+            if with_size:
+                records["size"] = size
+            writer.write_batch(records)
+    reader.reset()
+
+    meta = {"fmt": fmt, "init_params": init_params, "id_fmt": id_fmt, "trace": _get_trace_desc(reader)}
+    tmp_loc = "{}.tmp.{}".format(ofile_loc + LABEL_FILE_SUFFIX, os.getpid())
+    with open(tmp_loc, "wb") as ofile:
+        np.savez(ofile, labels=np.array(list(id_dict)), meta=np.array(json.dumps(meta)))
+    os.replace(tmp_loc, ofile_loc + LABEL_FILE_SUFFIX)
+    INFO("encoded {} ({} objects) into {}".format(reader.file_loc, len(id_dict), ofile_loc))
+    return len(id_dict)
+
+
+def _load_label_file(file_loc):
+    """
+    :param file_loc: location of the encoded trace
+    :return: (labels, meta)
+    """
+
+    with np.load(file_loc + LABEL_FILE_SUFFIX, allow_pickle=False) as saved:
+        return saved["labels"], json.loads(str(saved["meta"]))
+
+
+class EncodedReader(BinaryReader):
+    """
+    reader of a trace encoded by encode_trace, labels are dense int ids,
+    get_label and decode map ids back to the original labels
+
+    """
+    all = ["from_reader", "get_label", "decode", "read_one_req", "read_batch", "iter_batches",
+           "get_num_of_req", "get_num_of_uniq_req", "reset", "copy", "get_params"]
+
+    def __init__(self, file_loc, open_c_reader=True, **kwargs):
+        """
+        :param file_loc:            location of the encoded trace
+        :param open_c_reader:       whether open c reader
+        :param kwargs:              lock, use_mmap, byte_range, see BinaryReader
+        """
+
+        assert os.path.exists(file_loc + LABEL_FILE_SUFFIX), \
+            "label file of encoded trace {} does not exist".format(file_loc)
+        self.labels, self.meta = _load_label_file(file_loc)
+        super(EncodedReader, self).__init__(file_loc, self.meta["init_params"], data_type='l',
+                                            open_c_reader=open_c_reader, **kwargs)
+        if self.byte_range is None:
+            self.num_of_uniq_req = len(self.labels)
+
+    @classmethod
+    def from_reader(cls, reader, file_loc=None, id_fmt="q", **kwargs):
+        """
+        the encoded form of the trace read by reader, the trace is encoded if it has not been encoded,
+        or it has changed since encoded
+
+        :param reader: reader of the original trace
+        :param file_loc: location of the encoded trace, default <trace>.encoded
+        :param id_fmt: the struct format of id, see encode_trace
+        :param kwargs: parameters of EncodedReader
+        :return: an EncodedReader
+        """
+
+        if file_loc is None:
+            file_loc = reader.file_loc + ENCODED_TRACE_SUFFIX
+        up_to_date = False
+        if os.path.exists(file_loc) and os.path.exists(file_loc + LABEL_FILE_SUFFIX):
+            meta = _load_label_file(file_loc)[1]
+            up_to_date = meta["id_fmt"] == id_fmt and meta["trace"] == _get_trace_desc(reader)
+        if not up_to_date:
+            encode_trace(reader, file_loc, id_fmt)
+        return cls(file_loc, **kwargs)
+
+    def get_label(self, obj_id):
+        """
+        :param obj_id: the id of an object
+        :return: the original label
+        """
+        return self.labels[obj_id].item()
+
+    def decode(self, ids):
+        """
+        :param ids: an array of ids
+        :return: a numpy array of original labels
+        """
+        return self.labels[np.asarray(ids)]
+
+    def copy(self, open_c_reader=False):
+        """
+        reader a deep copy of current reader with everything reset to initial state,
+        the returned reader should not interfere with current reader
+
+        :param open_c_reader: whether open_c_reader_or_not, default not open
+        :return: a copied reader
+        """
+
+        return EncodedReader(self.file_loc, open_c_reader=open_c_reader, lock=self.lock, use_mmap=self.use_mmap,
+                             byte_range=self.byte_range)
+
+    def get_params(self):
+        """
+        return all the parameters for this reader instance in a dictionary
+        :return: a dictionary containing all parameters
+        """
+
+        return {
+            "file_loc": self.file_loc,
+            "open_c_reader": self.open_c_reader,
+            "lock": self.lock,
+            "use_mmap": self.use_mmap,
+            "byte_range": self.byte_range
+        }
+
+    def __repr__(self):
+        return "EncodedReader of trace {} ({} objects)".format(self.file_loc, len(self.labels))
@@ -3,13 +3,34 @@
     this module provides function for reading from multiple traces,
     it supports either reading in the order of real_time or virtual_time (round robin)
 
-    this module has not been tested, use with caution
+    requests are read from each reader in batches (read_batch if the reader supports it) and
+    merged with numpy one window at a time. In real_time order, each trace should be sorted by time,
+    a window contains all buffered requests that no future request can come before, they are ordered
+    by a stable argsort of the concatenated (already sorted) time columns, ties are broken by reader id.
+    When a reader is exhausted, the other readers continue
 
     Author: Jason Yang <peter.waynechina@gmail.com> 2016/08
 
 """
 
-import heapq
+from itertools import islice
+import numpy as np
+
+
+# the number of requests read from one reader at a time
+DEF_MULTI_READER_BATCH_SIZE = 1 << 14
+
+
+def _concat_labels(arrays):
+    """
+    :param arrays: a list of numpy arrays of labels, labels from different readers may have different types
+    :return: a numpy array, of object type if the types do not match
+    """
+
+    arrays = [array for array in arrays if len(array)]
+    if len({array.dtype.kind for array in arrays}) > 1:
+        arrays = [array.astype(object) for array in arrays]
+    return np.concatenate(arrays)
 
 
 class MultiReader:
@@ -17,39 +38,182 @@ class MultiReader:
     MultiReader class
 
     """
-    def __init__(self, readers, reading_type="real_time", read_info="timeReq"):
+    all = ["read_one_req", "read_with_readerID", "read_batch", "read_batch_with_readerID", "iter_batches",
+           "reset", "close_all_readers"]
+
+    def __init__(self, readers, reading_type="real_time", read_info="timeReq",
+                 batch_size=DEF_MULTI_READER_BATCH_SIZE):
         """
         initialize a MultiReader instance
 
         :param readers: a list of readers
         :param reading_type: reading order, either real_time or virtual_time
+        :param read_info: not used, kept for compatibility
+        :param batch_size: the number of requests read from one reader at a time
         """
 
         self.readers = readers
         self.reading_type = reading_type
         self.read_info = read_info
+        self.batch_size = batch_size
         assert self.reading_type in ["real_time", "virtual_time"], \
             "allowed reading_type: real_time, virtual_time"
         assert len(self.readers) != 0, "reader list is empty"
+        assert batch_size > 0, "batch_size must be positive"
+        if self.reading_type == "real_time":
+            for reader in self.readers:
+                assert reader.support_real_time, "{} does not support real time".format(reader)
 
         self.num_of_read = 0
-        # self.reader_buffer = heapdict()
-        self.reader_buffer = []
+        self._init_buffers()
 
-        if self.reading_type == "real_time":
-            for j in range(len(self.readers)):
-                t, req = self.readers[j].read_time_req()
-                self.reader_buffer.append((t, j, req))
-                self.num_of_read += 1
+    def _init_buffers(self):
+        """
+        clear the merged requests and read the first batch of each reader
+        """
 
-        elif self.reading_type == "virtual_time":
-            for j in range(len(self.readers)):
-                req = self.readers[j].read_one_req()
-                self.reader_buffer.append((self.num_of_read, j, req))
-                self.num_of_read += 1
+        # buffered labels and times of each reader, times are None in virtual_time
+        self._labels = [None] * len(self.readers)
+        self._times = [None] * len(self.readers)
+        self._exhausted = [False] * len(self.readers)
+        # merged requests not returned yet, the lists are created when requests are read one by one
+        self._merged_labels = np.zeros(0)
+        self._merged_ids = np.zeros(0, dtype=np.int64)
+        self._merged_times = None
+        self._merged_list = None
+        self._merged_pos = 0
+        for reader_id in range(len(self.readers)):
+            self._fill(reader_id)
+
+    def _fill(self, reader_id):
+        """
+        read the next batch of one reader into its buffer
+
+        :param reader_id: the index of the reader
+        """
+
+        reader = self.readers[reader_id]
+        real_time = self.reading_type == "real_time"
+        if hasattr(reader, "read_batch"):
+            batch = reader.read_batch(self.batch_size)
+            labels = batch["label"]
+            times = batch["real_time"].astype(np.float64) if real_time else None
+        elif real_time:
+            reqs = list(islice(iter(reader.read_time_req, None), self.batch_size))
+            labels = np.array([req for _, req in reqs])
+            times = np.array([t for t, _ in reqs], dtype=np.float64)
+        else:
+            labels = np.array(list(islice(iter(reader.read_one_req, None), self.batch_size)))
+            times = None
+
+        self._labels[reader_id] = labels
+        self._times[reader_id] = times
+        self._exhausted[reader_id] = len(labels) == 0
 
-        heapq.heapify(self.reader_buffer)
+    def _merge(self):
+        """
+        merge the next window of buffered requests
+
+        :return: (labels, reader ids, times) as numpy arrays, empty if all readers are exhausted,
+                    times is None in virtual_time
+        """
 
+        real_time = self.reading_type == "real_time"
+        for reader_id in range(len(self.readers)):
+            if not self._exhausted[reader_id] and len(self._labels[reader_id]) == 0:
+                self._fill(reader_id)
+        active = [reader_id for reader_id in range(len(self.readers)) if not self._exhausted[reader_id]]
+        if not active:
+            return np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0) if real_time else None
+
+        times = None
+        if real_time:
+            # a future request of reader j comes after its last buffered request (t_j, j) in (time, reader) order,
+            # so buffered requests no later than the smallest (t_j, j) can be merged, including all of reader j
+            bound_time, bound_id = min((self._times[reader_id][-1], reader_id) for reader_id in active)
+            take = [len(self._times[reader_id]) if reader_id == bound_id else
+                    int(np.searchsorted(self._times[reader_id], bound_time,
+                                        side="right" if reader_id < bound_id else "left"))
+                    for reader_id in active]
+            # requests are concatenated in reader order, so the stable sort breaks ties by reader id
+            times = np.concatenate([self._times[reader_id][:n] for reader_id, n in zip(active, take)])
+            order = np.argsort(times, kind="stable")
+            times = times[order]
+        else:
+            # round robin, the i-th request of each reader in reader order
+            n = min(len(self._labels[reader_id]) for reader_id in active)
+            take = [n] * len(active)
+            order = np.arange(n * len(active)).reshape(len(active), n).T.ravel()
+
+        labels = _concat_labels([self._labels[reader_id][:n] for reader_id, n in zip(active, take)])[order]
+        reader_ids = np.repeat(active, take)[order]
+        for reader_id, n in zip(active, take):
+            self._labels[reader_id] = self._labels[reader_id][n:]
+            if self._times[reader_id] is not None:
+                self._times[reader_id] = self._times[reader_id][n:]
+        return labels, reader_ids, times
+
+    def _next_window(self):
+        """
+        merge the next window if all merged requests have been returned
+
+        :return: whether there are more requests
+        """
+
+        if self._merged_pos >= len(self._merged_labels):
+            self._merged_labels, self._merged_ids, self._merged_times = self._merge()
+            self._merged_list = None
+            self._merged_pos = 0
+        return len(self._merged_labels) > 0
+
+    def read_batch_with_readerID(self, n):
+        """
+        read at most n merged requests and also return their reader ids
+
+        :param n: the max number of requests
+        :return: (a numpy structured array as read_batch, a numpy int64 array of reader ids),
+                    empty at the end of all traces
+        """
+
+        self._next_window()
+        begin, end = self._merged_pos, min(self._merged_pos + n, len(self._merged_labels))
+        labels = self._merged_labels[begin: end]
+        fields = [("label", labels.dtype)]
+        if self._merged_times is not None:
+            fields.append(("real_time", np.float64))
+        batch = np.empty(len(labels), dtype=fields)
+        batch["label"] = labels
+        if self._merged_times is not None:
+            batch["real_time"] = self._merged_times[begin: end]
+        reader_ids = self._merged_ids[begin: end]
+        self._merged_pos = end
+        self.num_of_read += len(batch)
+        return batch, reader_ids
+
+    def read_batch(self, n):
+        """
+        read at most n merged requests from current position as a numpy structured array,
+        it has a label field and in real_time order also a real_time field,
+        use read_batch_with_readerID to get the reader of each request
+
+        :param n: the max number of requests
+        :return: a numpy structured array, empty at the end of all traces
+        """
+
+        return self.read_batch_with_readerID(n)[0]
+
+    def iter_batches(self, n):
+        """
+        a generator of batches of at most n merged requests from current position till the end of all traces
+
+        :param n: the max number of requests in one batch
+        :return: a generator of numpy structured arrays, see read_batch
+        """
+
+        batch = self.read_batch(n)
+        while len(batch):
+            yield batch
+            batch = self.read_batch(n)
 
     def read_one_req(self):
         """
@@ -70,34 +234,14 @@ class MultiReader:
         :return: (readerID, request)
         """
 
-        # item, pri = self.reader_buffer.popitem()
-        # pos, req = item
-
-        item = heapq.heappop(self.reader_buffer)
-        t_old, readerID, req_old = item
-
-        reader = self.readers[readerID]
-
-        if self.reading_type == "real_time":
-            item = reader.read_time_req()
-            if item is not None:
-                t, req = item
-                heapq.heappush(self.reader_buffer, (t, readerID, req))
-            else:
-                return None
-
-        elif self.reading_type == "virtual_time":
-            req = reader.read_one_req()
-            if req is not None:
-                # self.reader_buffer[(pos, req)] = self.num_of_read
-                heapq.heappush(self.reader_buffer, (self.num_of_read, readerID, req))
-            else:
-                return None
+        if not self._next_window():
+            return None
+        if self._merged_list is None:
+            self._merged_list = list(zip(self._merged_ids.tolist(), self._merged_labels.tolist()))
 
+        self._merged_pos += 1
         self.num_of_read += 1
-        return readerID, req_old
-
-
+        return self._merged_list[self._merged_pos - 1]
 
     def reset(self):
         """
@@ -107,6 +251,7 @@ class MultiReader:
         for reader in self.readers:
             reader.reset()
         self.num_of_read = 0
+        self._init_buffers()
 
     def close_all_readers(self):
         """
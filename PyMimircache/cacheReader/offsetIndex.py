@@ -0,0 +1,217 @@
+# coding=utf-8
+"""
+    a sparse index of the byte offsets of requests in text traces (plain and csv),
+    the offset of every interval-th request is recorded, so a reader can move to any request by
+    seeking to the nearest recorded request before it and reading at most interval-1 lines,
+    and the number of requests is known without reading the trace again
+
+    the index is built in one pass with numpy and kept in memory, it is only saved next to the trace
+    as <trace>.offsets.npz when asked (see SAVE_OFFSET_INDEX in const), a saved index is loaded
+    if it exists and rebuilt when the size or the modification time of the trace changes.
+    If the index can not be saved (for example, the directory is read-only), it is only kept in memory
+
+"""
+
+import os
+import string
+import numpy as np
+from PyMimircache.const import DEF_OFFSET_INDEX_INTERVAL, SAVE_OFFSET_INDEX
+from PyMimircache.cacheReader.compressedFile import open_trace
+from PyMimircache.utils.printing import *
+
+
+OFFSET_INDEX_SUFFIX = ".offsets.npz"
+# the number of bytes scanned together when building the index
+_SCAN_BLOCK_SIZE = 1 << 24
+
+# byte -> whether it is not whitespace
+_NOT_WHITESPACE = np.ones(256, dtype=bool)
+_NOT_WHITESPACE[np.frombuffer(string.whitespace.encode(), dtype=np.uint8)] = False
+
+
+def get_lines(data):
+    """
+    find all non-blank lines in a block of bytes
+
+    :param data: a numpy uint8 array of bytes
+    :return: (starts, ends), numpy arrays of the begin and end (excluded, without the newline) of lines
+    """
+
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    newlines = np.flatnonzero(data == ord("\n"))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(data)]))
+    # a line is not blank if it begins with a non-whitespace byte, only the others are checked one by one
+    maybe_blank = np.flatnonzero((starts == ends) | ~_NOT_WHITESPACE[data[np.minimum(starts, len(data) - 1)]])
+    blank = [i for i in maybe_blank if len(data[starts[i]: ends[i]].tobytes().strip()) == 0]
+    if blank:
+        starts, ends = np.delete(starts, blank), np.delete(ends, blank)
+    return starts, ends
+
+
+class OffsetIndex:
+    """
+    byte offsets of every interval-th request of a text trace
+
+    """
+    all = ["build", "load", "save", "is_valid", "get_offset", "get_req_id"]
+
+    def __init__(self, offsets, num_of_req, interval, begin, end, file_size, file_mtime):
+        """
+        :param offsets: a numpy int64 array, offsets[i] is the offset of request i*interval
+        :param num_of_req: the number of requests in the trace
+        :param interval: the number of requests between two recorded offsets
+        :param begin: the offset of the first byte that may contain requests, for example, after the header
+        :param end: the offset of the end of trace, it is the decompressed size for compressed traces
+        :param file_size: the size of the trace when the index is built
+        :param file_mtime: the modification time (ns) of the trace when the index is built
+        """
+
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.num_of_req = num_of_req
+        self.interval = interval
+        self.begin = begin
+        self.end = end
+        self.file_size = file_size
+        self.file_mtime = file_mtime
+
+    @classmethod
+    def build(cls, file_loc, begin=0, interval=DEF_OFFSET_INDEX_INTERVAL):
+        """
+        scan the trace and build the index, a request is a non-blank line
+
+        :param file_loc: location of the trace
+        :param begin: the offset where requests begin
+        :param interval: the number of requests between two recorded offsets
+        :return: an OffsetIndex
+        """
+
+        stat = os.stat(file_loc)
+        offsets = [np.zeros(0, dtype=np.int64)]
+        num_of_req = 0
+        with open_trace(file_loc) as ifile:
+            ifile.seek(begin)
+            pos = begin
+            # a block always ends at the end of a line
+            buf = ifile.read(_SCAN_BLOCK_SIZE) + ifile.readline()
+            while buf:
+                starts, _ = get_lines(np.frombuffer(buf, dtype=np.uint8))
+                # the first request in this block whose id is a multiple of interval
+                offsets.append(starts[-num_of_req % interval::interval] + pos)
+                num_of_req += len(starts)
+                pos += len(buf)
+                buf = ifile.read(_SCAN_BLOCK_SIZE) + ifile.readline()
+
+        DEBUG("built offset index of {} requests for {}".format(num_of_req, file_loc))
+        return cls(np.concatenate(offsets), num_of_req, interval, begin, pos, stat.st_size, stat.st_mtime_ns)
+
+    @classmethod
+    def load(cls, file_loc, begin=0, interval=DEF_OFFSET_INDEX_INTERVAL):
+        """
+        load the index saved next to the trace
+
+        :param file_loc: location of the trace
+        :param begin: the offset where requests begin
+        :param interval: the number of requests between two recorded offsets
+        :return: an OffsetIndex, None if there is no index or it does not match the trace
+        """
+
+        index_loc = file_loc + OFFSET_INDEX_SUFFIX
+        if not os.path.exists(index_loc):
+            return None
+        try:
+            with np.load(index_loc, allow_pickle=False) as saved:
+                if len(saved["stat"]) != 6:
+                    # saved by an older version without the end of trace
+                    return None
+                num_of_req, saved_interval, saved_begin, end, file_size, file_mtime = saved["stat"].tolist()
+                index = cls(saved["offsets"], num_of_req, saved_interval, saved_begin, end, file_size, file_mtime)
+        except (OSError, ValueError, KeyError) as e:
+            WARNING("failed to load offset index {}: {}".format(index_loc, e))
+            return None
+        if index.interval != interval or index.begin != begin or not index.is_valid(file_loc):
+            return None
+        return index
+
+    def save(self, file_loc):
+        """
+        save the index next to the trace, the file is written atomically
+
+        :param file_loc: location of the trace
+        :return: whether the index is saved
+        """
+
+        index_loc = file_loc + OFFSET_INDEX_SUFFIX
+        tmp_loc = "{}.tmp.{}".format(index_loc, os.getpid())
+        try:
+            with open(tmp_loc, "wb") as ofile:
+                np.savez(ofile, offsets=self.offsets, stat=np.array(
+                    [self.num_of_req, self.interval, self.begin, self.end, self.file_size, self.file_mtime], dtype=np.int64))
+            os.replace(tmp_loc, index_loc)
+        except OSError as e:
+            DEBUG("offset index of {} is not saved: {}".format(file_loc, e))
+            if os.path.exists(tmp_loc):
+                os.remove(tmp_loc)
+            return False
+        return True
+
+    def is_valid(self, file_loc):
+        """
+        :param file_loc: location of the trace
+        :return: whether the trace is unchanged since the index is built
+        """
+
+        stat = os.stat(file_loc)
+        return stat.st_size == self.file_size and stat.st_mtime_ns == self.file_mtime
+
+    def get_offset(self, n):
+        """
+        the position to move to request n
+
+        :param n: the request id, beginning from 0, num_of_req means the end of trace
+        :return: (offset, num_of_lines), the offset of the nearest recorded request no later than n,
+                    and the number of requests to read from there to reach request n
+        """
+
+        assert 0 <= n <= self.num_of_req, "request {} is not in [0, {}]".format(n, self.num_of_req)
+        if n == self.num_of_req:
+            return self.end, 0
+        return int(self.offsets[n // self.interval]), n % self.interval
+
+    def get_req_id(self, offset):
+        """
+        :param offset: a position in the trace
+        :return: the id of the request at offset if offset is recorded in the index, otherwise -1
+        """
+
+        if offset == self.begin:
+            return 0
+        if offset == self.end:
+            return self.num_of_req
+        i = int(np.searchsorted(self.offsets, offset))
+        if i < len(self.offsets) and self.offsets[i] == offset:
+            return i * self.interval
+        return -1
+
+    def __repr__(self):
+        return "OffsetIndex ({} requests, {} offsets)".format(self.num_of_req, len(self.offsets))
+
+
+def get_offset_index(file_loc, begin=0, interval=DEF_OFFSET_INDEX_INTERVAL, save=SAVE_OFFSET_INDEX):
+    """
+    load the saved index of a trace, build it if it does not exist or is out of date
+
+    :param file_loc: location of the trace
+    :param begin: the offset where requests begin
+    :param interval: the number of requests between two recorded offsets
+    :param save: whether save a newly built index next to the trace
+    :return: an OffsetIndex
+    """
+
+    index = OffsetIndex.load(file_loc, begin, interval)
+    if index is None:
+        index = OffsetIndex.build(file_loc, begin, interval)
+        if save:
+            index.save(file_loc)
+    return index
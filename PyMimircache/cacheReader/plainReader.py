@@ -7,7 +7,8 @@
 """
 
 from PyMimircache.cacheReader.abstractReader import AbstractReader
-from PyMimircache.const import ALLOW_C_MIMIRCACHE, INSTALL_PHASE
+from PyMimircache.cacheReader.compressedFile import open_trace
+from PyMimircache.const import ALLOW_C_MIMIRCACHE, INSTALL_PHASE, SAVE_OFFSET_INDEX
 
 if ALLOW_C_MIMIRCACHE and not INSTALL_PHASE:
     import PyMimircache.CMimircache.CacheReader as c_cacheReader
@@ -18,19 +19,29 @@ class PlainReader(AbstractReader):
     PlainReader class
 
     """
-    all = ["read_one_req", "copy", "get_params"]
+    all = ["read_one_req", "skip_n_req", "get_offset_index", "get_partitions", "get_sub_reader",
+           "copy", "get_params"]
 
     def __init__(self, file_loc, data_type='c', open_c_reader=True, **kwargs):
         """
         :param file_loc:            location of the file
         :param data_type:           type of data, can be "l" for int/long, "c" for string
         :param open_c_reader:       bool for whether open reader in C backend
-        :param kwargs:              not used now
+        :param kwargs:              use_offset_index (default True), whether use the offset index
+                                        for seeking, counting requests and reading the last request,
+                                    save_offset_index (default SAVE_OFFSET_INDEX in const), whether save
+                                        the offset index next to the trace as <trace>.offsets.npz
+                                        (and the block index of a compressed trace as <trace>.blocks.npz),
+                                    byte_range ((begin, end), only read the lines in the range, see get_partitions)
         """
 
         super(PlainReader, self).__init__(file_loc, data_type, open_c_reader=open_c_reader, lock=kwargs.get("lock"))
-        self.trace_file = open(file_loc, 'rb')
-        if ALLOW_C_MIMIRCACHE and open_c_reader:
+        self.use_offset_index = kwargs.get("use_offset_index", True)
+        self.save_offset_index = kwargs.get("save_offset_index", SAVE_OFFSET_INDEX)
+        self.support_partitions = True
+        self.trace_file = open_trace(file_loc, save_index=self.save_offset_index)
+        self._open_byte_range(kwargs.get("byte_range"))
+        if ALLOW_C_MIMIRCACHE and open_c_reader and not self.compression and self.byte_range is None:
             self.c_reader = c_cacheReader.setup_reader(file_loc, 'p', data_type=data_type, block_unit_size=0)
 
     def read_one_req(self):
@@ -63,6 +74,8 @@ class PlainReader(AbstractReader):
         :param n: the number of requests to skip
         """
 
+        if self.use_offset_index and self._skip_n_req_with_offset_index(n):
+            return
         for i in range(n):
             self.read_one_req()
 
@@ -76,7 +89,9 @@ class PlainReader(AbstractReader):
         :return: a copied reader
         """
 
-        return PlainReader(self.file_loc, data_type=self.data_type, open_c_reader=open_c_reader, lock=self.lock)
+        return PlainReader(self.file_loc, data_type=self.data_type, open_c_reader=open_c_reader, lock=self.lock,
+                           use_offset_index=self.use_offset_index,
+                           save_offset_index=self.save_offset_index, byte_range=self.byte_range)
 
     def get_params(self):
         """
@@ -87,7 +102,11 @@ class PlainReader(AbstractReader):
         return {
             "file_loc": self.file_loc,
             "data_type": self.data_type,
-            "open_c_reader": self.open_c_reader
+            "open_c_reader": self.open_c_reader,
+            "use_offset_index": self.use_offset_index,
+            "save_offset_index": self.save_offset_index,
+            "byte_range": self.byte_range,
+            "lock": self.lock
         }
 
     def __next__(self):  # Python 3
@@ -0,0 +1,324 @@
+# coding=utf-8
+"""
+    a reader wrapper that reads ahead on a background thread, so the consumer (such as a cache simulation)
+    does not wait for file reads
+
+    requests are read in batches into a fixed set of preallocated buffers (lists of batch_size),
+    the background thread fills free buffers and puts them into a bounded queue of depth buffers,
+    while the consumer works on the current one (double buffering when depth is 1).
+    The reader is only used by the background thread after the wrapper is created,
+    so methods of the wrapped reader should not be called until the wrapper is stopped or closed
+
+"""
+
+import queue
+import threading
+from time import perf_counter
+import numpy as np
+from PyMimircache.cacheReader.abstractReader import AbstractReader
+
+
+# the number of requests in one buffer
+DEF_PREFETCH_BATCH_SIZE = 1 << 13
+# the max number of filled buffers waiting to be consumed
+DEF_PREFETCH_DEPTH = 2
+_READ_FUNCS = ("read_one_req", "read_complete_req", "read_time_req", "read_size_req")
+
+
+class PrefetchReader(AbstractReader):
+    """
+    a reader that reads requests of another reader ahead on a background thread
+
+    """
+    all = ["read_one_req", "read_complete_req", "read_time_req", "read_size_req",
+           "get_read_ahead", "get_stats", "stop", "reset", "copy", "get_params", "close"]
+
+    def __init__(self, reader=None, read_func="read_one_req", batch_size=DEF_PREFETCH_BATCH_SIZE,
+                 depth=DEF_PREFETCH_DEPTH, reader_class=None, reader_params=None, open_c_reader=False):
+        """
+        :param reader: the reader to wrap, it is read from its current position
+        :param read_func: the method of reader used to read requests, one of read_one_req, read_complete_req,
+                            read_time_req and read_size_req, only this method can be called on the wrapper
+        :param batch_size: the number of requests in one buffer
+        :param depth: the max number of filled buffers waiting to be consumed
+        :param reader_class: if reader is not given, the reader is created with reader_class(**reader_params),
+                            this is used to create the wrapper in another process from get_params
+        :param reader_params: see reader_class
+        :param open_c_reader: not used, the wrapper always reads in Python
+        """
+
+        if reader is None:
+            assert reader_class is not None, "please provide reader or reader_class"
+            reader = reader_class(**reader_params)
+        assert read_func in _READ_FUNCS, "read_func must be one of {}".format(_READ_FUNCS)
+        assert batch_size > 0 and depth > 0, "batch_size and depth must be positive"
+
+        super(PrefetchReader, self).__init__(reader.file_loc, reader.data_type, reader.block_unit_size,
+                                             reader.disk_sector_size, open_c_reader=False, lock=reader._lock)
+        self.reader = reader
+        self.read_func = read_func
+        self.batch_size = batch_size
+        self.depth = depth
+        self.support_real_time = reader.support_real_time
+        self.support_size = reader.support_size
+        self.num_of_req = reader.num_of_req
+
+        # counters, a stall is a read that waits for the background thread
+        self.num_of_batches = 0
+        self.num_of_stalls = 0
+        self.stall_time = 0.0
+        self._thread = None
+        self._start()
+
+    def _start(self):
+        """
+        create the buffers and start the background thread
+        """
+
+        # one more buffer than depth is held by the consumer
+        self._free = queue.Queue()
+        for _ in range(self.depth + 1):
+            self._free.put([None] * self.batch_size)
+        self._filled = queue.Queue(maxsize=self.depth)
+        self._stopping = False
+        self._buffer, self._buffer_len, self._pos = None, 0, 0
+        self._end = False
+        self._thread = threading.Thread(target=self._prefetch, name="PrefetchReader", daemon=True)
+        self._thread.start()
+
+    def _fill(self, buffer):
+        """
+        read the next batch of requests into a buffer
+
+        :param buffer: a list of batch_size
+        :return: the number of requests read, smaller than batch_size at the end of trace
+        """
+
+        reader = self.reader
+        if hasattr(reader, "read_batch") and self.read_func in ("read_one_req", "read_time_req"):
+            batch = reader.read_batch(self.batch_size)
+            labels = batch["label"].tolist()
+            if self.read_func == "read_time_req":
+                labels = list(zip(batch["real_time"].astype(np.float64).tolist(), labels))
+            buffer[:len(labels)] = labels
+            return len(labels)
+
+        read = getattr(reader, self.read_func)
+        for i in range(self.batch_size):
+            req = read()
+            if req is None:
+                return i
+            buffer[i] = req
+        return self.batch_size
+
+    def _prefetch(self):
+        """
+        the background thread, it fills buffers until the end of trace or it is stopped,
+        an exception is passed to the consumer
+        """
+
+        try:
+            while True:
+                buffer = self._free.get()
+                if self._stopping or buffer is None:
+                    return
+                n = self._fill(buffer)
+                self._filled.put((buffer, n))
+                if n < self.batch_size:
+                    return
+        except Exception as e:
+            self._filled.put((None, e))
+
+    def _next_buffer(self):
+        """
+        give the current buffer back and take the next filled one
+
+        :return: whether there are more requests
+        """
+
+        if self._buffer is not None:
+            self._free.put(self._buffer)
+            self._buffer = None
+        if self._end:
+            return False
+
+        if self._filled.empty():
+            self.num_of_stalls += 1
+            begin = perf_counter()
+            buffer, n = self._filled.get()
+            self.stall_time += perf_counter() - begin
+        else:
+            buffer, n = self._filled.get()
+        if buffer is None:
+            self._end = True
+            raise RuntimeError("failed to read {}: {}".format(self.reader, n))
+
+        self.num_of_batches += 1
+        self._buffer, self._buffer_len, self._pos = buffer, n, 0
+        self._end = n < self.batch_size
+        return n > 0
+
+    def _read(self, read_func):
+        """
+        :param read_func: the name of the read method called on the wrapper
+        :return: the next request, None at the end of trace
+        """
+
+        assert read_func == self.read_func, "this PrefetchReader reads with {}".format(self.read_func)
+        if self._pos >= self._buffer_len and not self._next_buffer():
+            return None
+        self._pos += 1
+        return self._buffer[self._pos - 1]
+
+    def read_one_req(self):
+        """
+        read one request
+        :return: the label of request
+        """
+        return self._read("read_one_req")
+
+    def read_complete_req(self):
+        """
+        read one request with full information
+        :return: a list of all info in the request
+        """
+        return self._read("read_complete_req")
+
+    def read_time_req(self):
+        """
+        :return: a tuple of (time, request label)
+        """
+        return self._read("read_time_req")
+
+    def read_size_req(self):
+        """
+        :return: a tuple of (request label, size)
+        """
+        return self._read("read_size_req")
+
+    def get_read_ahead(self):
+        """
+        :return: the number of filled buffers waiting to be consumed
+        """
+        return self._filled.qsize()
+
+    def get_stats(self):
+        """
+        :return: a dictionary of read_ahead (filled buffers now), depth, num_of_batches,
+                    num_of_stalls and stall_time (seconds the consumer waited)
+        """
+
+        return {"read_ahead": self.get_read_ahead(), "depth": self.depth, "num_of_batches": self.num_of_batches,
+                "num_of_stalls": self.num_of_stalls, "stall_time": self.stall_time}
+
+    def get_num_of_req(self):
+        """
+        count the number of requests with a copy of the wrapped reader, which is not used by the background thread
+        :return: the number of requests in the trace
+        """
+
+        if self.num_of_req <= 0:
+            reader = self.reader.copy()
+            self.num_of_req = reader.get_num_of_req()
+            reader.close()
+        return self.num_of_req
+
+    def read_last_req(self, label_only=False, max_req_size=102400):
+        """
+        read the last request with a copy of the wrapped reader, which is not used by the background thread
+
+        :return: the request label or a list of information
+        """
+
+        reader = self.reader.copy()
+        last = reader.read_last_req(label_only=label_only, max_req_size=max_req_size)
+        reader.close()
+        return last
+
+    def stop(self):
+        """
+        stop the background thread, after this the wrapped reader can be used directly,
+        its position is after the requests read ahead
+        """
+
+        if self._thread is None:
+            return
+        self._stopping = True
+        # wake the thread up if it waits for a free buffer or for space in the queue
+        self._free.put(None)
+        while self._thread.is_alive():
+            try:
+                self._filled.get(timeout=0.01)
+            except queue.Empty:
+                pass
+        self._thread = None
+
+    def reset(self):
+        """
+        reset the wrapped reader back to beginning and restart reading ahead
+        """
+
+        self.stop()
+        self.counter = 0
+        self.reader.reset()
+        self._start()
+
+    def skip_n_req(self, n):
+        """
+        skip N requests from current position
+
+        :param n: the number of requests to skip
+        """
+
+        for i in range(n):
+            if self._read(self.read_func) is None:
+                break
+
+    def copy(self, open_c_reader=False):
+        """
+        reader a deep copy of current reader with everything reset to initial state,
+        the returned reader should not interfere with current reader
+
+        :param open_c_reader: whether open_c_reader_or_not, default not open
+        :return: a copied reader
+        """
+
+        return PrefetchReader(self.reader.copy(open_c_reader), read_func=self.read_func,
+                              batch_size=self.batch_size, depth=self.depth)
+
+    def get_params(self):
+        """
+        return all the parameters for this reader instance in a dictionary,
+        the wrapped reader is described by its class and parameters
+        :return: a dictionary containing all parameters
+        """
+
+        return {
+            "reader_class": self.reader.__class__,
+            "reader_params": self.reader.get_params(),
+            "read_func": self.read_func,
+            "batch_size": self.batch_size,
+            "depth": self.depth
+        }
+
+    def close(self):
+        """
+        stop the background thread and close the wrapped reader
+        """
+
+        if getattr(self, "_thread", None) is not None:
+            self.stop()
+        if getattr(self, "reader", None) is not None:
+            self.reader.close()
+            self.reader = None
+
+    def __next__(self):
+        super().__next__()
+        v = self._read(self.read_func)
+        if v is not None:
+            return v
+        else:
+            raise StopIteration
+
+    def __repr__(self):
+        return "PrefetchReader of {}".format(self.reader)
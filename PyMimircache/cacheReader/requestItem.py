@@ -1,17 +1,27 @@
 # coding=utf-8
 
 """
-this module contains the Req class, which describes a request
+this module contains the Req class, which describes a request,
+and the RequestBatch class, which describes a batch of requests in columns
 
 """
 
+import numpy as np
 
 
 class Req:
-    def __init__(self, item_id, size=1, op=None, cost=-1, **kwargs):
+    """
+    a request, attributes are kept in slots, so a Req does not have a __dict__
+
+    """
+    __slots__ = ("_item_id", "_size", "_op", "_cost", "_real_time", "_path")
+
+    def __init__(self, item_id, size=1, op=None, cost=-1, real_time=None, path=None, **kwargs):
         self._item_id = item_id
         self._size = size
         self._op = op
+        self._cost = cost
+        self._real_time = real_time
         self._path = path
 
     @property
@@ -26,10 +36,80 @@ class Req:
     def op(self):
         return self._op
 
+    @property
+    def cost(self):
+        return self._cost
+
+    @property
+    def real_time(self):
+        return self._real_time
+
     @property
     def path(self):
         return self._path
 
+    def __repr__(self):
+        return "Req(item_id={}, size={}, op={}, real_time={})".format(self._item_id, self._size,
+                                                                      self._op, self._real_time)
+
+
+class RequestBatch:
+    """
+    a batch of requests stored as numpy columns of item_id, size, op and real_time,
+    the columns a trace does not have are None, a single request is only created as a Req when indexed
+
+    """
+    __slots__ = ("item_id", "size", "op", "real_time")
+    all = ["from_records", "__getitem__", "__len__", "__iter__"]
+
+    def __init__(self, item_id, size=None, op=None, real_time=None):
+        """
+        :param item_id: an array of the ids (labels) of requests
+        :param size: an array of request sizes, None if not available
+        :param op: an array of operations, None if not available
+        :param real_time: an array of timestamps, None if not available
+        """
+
+        self.item_id = np.asarray(item_id)
+        self.size = None if size is None else np.asarray(size)
+        self.op = None if op is None else np.asarray(op)
+        self.real_time = None if real_time is None else np.asarray(real_time)
+        for column in (self.size, self.op, self.real_time):
+            assert column is None or len(column) == len(self.item_id), "columns have different lengths"
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        :param records: a numpy structured array from read_batch, the fields label, size, op and real_time are used
+        :return: a RequestBatch sharing memory with records
+        """
+
+        names = records.dtype.names
+        return cls(records["label"],
+                   size=records["size"] if "size" in names else None,
+                   op=records["op"] if "op" in names else None,
+                   real_time=records["real_time"] if "real_time" in names else None)
+
+    def __len__(self):
+        return len(self.item_id)
+
+    def __getitem__(self, index):
+        """
+        :param index: an int index or a slice
+        :return: a Req for int index, a RequestBatch of views for slice
+        """
 
+        if isinstance(index, slice):
+            return RequestBatch(*(None if column is None else column[index]
+                                  for column in (self.item_id, self.size, self.op, self.real_time)))
+        return Req(self.item_id[index].item(),
+                   size=1 if self.size is None else self.size[index].item(),
+                   op=None if self.op is None else self.op[index].item(),
+                   real_time=None if self.real_time is None else self.real_time[index].item())
 
+    def __iter__(self):
+        for i in range(len(self.item_id)):
+            yield self[i]
 
+    def __repr__(self):
+        return "RequestBatch of {} requests".format(len(self.item_id))
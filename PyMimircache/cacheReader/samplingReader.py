@@ -0,0 +1,262 @@
+# coding=utf-8
+"""
+    a reader wrapper that spatially samples the requests of another reader,
+    only requests whose label hash is smaller than a threshold are returned,
+    so either all requests of an object are in the sample or none of them is,
+    and any profiler can run on a small sample of a trace without its own sampling support
+
+    fixed-rate mode uses a constant sampling ratio R (threshold R * HASH_MODULUS),
+    fixed-size mode bounds the number of sampled objects by sample_size, when it is exceeded,
+    objects with the largest hash value are dropped and the threshold is lowered to that hash value (as in SHARDS),
+    requests of a dropped object that were returned before can not be taken back, so the sample ratio
+    at the end of trace should be used for scaling
+
+    a cache of size S on the full trace corresponds to a cache of size S * R on the sample,
+    see scale_cache_size and unscale_cache_size
+
+"""
+
+import heapq
+from PyMimircache.utils.hashing import HASH_MODULUS, spatial_hash, ratio_to_threshold
+from PyMimircache.cacheReader.abstractReader import AbstractReader
+
+
+class SamplingReader(AbstractReader):
+    """
+    a reader that only returns the requests of objects in a spatially hashed sample
+
+    """
+    all = ["read_one_req", "read_complete_req", "read_time_req", "read_size_req",
+           "get_sample_stats", "scale_cache_size", "unscale_cache_size", "reset", "copy", "get_params", "close"]
+
+    def __init__(self, reader=None, sample_ratio=0.01, sample_size=-1,
+                 reader_class=None, reader_params=None, open_c_reader=False):
+        """
+        :param reader: the reader to sample, it is reset
+        :param sample_ratio: the sampling ratio, in fixed-size mode, it is the initial sampling ratio
+        :param sample_size: the max number of sampled objects, -1 means fixed-rate mode
+        :param reader_class: if reader is not given, the reader is created with reader_class(**reader_params),
+                            this is used to create the wrapper in another process from get_params
+        :param reader_params: see reader_class
+        :param open_c_reader: not used, the sampled trace can only be read in Python
+        """
+
+        if reader is None:
+            assert reader_class is not None, "please provide reader or reader_class"
+            reader = reader_class(**reader_params)
+        assert sample_size == -1 or sample_size > 0, "sample size must be positive, given {}".format(sample_size)
+
+        super(SamplingReader, self).__init__(reader.file_loc, reader.data_type, reader.block_unit_size,
+                                             reader.disk_sector_size, open_c_reader=False, lock=reader._lock)
+        self.reader = reader
+        self.init_sample_ratio = sample_ratio
+        self.sample_size = sample_size
+        self.support_real_time = reader.support_real_time
+        self.support_size = reader.support_size
+        self.time_column = getattr(reader, "time_column", -1)
+        # the position of label in read_complete_req, -1 if the complete request is the label
+        self.label_column = getattr(reader, "label_column", -1)
+        self.reset()
+
+    @property
+    def sample_ratio(self):
+        """
+        :return: the current sampling ratio
+        """
+        return self.threshold / HASH_MODULUS
+
+    def _is_sampled(self, label):
+        """
+        :param label: the label of request
+        :return: whether the request is in the sample
+        """
+
+        h = spatial_hash(label)
+        if h >= self.threshold:
+            return False
+        if self.sample_size != -1 and label not in self.sampled_obj:
+            self.sampled_obj.add(label)
+            heapq.heappush(self.obj_heap, (-h, label))
+            if len(self.sampled_obj) > self.sample_size:
+                self._adjust_threshold()
+                return h < self.threshold
+        return True
+
+    def _adjust_threshold(self):
+        """
+        drop the objects with the largest hash value until at most sample_size objects are sampled,
+        and lower the threshold to the largest dropped hash value
+        """
+
+        obj_heap = self.obj_heap
+        while len(obj_heap) > self.sample_size:
+            h = -obj_heap[0][0]
+            while obj_heap and -obj_heap[0][0] == h:
+                self.sampled_obj.discard(heapq.heappop(obj_heap)[1])
+            self.threshold = h
+
+    def _read(self, read_func, get_label):
+        """
+        :param read_func: the read method of the wrapped reader
+        :param get_label: a function that takes the label from what read_func returns
+        :return: the next sampled request, None at the end of trace
+        """
+
+        req = read_func()
+        while req is not None:
+            self.num_of_total_req += 1
+            if self._is_sampled(get_label(req)):
+                self.num_of_sampled_req += 1
+                return req
+            req = read_func()
+        return None
+
+    def _get_complete_label(self, req):
+        if self.label_column == -1:
+            return req
+        label = req[self.label_column - 1]
+        return label.strip() if isinstance(label, str) else label
+
+    def read_one_req(self):
+        """
+        read one sampled request
+        :return: the label of request
+        """
+        return self._read(self.reader.read_one_req, lambda req: req)
+
+    def read_complete_req(self):
+        """
+        read one sampled request with full information
+        :return: a list of all info in the request
+        """
+        return self._read(self.reader.read_complete_req, self._get_complete_label)
+
+    def read_time_req(self):
+        """
+        :return: a tuple of (time, request label) of one sampled request
+        """
+        return self._read(self.reader.read_time_req, lambda req: req[1])
+
+    def read_size_req(self):
+        """
+        :return: a tuple of (request label, size) of one sampled request
+        """
+        return self._read(self.reader.read_size_req, lambda req: req[0])
+
+    def read_last_req(self, label_only=False, max_req_size=102400):
+        """
+        read the last sampled request, the whole trace is scanned
+
+        :return: the request label or a list of information
+        """
+
+        self.reset()
+        read_func = self.read_one_req if label_only else self.read_complete_req
+        last = new = read_func()
+        while new is not None:
+            last = new
+            new = read_func()
+        self.reset()
+        return last
+
+    def skip_n_req(self, n):
+        """
+        skip N sampled requests from current position
+
+        :param n: the number of requests to skip
+        """
+
+        for i in range(n):
+            if self.read_one_req() is None:
+                break
+
+    def get_sample_stats(self):
+        """
+        :return: a dictionary of num_of_total_req (requests read from the wrapped reader since reset),
+                    num_of_sampled_req, sample_ratio (current threshold ratio) and num_of_sampled_obj (fixed-size mode)
+        """
+
+        return {"num_of_total_req": self.num_of_total_req, "num_of_sampled_req": self.num_of_sampled_req,
+                "sample_ratio": self.sample_ratio, "num_of_sampled_obj": len(self.sampled_obj)}
+
+    def scale_cache_size(self, cache_size):
+        """
+        the cache size on the sample that corresponds to a cache size on the full trace
+
+        :param cache_size: cache size on the full trace
+        :return: cache size on the sample, at least 1
+        """
+
+        return max(int(round(cache_size * self.sample_ratio)), 1)
+
+    def unscale_cache_size(self, cache_size):
+        """
+        the cache size on the full trace that corresponds to a cache size on the sample
+
+        :param cache_size: cache size on the sample
+        :return: cache size on the full trace
+        """
+
+        return int(round(cache_size / self.sample_ratio))
+
+    def reset(self):
+        """
+        reset the wrapped reader back to beginning, the counters and the threshold are also reset,
+        so every pass returns the same sample
+        """
+
+        self.counter = 0
+        self.reader.reset()
+        self.threshold = ratio_to_threshold(self.init_sample_ratio)
+        self.num_of_total_req = 0
+        self.num_of_sampled_req = 0
+        # sampled objects and the max heap of (-hash, label) of them, only used in fixed-size mode
+        self.sampled_obj = set()
+        self.obj_heap = []
+
+    def copy(self, open_c_reader=False):
+        """
+        reader a deep copy of current reader with everything reset to initial state,
+        the returned reader should not interfere with current reader
+
+        :param open_c_reader: not used
+        :return: a copied reader
+        """
+
+        return SamplingReader(self.reader.copy(), sample_ratio=self.init_sample_ratio, sample_size=self.sample_size)
+
+    def get_params(self):
+        """
+        return all the parameters for this reader instance in a dictionary,
+        the wrapped reader is described by its class and parameters
+        :return: a dictionary containing all parameters
+        """
+
+        reader_params = self.reader.get_params()
+        reader_params["open_c_reader"] = False
+        return {
+            "reader_class": self.reader.__class__,
+            "reader_params": reader_params,
+            "sample_ratio": self.init_sample_ratio,
+            "sample_size": self.sample_size
+        }
+
+    def close(self):
+        """
+        close the wrapped reader
+        """
+
+        if getattr(self, "reader", None) is not None:
+            self.reader.close()
+            self.reader = None
+
+    def __next__(self):
+        super().__next__()
+        v = self.read_one_req()
+        if v is not None:
+            return v
+        else:
+            raise StopIteration
+
+    def __repr__(self):
+        return "SamplingReader (ratio {:.6f}) of {}".format(self.sample_ratio, self.reader)
@@ -0,0 +1,334 @@
+# coding=utf-8
+"""
+    a self-describing binary trace container, it holds the schema and the statistics of the trace,
+    so ContainerReader opens it without init_params and without scanning the trace
+
+    layout of the container (little endian):
+
+        +--------+---------------------------------------------------------------------------+
+        | 24 B   | magic (8s), version (H), reserved (H), length of metadata (I),             |
+        |        | offset of body (Q)                                                        |
+        +--------+---------------------------------------------------------------------------+
+        | ...    | metadata in JSON: fmt, init_params, data_type, num_of_req, num_of_uniq_req, |
+        |        | first_time, last_time, column_stats, label_table                          |
+        +--------+---------------------------------------------------------------------------+
+        | ...    | optional label table (.npy), id -> label of traces with string labels      |
+        +--------+---------------------------------------------------------------------------+
+        | body   | plain binary records of fmt, aligned to 4096 bytes, till the end of file   |
+        +--------+---------------------------------------------------------------------------+
+
+    the body is exactly a binary trace that BinaryReader reads with init_params in the metadata,
+    the C reader, which can not skip the header, reads a copy of the body (see ContainerReader.export_body).
+    String labels are encoded into dense ids (see encodedReader), the label table maps them back
+
+"""
+
+import io
+import os
+import json
+import shutil
+import struct
+import numpy as np
+from PyMimircache.const import ALLOW_C_MIMIRCACHE, INSTALL_PHASE
+from PyMimircache.cacheReader.binaryReader import BinaryReader, fmt_to_dtype
+from PyMimircache.cacheReader.encodedReader import iter_blocks, encode_labels
+from PyMimircache.utils.printing import *
+
+if ALLOW_C_MIMIRCACHE and not INSTALL_PHASE:
+    import PyMimircache.CMimircache.CacheReader as c_cacheReader
+
+
+CONTAINER_MAGIC = b"PYMTRACE"
+CONTAINER_VERSION = 1
+_HEADER_STRUCT = struct.Struct("<8sHHIQ")
+_BODY_ALIGNMENT = 4096
+# the number of requests converted together
+_CONVERT_BLOCK_SIZE = 1 << 16
+_COLUMN_NAMES = ("label", "real_time", "size", "op")
+
+
+def _get_column_stats(batch, column_stats):
+    """
+    update the min, max and sum of numeric columns
+
+    :param batch: a numpy structured array
+    :param column_stats: a dictionary of column name -> {"min", "max", "sum"}, updated in place
+    """
+
+    for name in batch.dtype.names:
+        column = batch[name]
+        if column.dtype.kind not in "iuf" or len(column) == 0:
+            continue
+        stats = column_stats.setdefault(name, {"min": column[0].item(), "max": column[0].item(), "sum": 0})
+        stats["min"] = min(stats["min"], column.min().item())
+        stats["max"] = max(stats["max"], column.max().item())
+        stats["sum"] += column.sum(dtype=np.float64 if column.dtype.kind == "f" else np.int64).item()
+
+
+def _to_record_dtype(block, dtype):
+    """
+    a label converted by block_unit_size is widened to int64 in read_batch,
+    it is stored back in the label format of the trace, so the body matches fmt
+
+    :param block: a numpy structured array from read_batch
+    :param dtype: the dtype of records in the trace
+    :return: a numpy structured array of dtype
+    """
+
+    records = np.empty(len(block), dtype=dtype)
+    for name in dtype.names:
+        records[name] = block[name]
+    if np.any(records["label"] != block["label"]):
+        raise RuntimeError("converted label does not fit in the label format {}".format(dtype["label"]))
+    return records
+
+
+def convert_to_container(reader, ofile_loc, block_size=_CONVERT_BLOCK_SIZE):
+    """
+    convert the trace read by any reader into a trace container in one pass,
+    records of binary traces are kept as they are (label converted by block_unit_size),
+    other traces keep label, real_time and size, string labels are encoded into dense ids
+
+    :param reader: reader for data input
+    :param ofile_loc: location of the container
+    :param block_size: the number of requests converted together
+    :return: the metadata of the container
+    """
+
+    reader.reset()
+    body_loc = "{}.body.tmp.{}".format(ofile_loc, os.getpid())
+    id_dict = None
+    uniq_labels = set()
+    num_of_req = 0
+    first_time, last_time = None, None
+    column_stats = {}
+
+    if isinstance(reader, BinaryReader):
+        fmt, data_type = reader.fmt, reader.data_type
+        init_params = {name: reader.init_params[name] for name in _COLUMN_NAMES
+                       if reader.init_params.get(name, -1) != -1}
+        blocks = reader.iter_batches(block_size)
+    else:
+        with_time = reader.support_real_time and hasattr(reader, "iter_batches")
+        with_size = reader.support_size and hasattr(reader, "iter_batches")
+        fmt, data_type = "<q" + ("d" if with_time else "") + ("q" if with_size else ""), 'l'
+        init_params = {"label": 1}
+        if with_time:
+            init_params["real_time"] = 2
+        if with_size:
+            init_params["size"] = 2 + with_time
+        if reader.data_type != 'l':
+            id_dict = {}
+        blocks = iter_blocks(reader, block_size)
+    init_params["fmt"] = fmt
+    dtype = fmt_to_dtype(fmt, init_params)
+
+    try:
+        with open(body_loc, "wb") as ofile:
+            for block in blocks:
+                if isinstance(reader, BinaryReader) and block.dtype != reader.dtype:
+                    block = _to_record_dtype(block, reader.dtype)
+                elif not isinstance(reader, BinaryReader):
+                    labels, real_time, size = block
+                    block = np.empty(len(labels), dtype=dtype)
+                    block["label"] = labels if id_dict is None else encode_labels(labels, id_dict)
+                    if real_time is not None:
+                        block["real_time"] = real_time
+                    if size is not None:
+                        block["size"] = size
+                if id_dict is None:
+                    uniq_labels.update(np.unique(block["label"]).tolist())
+                if "real_time" in init_params and len(block):
+                    if first_time is None:
+                        first_time = block["real_time"][0].item()
+                    last_time = block["real_time"][-1].item()
+                _get_column_stats(block, column_stats)
+                num_of_req += len(block)
+                ofile.write(block.tobytes())
+        reader.reset()
+
+        label_table = b""
+        if id_dict is not None:
+            with io.BytesIO() as buf:
+                np.save(buf, np.array(list(id_dict)), allow_pickle=False)
+                label_table = buf.getvalue()
+        meta = {"version": CONTAINER_VERSION, "fmt": fmt, "init_params": init_params, "data_type": data_type,
+                "num_of_req": num_of_req, "num_of_uniq_req": len(uniq_labels) if id_dict is None else len(id_dict),
+                "first_time": first_time, "last_time": last_time, "column_stats": column_stats,
+                "label_table": None}
+        meta_size = len(json.dumps(meta)) + 64
+        if label_table:
+            # the offset of label table does not change the length of metadata by more than 64 bytes
+            meta["label_table"] = [_HEADER_STRUCT.size + meta_size, len(label_table)]
+        meta_bytes = json.dumps(meta).encode().ljust(meta_size)
+        data_offset = _HEADER_STRUCT.size + meta_size + len(label_table)
+        data_offset = (data_offset + _BODY_ALIGNMENT - 1) // _BODY_ALIGNMENT * _BODY_ALIGNMENT
+
+        tmp_loc = "{}.tmp.{}".format(ofile_loc, os.getpid())
+        with open(tmp_loc, "wb") as ofile:
+            ofile.write(_HEADER_STRUCT.pack(CONTAINER_MAGIC, CONTAINER_VERSION, 0, meta_size, data_offset))
+            ofile.write(meta_bytes)
+            ofile.write(label_table)
+            ofile.write(b"\0" * (data_offset - ofile.tell()))
+            with open(body_loc, "rb") as ifile:
+                shutil.copyfileobj(ifile, ofile)
+        os.replace(tmp_loc, ofile_loc)
+    finally:
+        if os.path.exists(body_loc):
+            os.remove(body_loc)
+
+    INFO("converted {} ({} requests) into container {}".format(reader.file_loc, num_of_req, ofile_loc))
+    meta["data_offset"] = data_offset
+    return meta
+
+
+def read_container_header(file_loc):
+    """
+    read the metadata of a trace container
+
+    :param file_loc: location of the container
+    :return: the metadata, with data_offset (the offset of body)
+    """
+
+    with open(file_loc, "rb") as ifile:
+        header = ifile.read(_HEADER_STRUCT.size)
+        if len(header) != _HEADER_STRUCT.size or header[:len(CONTAINER_MAGIC)] != CONTAINER_MAGIC:
+            raise RuntimeError("{} is not a trace container".format(file_loc))
+        _, version, _, meta_size, data_offset = _HEADER_STRUCT.unpack(header)
+        if version > CONTAINER_VERSION:
+            raise RuntimeError("trace container {} has version {}, only version <= {} is supported".format(
+                file_loc, version, CONTAINER_VERSION))
+        meta = json.loads(ifile.read(meta_size).decode())
+    meta["data_offset"] = data_offset
+    return meta
+
+
+class ContainerReader(BinaryReader):
+    """
+    reader of a trace container, the schema, the number of requests and objects and
+    the time range are read from the header
+
+    """
+    all = ["read_one_req", "read_batch", "iter_batches", "get_num_of_req", "get_num_of_uniq_req",
+           "get_time_range", "get_column_stats", "get_label", "decode", "export_body",
+           "reset", "copy", "get_params"]
+
+    def __init__(self, file_loc, open_c_reader=False, **kwargs):
+        """
+        :param file_loc:            location of the container
+        :param open_c_reader:       whether open c reader, default not open, the c reader reads a copy of the body,
+                                        so this writes <container>.body next to the container (see export_body)
+        :param kwargs:              lock, use_mmap, byte_range, see BinaryReader
+        """
+
+        self.meta = read_container_header(file_loc)
+        super(ContainerReader, self).__init__(file_loc, self.meta["init_params"], data_type=self.meta["data_type"],
+                                              open_c_reader=False, data_offset=self.meta["data_offset"], **kwargs)
+        self.open_c_reader = open_c_reader
+        # the header describes the whole trace, the objects of a byte range are counted when needed
+        if self.byte_range is None:
+            assert self.num_of_req == self.meta["num_of_req"], \
+                "container has {} requests, but header says {}".format(self.num_of_req, self.meta["num_of_req"])
+            self.num_of_uniq_req = self.meta["num_of_uniq_req"]
+        self.labels = None
+
+        if ALLOW_C_MIMIRCACHE and open_c_reader:
+            self.c_reader = c_cacheReader.setup_reader(self.export_body(), 'b', data_type=self.data_type,
+                                                       block_unit_size=0, disk_sector_size=0,
+                                                       init_params=self.init_params)
+
+    def export_body(self, ofile_loc=None):
+        """
+        write the body as a plain binary trace, which can be read by BinaryReader (and C reader)
+        with init_params in the metadata, an existing copy is reused if it is newer than the container
+
+        :param ofile_loc: location of the plain binary trace, default <container>.body
+        :return: the location of the plain binary trace
+        """
+
+        if ofile_loc is None:
+            ofile_loc = self.file_loc + ".body"
+        body_size = self.trace_file_size - self.data_offset
+        if os.path.exists(ofile_loc) and os.path.getsize(ofile_loc) == body_size and \
+                os.path.getmtime(ofile_loc) >= os.path.getmtime(self.file_loc):
+            return ofile_loc
+
+        tmp_loc = "{}.tmp.{}".format(ofile_loc, os.getpid())
+        with open(self.file_loc, "rb") as ifile, open(tmp_loc, "wb") as ofile:
+            ifile.seek(self.data_offset)
+            shutil.copyfileobj(ifile, ofile)
+        os.replace(tmp_loc, ofile_loc)
+        return ofile_loc
+
+    def get_time_range(self):
+        """
+        :return: (the first timestamp, the last timestamp) of the whole trace, None if the trace has no real time
+        """
+        return self.meta["first_time"], self.meta["last_time"]
+
+    def get_column_stats(self, name=None):
+        """
+        :param name: the name of a column, such as label, real_time, size, f1 ...
+        :return: a dictionary of min, max and sum of the column,
+                    or a dictionary of column name -> stats of all numeric columns if name is None
+        """
+        if name is None:
+            return self.meta["column_stats"]
+        return self.meta["column_stats"][name]
+
+    def _load_labels(self):
+        """
+        :return: the label table, None if labels are not encoded
+        """
+
+        if self.labels is None and self.meta["label_table"] is not None:
+            offset, length = self.meta["label_table"]
+            with open(self.file_loc, "rb") as ifile:
+                ifile.seek(offset)
+                self.labels = np.load(io.BytesIO(ifile.read(length)), allow_pickle=False)
+        return self.labels
+
+    def get_label(self, obj_id):
+        """
+        :param obj_id: the label read from the container
+        :return: the original label, which is obj_id itself if labels are not encoded
+        """
+        labels = self._load_labels()
+        return obj_id if labels is None else labels[obj_id].item()
+
+    def decode(self, ids):
+        """
+        :param ids: an array of labels read from the container
+        :return: a numpy array of original labels
+        """
+        labels = self._load_labels()
+        return np.asarray(ids) if labels is None else labels[np.asarray(ids)]
+
+    def copy(self, open_c_reader=False):
+        """
+        reader a deep copy of current reader with everything reset to initial state,
+        the returned reader should not interfere with current reader
+
+        :param open_c_reader: whether open_c_reader_or_not, default not open
+        :return: a copied reader
+        """
+
+        return ContainerReader(self.file_loc, open_c_reader=open_c_reader, lock=self.lock, use_mmap=self.use_mmap,
+                               byte_range=self.byte_range)
+
+    def get_params(self):
+        """
+        return all the parameters for this reader instance in a dictionary
+        :return: a dictionary containing all parameters
+        """
+
+        return {
+            "file_loc": self.file_loc,
+            "open_c_reader": self.open_c_reader,
+            "lock": self.lock,
+            "use_mmap": self.use_mmap,
+            "byte_range": self.byte_range
+        }
+
+    def __repr__(self):
+        return "ContainerReader of trace {} ({} requests)".format(self.file_loc, self.num_of_req)
@@ -0,0 +1,170 @@
+# coding=utf-8
+"""
+    split a trace into record-aligned byte ranges, so that N workers can each scan one range
+    instead of all reading the whole trace
+
+    a partition is a tuple of (begin, end, first_req, num_of_req), where [begin, end) is the byte range,
+    first_req is the global id of the first request in the range and num_of_req is the number of
+    requests in it. Ranges of binary traces are aligned to records, ranges of text traces begin at the
+    beginning of a line, the global request ids of text ranges are found with the offset index,
+    so only the lines between a range boundary and the recorded offset (or boundary) before it are counted
+
+    a reader opened with byte_range=(begin, end) reads only the requests in the range,
+    see AbstractReader.get_partitions and AbstractReader.get_sub_reader
+
+"""
+
+import io
+import numpy as np
+from PyMimircache.cacheReader.offsetIndex import get_lines
+
+
+class RangeFile:
+    """
+    a view of the byte range [begin, end) of a binary file object, positions are the same as
+    in the underlying file, seek is clamped into the range and reads stop at the end of the range
+
+    """
+    all = ["read", "readline", "seek", "tell", "close"]
+
+    def __init__(self, fileobj, begin, end):
+        """
+        :param fileobj: a binary file object that supports seek, such as open(file_loc, "rb")
+        :param begin: the first byte of the range
+        :param end: the end (excluded) of the range
+        """
+
+        assert 0 <= begin <= end, "invalid byte range [{}, {})".format(begin, end)
+        self.fileobj = fileobj
+        self.begin = begin
+        self.end = end
+        self.fileobj.seek(begin)
+
+    def _remaining(self, size):
+        remaining = max(self.end - self.fileobj.tell(), 0)
+        return remaining if size is None or size < 0 else min(size, remaining)
+
+    def read(self, size=-1):
+        size = self._remaining(size)
+        return self.fileobj.read(size) if size else b""
+
+    def readline(self, size=-1):
+        size = self._remaining(size)
+        return self.fileobj.readline(size) if size else b""
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """
+        :param offset: the offset relative to whence, SEEK_END is relative to the end of the range
+        :param whence: io.SEEK_SET, io.SEEK_CUR or io.SEEK_END
+        :return: the new position
+        """
+
+        if whence == io.SEEK_CUR:
+            offset += self.fileobj.tell()
+        elif whence == io.SEEK_END:
+            offset += self.end
+        return self.fileobj.seek(min(max(offset, self.begin), self.end))
+
+    def fileno(self):
+        return self.fileobj.fileno()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self.fileobj.close()
+
+    @property
+    def closed(self):
+        return self.fileobj.closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return "RangeFile [{}, {}) of {}".format(self.begin, self.end, self.fileobj)
+
+
+def get_record_partitions(data_begin, num_of_req, record_size, num_of_partitions):
+    """
+    split fixed-size records into partitions of about the same number of records
+
+    :param data_begin: the offset of the first record
+    :param num_of_req: the number of records
+    :param record_size: the size of one record
+    :param num_of_partitions: the max number of partitions
+    :return: a list of (begin, end, first_req, num_of_req), empty requests are not included
+    """
+
+    assert num_of_partitions > 0, "the number of partitions must be positive"
+    chunk_size = -(-num_of_req // num_of_partitions)
+    partitions = []
+    for first_req in range(0, num_of_req, max(chunk_size, 1)):
+        n = min(chunk_size, num_of_req - first_req)
+        begin = data_begin + first_req * record_size
+        partitions.append((begin, begin + n * record_size, first_req, n))
+    return partitions
+
+
+def get_text_partitions(trace_file, offset_index, num_of_partitions):
+    """
+    split a text trace into newline-aligned partitions of about the same number of bytes
+
+    :param trace_file: the opened trace, its position is changed
+    :param offset_index: the OffsetIndex of the trace
+    :param num_of_partitions: the max number of partitions
+    :return: a list of (begin, end, first_req, num_of_req), ranges without requests are not included
+    """
+
+    assert num_of_partitions > 0, "the number of partitions must be positive"
+    data_begin = offset_index.begin
+    data_end = trace_file.seek(0, io.SEEK_END)
+
+    bounds = [(data_begin, 0)]
+    for i in range(1, num_of_partitions):
+        target = data_begin + (data_end - data_begin) * i // num_of_partitions
+        if target <= bounds[-1][0]:
+            continue
+        # the first line beginning at or after target
+        trace_file.seek(target - 1)
+        trace_file.readline()
+        pos = trace_file.tell()
+        if pos >= data_end:
+            break
+        if pos > bounds[-1][0]:
+            bounds.append((pos, _get_req_id(trace_file, offset_index, pos, bounds[-1])))
+    bounds.append((data_end, offset_index.num_of_req))
+
+    partitions = []
+    for (begin, first_req), (end, next_req) in zip(bounds[:-1], bounds[1:]):
+        if next_req > first_req:
+            partitions.append((begin, end, first_req, next_req - first_req))
+    return partitions
+
+
+def _get_req_id(trace_file, offset_index, pos, prev):
+    """
+    :param trace_file: the opened trace
+    :param offset_index: the OffsetIndex of the trace
+    :param pos: the beginning of a line
+    :param prev: (offset, request id) of the beginning of a line before pos
+    :return: the global id of the first request at or after pos
+    """
+
+    # count lines from the nearest known position, the recorded offset or the previous boundary
+    i = int(np.searchsorted(offset_index.offsets, pos, side="right")) - 1
+    known, req_id = (int(offset_index.offsets[i]), i * offset_index.interval) if i >= 0 else prev
+    if prev[0] > known:
+        known, req_id = prev
+    trace_file.seek(known)
+    starts, _ = get_lines(np.frombuffer(trace_file.read(pos - known), dtype=np.uint8))
+    return req_id + len(starts)
@@ -6,11 +6,22 @@
 
 """
 
-from PyMimircache.cacheReader.binaryReader import BinaryReader
-from PyMimircache.const import ALLOW_C_MIMIRCACHE, INSTALL_PHASE
+import numpy as np
+from PyMimircache.cacheReader.binaryReader import BinaryReader, fmt_to_dtype
 
-if ALLOW_C_MIMIRCACHE and not INSTALL_PHASE:
-    import PyMimircache.CMimircache.CacheReader as c_cacheReader
+
+# the size of a sector, the label (lbn) of vscsi traces is in the unit of sectors
+VSCSI_SECTOR_SIZE = 512
+# type 1 record: serial number, size (len), nSG, op (cmd), version, label (lbn), real_time (ts)
+# type 2 record: op (cmd), version, serial number, size (len), nSG, label (lbn), real_time (ts), response time
+VSCSI_INIT_PARAMS = {
+    1: {"size": 2, "op": 4, "label": 6, "real_time": 7, "fmt": "<3I2H2Q"},
+    2: {"op": 1, "size": 4, "label": 6, "real_time": 7, "fmt": "<2H3I3Q"},
+}
+# numpy dtypes of vscsi records, the fields of size, op, label and real_time are named,
+# other fields are named by column (f1, f2 ...), see fmt_to_dtype
+VSCSI1_DTYPE = fmt_to_dtype(VSCSI_INIT_PARAMS[1]["fmt"], VSCSI_INIT_PARAMS[1])
+VSCSI2_DTYPE = fmt_to_dtype(VSCSI_INIT_PARAMS[2]["fmt"], VSCSI_INIT_PARAMS[2])
 
 
 class VscsiReader(BinaryReader):
@@ -19,7 +30,7 @@ class VscsiReader(BinaryReader):
      
     """
     all = ["read_one_req", "read_time_req", "read_complete_req",
-           "get_average_size", "get_timestamp_list",
+           "get_timestamps", "get_sizes", "get_ops", "get_lbas", "get_average_size", "get_timestamp_list",
            "reset", "copy", "get_params"]
 
     def __init__(self, file_loc, vscsi_type=1,
@@ -29,15 +40,16 @@ class VscsiReader(BinaryReader):
         :param vscsi_type:          vscsi trace type, can be 1 or 2
         :param block_unit_size:     block size for storage system, 0 when disabled
         :param open_c_reader:       bool for whether open reader in C backend
+        :param kwargs:              use_mmap, byte_range, see BinaryReader
         """
 
         if vscsi_type == 1:
             self.vscsi_type = 1
-            init_params = {"size": 2, "op": 4, "label": 6, "real_time": 7, "fmt": "<3I2H2Q"}
+            init_params = dict(VSCSI_INIT_PARAMS[1])
             assert "vscsi2" not in file_loc, "are you sure the trace ({}) is vscsi type 1? ".format(file_loc)
         elif vscsi_type == 2:
             self.vscsi_type = 2
-            init_params = {"op": 1, "size": 4, "label": 6, "real_time": 7, "fmt": "<2H3I3Q"}
+            init_params = dict(VSCSI_INIT_PARAMS[2])
             assert "vscsi1" not in file_loc, "are you sure the trace ({}) is vscsi type 2? ".format(file_loc)
         else:
             raise RuntimeError("unknown vscsi type")
@@ -45,9 +57,43 @@ class VscsiReader(BinaryReader):
         super(VscsiReader, self).__init__(file_loc, data_type='l',
                                           init_params=init_params,
                                           block_unit_size=block_unit_size,
-                                          disk_sector_size=512,
+                                          disk_sector_size=VSCSI_SECTOR_SIZE,
                                           open_c_reader=open_c_reader,
-                                          lock=kwargs.get("lock", None))
+                                          lock=kwargs.get("lock", None),
+                                          use_mmap=kwargs.get("use_mmap", False),
+                                          byte_range=kwargs.get("byte_range", None))
+
+    def get_timestamps(self):
+        """
+        :return: a numpy uint64 array of the timestamps of all requests, it is a view of the mapped trace
+        """
+        return self.get_column("real_time")
+
+    def get_sizes(self):
+        """
+        :return: a numpy uint32 array of the sizes (bytes) of all requests, it is a view of the mapped trace
+        """
+        return self.get_column("size")
+
+    def get_ops(self):
+        """
+        :return: a numpy uint16 array of the operations (SCSI command) of all requests,
+                    it is a view of the mapped trace
+        """
+        return self.get_column("op")
+
+    def get_lbas(self, in_bytes=False):
+        """
+        the logical block addresses of all requests, without block_unit_size conversion
+
+        :param in_bytes: if True, the address is converted from sectors into bytes
+        :return: a numpy uint64 array, a view of the mapped trace unless in_bytes
+        """
+
+        lbas = self.get_records()["label"]
+        if in_bytes:
+            lbas = lbas * np.uint64(VSCSI_SECTOR_SIZE)
+        return lbas
 
     def get_average_size(self):
         """
@@ -55,16 +101,7 @@ class VscsiReader(BinaryReader):
         :return: a float of average size of all requests
         """
 
-        sizes = 0
-        counter = 0
-
-        t = self.read_complete_req()
-        while t:
-            sizes += t[2]
-            counter += 1
-            t = self.read_complete_req()
-        self.reset()
-        return sizes / counter
+        return float(np.mean(self.get_sizes()))
 
     def get_timestamp_list(self):
         """
@@ -72,12 +109,7 @@ class VscsiReader(BinaryReader):
         :return: a list of timestamps corresponding to requests
         """
 
-        ts_list = []
-        r = c_cacheReader.read_time_req(self.c_reader)
-        while r:
-            ts_list.append(r[0])
-            r = c_cacheReader.read_time_req(self.c_reader)
-        return ts_list
+        return self.get_timestamps().tolist()
 
     def copy(self, open_c_reader=False):
         """
@@ -88,7 +120,8 @@ class VscsiReader(BinaryReader):
         :return: a copied reader
         """
 
-        return VscsiReader(self.file_loc, self.vscsi_type, self.block_unit_size, open_c_reader, lock=self.lock)
+        return VscsiReader(self.file_loc, self.vscsi_type, self.block_unit_size, open_c_reader,
+                           lock=self.lock, use_mmap=self.use_mmap, byte_range=self.byte_range)
 
     def get_params(self):
         """
@@ -101,7 +134,9 @@ class VscsiReader(BinaryReader):
             "vscsi_type": self.vscsi_type,
             "block_unit_size": self.block_unit_size,
             "open_c_reader": self.open_c_reader,
-            "lock": self.lock
+            "lock": self.lock,
+            "use_mmap": self.use_mmap,
+            "byte_range": self.byte_range
         }
 
     def __repr__(self):
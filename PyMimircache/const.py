@@ -18,6 +18,17 @@ INTERNAL_USE = True
 DEF_NUM_BIN_PROF = 100
 DEF_NUM_THREADS = os.cpu_count()
 DEF_EMA_HISTORY_WEIGHT = 0.80
+# persistent cache of reuse distance and other per-trace arrays, see utils/artifactCache,
+# it is disabled by default, set PYMIMIRCACHE_USE_CACHE=1 or pass use_artifact_cache=True to LRU profilers
+USE_ARTIFACT_CACHE = os.environ.get("PYMIMIRCACHE_USE_CACHE", "0") == "1"
+DEF_ARTIFACT_CACHE_DIR = os.environ.get("PYMIMIRCACHE_CACHE_DIR",
+                                        os.path.join(os.path.expanduser("~"), ".cache", "PyMimircache"))
+DEF_ARTIFACT_CACHE_DISK_BUDGET = 16 * 1024 ** 3
+# the offset of every DEF_OFFSET_INDEX_INTERVAL-th request of text traces is indexed, see cacheReader/offsetIndex
+DEF_OFFSET_INDEX_INTERVAL = 1 << 16
+# the offset index is only kept in memory by default, set PYMIMIRCACHE_SAVE_OFFSET_INDEX=1
+# or pass save_offset_index=True to text readers to save it next to the trace
+SAVE_OFFSET_INDEX = os.environ.get("PYMIMIRCACHE_SAVE_OFFSET_INDEX", "0") == "1"
 
 # try to import cMimircache
 if not INSTALL_PHASE and ALLOW_C_MIMIRCACHE:
@@ -123,5 +134,7 @@ def cache_name_to_class(cache_name):
 
 
 __all__ = ["ALLOW_C_MIMIRCACHE", "INTERNAL_USE", "DEF_NUM_BIN_PROF", "DEF_NUM_THREADS", "DEF_EMA_HISTORY_WEIGHT",
+           "USE_ARTIFACT_CACHE", "DEF_ARTIFACT_CACHE_DIR", "DEF_ARTIFACT_CACHE_DISK_BUDGET",
+           "DEF_OFFSET_INDEX_INTERVAL", "SAVE_OFFSET_INDEX",
            "C_AVAIL_CACHE", "C_AVAIL_CACHEREADER", "CACHE_NAME_CONVRETER", "CACHE_NAME_TO_CLASS_DICT",
            "cache_name_to_class", "INSTALL_PHASE"]
@@ -9,8 +9,7 @@ Author: Jason Yang <peter.waynechina@gmail.com> 2016/07
 
 """
 import os
-import socket
-from PyMimircache.const import INTERNAL_USE
+from PyMimircache.const import USE_ARTIFACT_CACHE
 from PyMimircache.const import ALLOW_C_MIMIRCACHE
 from PyMimircache.const import INSTALL_PHASE
 if ALLOW_C_MIMIRCACHE and not INSTALL_PHASE:
@@ -18,6 +17,8 @@ if ALLOW_C_MIMIRCACHE and not INSTALL_PHASE:
 
 from PyMimircache.cacheReader.binaryReader import BinaryReader
 from PyMimircache.cacheReader.abstractReader import AbstractReader
+from PyMimircache.profiler.utils.shards import get_hit_ratio_shards
+from PyMimircache.utils.artifactCache import ArtifactCache
 from PyMimircache.utils.printing import *
 
 class CLRUProfiler:
@@ -40,7 +41,8 @@ class CLRUProfiler:
         :param reader: reader for feeding data into profiler
         :param cache_size: size of cache, if -1, then use max possible size
         :param cache_params: parameters about cache, such as block_unit_size
-        :param kwargs: no_load_rd
+        :param kwargs: no_load_rd, use_artifact_cache (load or save reuse distance in the persistent artifact cache
+                        the first time it is needed, default USE_ARTIFACT_CACHE in const)
         """
 
         # make sure reader is valid
@@ -66,14 +68,11 @@ class CLRUProfiler:
         self.get_hit_rate = self.get_hit_ratio
 
 
-        # INTERNAL USE to cache intermediate reuse distance
+        # reuse distance is loaded from or saved into the persistent artifact cache
+        # the first time it is needed if the cache is enabled, see _load_rd
         self.already_load_rd = False
-        if INTERNAL_USE and not kwargs.get("no_load_rd", False) and \
-                socket.gethostname().lower() in ["master", "node2", "node3"] and \
-                ".." not in reader.file_loc and os.path.dirname(reader.file_loc):
-            if not reader.already_load_rd:
-                self.use_precomputedRD()
-                self.already_load_rd = True
+        self.use_artifact_cache = kwargs.get("use_artifact_cache", USE_ARTIFACT_CACHE) and \
+                                  not kwargs.get("no_load_rd", False) and self.block_unit_size == 0
 
 
     def save_reuse_dist(self, file_loc, rd_type):
@@ -108,51 +107,60 @@ class CLRUProfiler:
 
     def _del_reuse_dist_file(self):
         """
-        an internal function that deletes the pre-computed reuse distance
+        an internal function that deletes the pre-computed reuse distance in the artifact cache
         """
 
-        assert INTERNAL_USE == True, "this function is only used internally"
-        rd_dat_path = self.reader.file_loc.replace("/home/jason/ALL_DATA/",
-                                                   "/research/jason/preComputedData/RD/")
-        rd_dat_path = rd_dat_path.replace("/home/cloudphysics/traces/",
-                                          "/research/jason/preComputedData/RD/cphyVscsi")
-
-        if not os.path.exists(rd_dat_path):
+        artifact_cache = ArtifactCache()
+        key = artifact_cache.get_key(self.reader, "c_rd")
+        if key is None or not os.path.exists(artifact_cache.get_path(key, ".rd")):
             WARNING("pre-computed reuse distance file does not exist")
         else:
-            os.remove(rd_dat_path)
+            os.remove(artifact_cache.get_path(key, ".rd"))
 
 
     def use_precomputedRD(self):
         """
-        this is an internal used function, it tries to load precomputed reuse distance to avoid the expensive
-        O(NlogN) reuse distance computation, if the data does not exists, then compute it and save it
+        load reuse distance from the persistent artifact cache to avoid the expensive
+        O(NlogN) reuse distance computation, if it is not cached, then compute it and save it,
+        the reuse distance is kept in the format of CMimircache
         :return:
         """
 
-        has_rd = True
-        if not self.already_load_rd and not self.reader.already_load_rd:
-            if "/home/cloudphysics/traces/" not in self.reader.file_loc and \
-                    "/home/jason/ALL_DATA" not in self.reader.file_loc:
-                has_rd = False
-
-            rd_dat_path = self.reader.file_loc.replace("/home/jason/ALL_DATA/",
-                                                       "/research/jason/preComputedData/RD/")
-            rd_dat_path = rd_dat_path.replace("/home/cloudphysics/traces/",
-                                              "/research/jason/preComputedData/RD/cphyVscsi")
-            if rd_dat_path == self.reader.file_loc:
-                rd_dat_path += ".rd"
-
-            if has_rd and os.path.exists(rd_dat_path):
-                DEBUG("loading reuse distance from {}".format(rd_dat_path))
-                self.load_reuse_dist(rd_dat_path, "rd")
-            else:
-                if not os.path.exists(os.path.dirname(rd_dat_path)):
-                    os.makedirs(os.path.dirname(rd_dat_path))
-                self.save_reuse_dist(rd_dat_path, "rd")
-                INFO("reuse distance calculated and saved at {}".format(rd_dat_path))
+        self._sync_rd_with_artifact_cache()
         return self.get_reuse_distance()
 
+    def _load_rd(self):
+        """
+        load or save reuse distance in the artifact cache if it is enabled,
+        this is called before the first calculation that needs reuse distance
+        """
+
+        if self.use_artifact_cache:
+            self._sync_rd_with_artifact_cache()
+
+    def _sync_rd_with_artifact_cache(self):
+        """
+        load reuse distance from the artifact cache into the c reader, or compute and save it if it is not cached
+        """
+
+        if not self.already_load_rd and not self.reader.already_load_rd:
+            artifact_cache = ArtifactCache()
+            key = artifact_cache.get_key(self.reader, "c_rd")
+            if key is not None:
+                rd_dat_path = artifact_cache.get_path(key, ".rd")
+                if os.path.exists(rd_dat_path):
+                    DEBUG("loading reuse distance from {}".format(rd_dat_path))
+                    self.load_reuse_dist(rd_dat_path, "rd")
+                    artifact_cache.touch(rd_dat_path)
+                else:
+                    os.makedirs(artifact_cache.cache_dir, exist_ok=True)
+                    tmp_path = "{}.tmp.{}".format(rd_dat_path, os.getpid())
+                    self.save_reuse_dist(tmp_path, "rd")
+                    os.replace(tmp_path, rd_dat_path)
+                    artifact_cache.evict()
+                    INFO("reuse distance calculated and saved at {}".format(rd_dat_path))
+        self.already_load_rd = True
+
 
     def get_hit_count(self, **kargs):
         """
@@ -167,6 +175,7 @@ class CLRUProfiler:
             WARNING("not supported yet")
             return None
         else:
+            self._load_rd()
             hit_count = c_LRUProfiler.get_hit_count_seq(self.reader.c_reader, **kargs)
         return hit_count
 
@@ -190,40 +199,27 @@ class CLRUProfiler:
             hit_ratio = c_LRUProfiler.get_hit_ratio_with_size(self.reader.c_reader,
                                                             block_unit_size=self.block_unit_size, **kargs)
         else:
+            self._load_rd()
             hit_ratio = c_LRUProfiler.get_hit_ratio_seq(self.reader.c_reader, **kargs)
         return hit_ratio
 
 
     def get_hit_ratio_shards(self, sample_ratio=0.01, **kwargs):
         """
-        experimental function
-        :param sample_ratio:
-        :param kwargs:
-        :return:
+        estimate hit ratio using SHARDS spatial sampling, see profiler/utils/shards,
+        both modes run in Python, because the CMimircache version does not apply the N1/N2 correction
+        of fixed-rate mode and does not support fixed-size mode
+
+        :param sample_ratio: the sampling ratio, in fixed-size mode, it is the initial sampling ratio
+        :param kwargs: cache_size, sample_size (the max number of sampled objects, which enables fixed-size mode)
+        :return: a numpy array of CACHE_SIZE+3, the layout is the same as get_hit_ratio
         """
-        # from PyMimircache.cacheReader.tracePreprocesser import TracePreprocessor
-        # kargs = {}
-        # if 'cache_size' not in kwargs:
-        #     kargs['cache_size'] = self.cache_size
-        # else:
-        #     kargs['cache_size'] = kwargs['cache_size']
-
-        # pp = TracePreprocessor(self.reader)
-        # N1, N2, traceName, fmt = pp.prepare_for_shards(sample_ratio=sample_ratio, has_time=False)
-        # correction = N2 - N1
-        # print("correction: {}".format(correction))
-        # # correction = 0
-        # tempReader = BinaryReader(traceName, init_params={"label":1, "fmt": fmt})
-
-        correction = 0
-        kargs = {"cache_size": kwargs.get("cache_size", self.cache_size)}
+
         if self.block_unit_size != 0:
-            print("not supported yet")
-            return None
-        else:
-            hit_ratio = c_LRUProfiler.get_hit_ratio_seq_shards(self.reader.c_reader, sample_ratio=sample_ratio,
-                                                       **kargs)
-        return hit_ratio
+            raise RuntimeError("SHARDS does not support block_unit_size (variable object size)")
+        return get_hit_ratio_shards(self.reader, sample_ratio=sample_ratio,
+                                    sample_size=kwargs.get("sample_size", -1),
+                                    cache_size=kwargs.get("cache_size", self.cache_size))
 
     def get_hit_ratio_phase(self, **kwargs):
         """
@@ -269,6 +265,7 @@ class CLRUProfiler:
         if self.block_unit_size != 0:
             WARNING("reuse distance calculation does not support variable obj size, "
                     "calculating without considering size")
+        self._load_rd()
         rd = c_LRUProfiler.get_reuse_dist_seq(self.reader.c_reader, **kargs)
         return rd
 
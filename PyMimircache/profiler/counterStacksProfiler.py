@@ -0,0 +1,128 @@
+# coding=utf-8
+
+"""
+    an approximate LRU profiler based on Counter Stacks (profiler/utils/counterStacks),
+    it reads the trace once and keeps a small stack of HyperLogLog counters instead of
+    the whole request history, so memory does not grow with the number of unique objects,
+    it is used for traces that are too large for the exact LRUProfiler
+
+    the hit ratio curve is approximate, distances are only resolved to the granularity of counters,
+    and reuses inside one interval are not distinguished, so the curve is not accurate for cache sizes
+    smaller than the number of unique objects in one interval
+
+"""
+
+import matplotlib.pyplot as plt
+from PyMimircache.cacheReader.abstractReader import AbstractReader
+from PyMimircache.profiler.utils.counterStacks import CounterStacks, \
+    DEF_CS_INTERVAL, DEF_CS_PRUNE_DELTA, DEF_CS_HLL_PRECISION
+from PyMimircache.profiler.utils.reuseDist import iter_label_blocks, get_hit_ratio_from_hit_count
+from PyMimircache.utils.printing import *
+
+
+class CounterStacksProfiler:
+    """
+    approximate LRU profiler using Counter Stacks
+
+    """
+    all = ["get_hit_count",
+           "get_hit_ratio",
+           "get_num_of_counters",
+           "plotHRC"]
+
+    def __init__(self, reader, cache_size=-1, interval=DEF_CS_INTERVAL, prune_delta=DEF_CS_PRUNE_DELTA,
+                 precision=DEF_CS_HLL_PRECISION, **kwargs):
+        """
+        initialize a CounterStacksProfiler
+
+        :param reader: reader for feeding data into profiler
+        :param cache_size: size of cache, if -1, then use the estimated number of unique objects
+        :param interval: the number of requests in an interval, a new counter is started every interval
+        :param prune_delta: a counter is pruned if it is within (1 - prune_delta) of the next older counter
+        :param precision: HyperLogLog uses 2^precision registers for each counter
+        """
+
+        assert isinstance(reader, AbstractReader), \
+            "you provided an invalid cacheReader: {}".format(reader)
+
+        self.reader = reader
+        self.cache_size = cache_size
+        self.interval = interval
+        self.prune_delta = prune_delta
+        self.precision = precision
+        self.counter_stacks = None
+
+        self.get_hit_rate = self.get_hit_ratio
+
+    def _profile(self):
+        """
+        read the trace once and feed all requests into counter stacks, it is only done once
+
+        :return: the CounterStacks instance
+        """
+
+        if self.counter_stacks is None:
+            counter_stacks = CounterStacks(self.interval, self.prune_delta, self.precision, self.cache_size)
+            self.reader.reset()
+            for block in iter_label_blocks(self.reader, self.interval):
+                counter_stacks.feed(block)
+            self.reader.reset()
+            counter_stacks.flush()
+            DEBUG("{}".format(counter_stacks))
+            self.counter_stacks = counter_stacks
+        return self.counter_stacks
+
+    def get_num_of_counters(self):
+        """
+        :return: the number of live counters at the end of trace
+        """
+        return self._profile().get_num_of_counters()
+
+    def get_hit_count(self, **kwargs):
+        """
+        estimated hit count, 0~size(included) are for counting rd=0~size, size+1 is
+        out of range, size+2 is cold miss, so total is size+3 buckets
+
+        :param kwargs: cache_size
+        :return: a numpy double array of estimated hit count
+        """
+        cache_size = kwargs.get("cache_size", self.cache_size)
+        return self._profile().get_hit_count(cache_size)
+
+    def get_hit_ratio(self, **kwargs):
+        """
+        estimated hit ratio
+
+        :param kwargs: cache_size
+        :return: a numpy array of CACHE_SIZE+3, 0~CACHE_SIZE corresponds to hit ratio of size 0~CACHE_SIZE,
+         CACHE_SIZE+1 is out of range, CACHE_SIZE+2 is cold miss
+        """
+        hit_count = self.get_hit_count(**kwargs)
+        return get_hit_ratio_from_hit_count(hit_count, num_of_req=self._profile().num_of_req)
+
+    def plotHRC(self, figname="HRC_counterStacks.png", **kwargs):
+        """
+        plot the approximate hit ratio curve
+
+        :param figname:
+        :param kwargs: cache_size, no_save, no_clear
+        :return: the hit ratio
+        """
+
+        hit_ratio = self.get_hit_ratio(**kwargs)[:-3]
+        plt.xlim(0, len(hit_ratio))
+        plt.plot(hit_ratio)
+        plt.xlabel("Cache Size (Items)")
+        plt.ylabel("Hit Ratio")
+        plt.title('Hit Ratio Curve (Counter Stacks)', fontsize=18, color='black')
+        if not kwargs.get("no_save", False):
+            plt.savefig(figname, dpi=600)
+            INFO("plot is saved")
+        try: plt.show()
+        except: pass
+        if not kwargs.get("no_clear", False):
+            plt.clf()
+        return hit_ratio
+
+    def __repr__(self):
+        return "CounterStacksProfiler of {}, interval {}".format(self.reader, self.interval)
@@ -0,0 +1,176 @@
+# coding=utf-8
+
+"""
+    an LRU profiler for traces that keep growing, it keeps the reuse distance histogram and
+    the recency state of all objects, so newly appended requests can be profiled
+    without processing the requests before them again
+
+    the state can be saved into a checkpoint and loaded later, for example, a nightly job
+    loads the checkpoint, profiles the requests appended since last run and saves the checkpoint again.
+    The checkpoint is a .npz file without pickled objects, labels are saved as a numpy array,
+    so they come back as int or str
+
+"""
+
+import os
+import numpy as np
+from PyMimircache.cacheReader.abstractReader import AbstractReader
+from PyMimircache.profiler.utils.reuseDist import ReuseDistEngine, DEF_RD_BLOCK_SIZE, \
+    iter_label_blocks, seek_req, get_hit_ratio_from_hit_count
+from PyMimircache.utils.printing import *
+
+
+class IncrementalLRUProfiler:
+    """
+    LRU profiler that can be extended with new requests
+
+    """
+    all = ["update",
+           "get_hit_count",
+           "get_hit_ratio",
+           "save_checkpoint",
+           "load_checkpoint"]
+
+    def __init__(self, reader=None, cache_size=-1, block_size=DEF_RD_BLOCK_SIZE):
+        """
+        initialize an empty IncrementalLRUProfiler, call update to profile requests
+
+        :param reader: the default reader for update
+        :param cache_size: size of cache, if -1, then use max possible size
+        :param block_size: the number of requests processed together
+        """
+
+        assert reader is None or isinstance(reader, AbstractReader), \
+            "you provided an invalid cacheReader: {}".format(reader)
+
+        self.reader = reader
+        self.cache_size = cache_size
+        self.block_size = block_size
+        self.engine = ReuseDistEngine(block_size=block_size)
+        # hist[d] is the number of requests with reuse distance d
+        self.hist = np.zeros(0, dtype=np.int64)
+        self.num_of_cold_miss = 0
+
+        self.get_hit_rate = self.get_hit_ratio
+
+    @property
+    def num_of_req(self):
+        """
+        :return: the number of requests profiled
+        """
+        return self.engine.num_of_req
+
+    def update(self, reader=None, from_current_position=False):
+        """
+        profile the requests that have not been profiled, till the end of trace
+
+        :param reader: the reader of the trace, default the reader given at initialization
+        :param from_current_position: if True, the reader is already positioned right after the profiled
+                    requests, for example, it is the reader used in last update and new requests
+                    have been appended since then, otherwise the reader is reset and the profiled
+                    requests are skipped (binary traces seek directly, other traces are read without profiling)
+        :return: the number of new requests
+        """
+
+        if reader is None:
+            reader = self.reader
+        assert reader is not None, "please provide a reader"
+        if not from_current_position:
+            num_of_skipped = seek_req(reader, self.num_of_req)
+            if num_of_skipped != self.num_of_req:
+                raise RuntimeError("trace has {} requests, but {} requests have been profiled".format(
+                    num_of_skipped, self.num_of_req))
+
+        begin = self.num_of_req
+        for block in iter_label_blocks(reader, self.block_size):
+            rd = self.engine.feed(block)
+            self._add_to_hist(rd)
+        DEBUG("profiled {} new requests, {} in total".format(self.num_of_req - begin, self.num_of_req))
+        return self.num_of_req - begin
+
+    def _add_to_hist(self, rd):
+        """
+        add reuse distance into histogram
+
+        :param rd: a numpy array of reuse distance, -1 for cold miss
+        """
+
+        reused = rd[rd != -1]
+        self.num_of_cold_miss += len(rd) - len(reused)
+        if len(reused) == 0:
+            return
+        counts = np.bincount(reused)
+        if len(counts) > len(self.hist):
+            hist = np.zeros(len(counts), dtype=np.int64)
+            hist[:len(self.hist)] = self.hist
+            self.hist = hist
+        self.hist[:len(counts)] += counts
+
+    def get_hit_count(self, **kwargs):
+        """
+        0~size(included) are for counting rd=0~size, size+1 is
+        out of range, size+2 is cold miss, so total is size+3 buckets
+
+        :param kwargs: cache_size
+        :return: a numpy array of hit count
+        """
+
+        cache_size = kwargs.get("cache_size", self.cache_size)
+        if cache_size == -1:
+            cache_size = len(self.hist)
+        hit_count = np.zeros(cache_size + 3, dtype=np.int64)
+        n = min(cache_size, len(self.hist))
+        hit_count[1: n + 1] = self.hist[:n]
+        hit_count[cache_size + 1] = np.sum(self.hist[n:])
+        hit_count[cache_size + 2] = self.num_of_cold_miss
+        return hit_count
+
+    def get_hit_ratio(self, **kwargs):
+        """
+        the hit ratio of all requests profiled so far
+
+        :param kwargs: cache_size
+        :return: a numpy array of CACHE_SIZE+3, 0~CACHE_SIZE corresponds to hit ratio of size 0~CACHE_SIZE,
+         CACHE_SIZE+1 is out of range, CACHE_SIZE+2 is cold miss
+        """
+        return get_hit_ratio_from_hit_count(self.get_hit_count(**kwargs))
+
+    def save_checkpoint(self, file_loc):
+        """
+        save the state of profiler, the file is written atomically,
+        so a crash during saving does not break the old checkpoint
+
+        :param file_loc: the location of checkpoint
+        """
+
+        labels, req_ids = self.engine.get_state()
+        tmp_loc = "{}.tmp.{}".format(file_loc, os.getpid())
+        with open(tmp_loc, "wb") as ofile:
+            np.savez(ofile, labels=np.array(labels), req_ids=req_ids, hist=self.hist,
+                     stat=np.array([self.num_of_req, self.num_of_cold_miss, self.cache_size], dtype=np.int64))
+        os.replace(tmp_loc, file_loc)
+        INFO("checkpoint of {} requests is saved to {}".format(self.num_of_req, file_loc))
+
+    @classmethod
+    def load_checkpoint(cls, file_loc, reader=None, block_size=DEF_RD_BLOCK_SIZE):
+        """
+        create a profiler from a checkpoint
+
+        :param file_loc: the location of checkpoint
+        :param reader: the default reader for update
+        :param block_size: the number of requests processed together
+        :return: an IncrementalLRUProfiler
+        """
+
+        with np.load(file_loc, allow_pickle=False) as checkpoint:
+            num_of_req, num_of_cold_miss, cache_size = checkpoint["stat"].tolist()
+            profiler = cls(reader, cache_size, block_size)
+            profiler.engine = ReuseDistEngine.from_state(checkpoint["labels"].tolist(), checkpoint["req_ids"],
+                                                         num_of_req, block_size=block_size)
+            profiler.hist = checkpoint["hist"].astype(np.int64)
+            profiler.num_of_cold_miss = num_of_cold_miss
+        return profiler
+
+    def __repr__(self):
+        return "IncrementalLRUProfiler ({} requests, {} objects)".format(
+            self.num_of_req, self.engine.get_num_of_uniq_obj())
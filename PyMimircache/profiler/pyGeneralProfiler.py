@@ -21,6 +21,7 @@ from concurrent.futures import as_completed, ProcessPoolExecutor
 from PyMimircache.const import *
 from PyMimircache.const import cache_name_to_class
 from PyMimircache.cacheReader.abstractReader import AbstractReader
+from PyMimircache.cacheReader.prefetchReader import PrefetchReader
 from PyMimircache.utils.printing import *
 from PyMimircache.profiler.profilerUtils import util_plotHRC
 
@@ -55,6 +56,8 @@ def _cal_hit_count_subprocess(cache_class,
     n_hits = 0
     n_misses = 0
 
+    # the trace is read ahead on a background thread while simulating
+    process_reader = PrefetchReader(process_reader)
     for req in process_reader:
         hit = process_cache.access(req, )
         if hit:
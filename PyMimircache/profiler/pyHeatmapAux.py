@@ -8,6 +8,7 @@
 
 from PyMimircache.utils.printing import *
 from PyMimircache.const import DEF_EMA_HISTORY_WEIGHT
+from PyMimircache.cacheReader.prefetchReader import PrefetchReader
 
 
 def cal_hr_LRU(rd, last_access_dist, cache_size, start=0, end=-1, **kwargs):
@@ -115,6 +116,8 @@ def cal_hr_list_general(reader_class, reader_params, cache_class, cache_size, bp
     if cache_class.__name__ == "Optimal":
         process_cache.set_init_ts(bp[bp_start_pos])
     process_reader.skip_n_req(bp[bp_start_pos])
+    # the trace is read ahead on a background thread while simulating
+    process_reader = PrefetchReader(process_reader)
 
 
     for i in range(bp_start_pos, len(bp)-1):
@@ -2,18 +2,29 @@
 
 """
     this module deals with LRU related profiling,
-    it uses O(nlogn) algorithm to profile without sampling
-    This module is not finished
+    it uses O(nlogn) algorithm to profile without sampling,
+    the reuse distance is computed by the Fenwick tree engine in profiler/utils/reuseDist
+
+    when block_unit_size is set, each request is an object of its size (rounded up to block units),
+    and the reuse distance is the total size of distinct objects, cache size is also in block units
 
     Author: Jason Yang <peter.waynechina@gmail.com> 2016/07
 
 """
 
 import os
-import socket
-from PyMimircache.const import INTERNAL_USE
+import numpy as np
+from PyMimircache.const import USE_ARTIFACT_CACHE
 from PyMimircache.cacheReader.binaryReader import BinaryReader
 from PyMimircache.cacheReader.abstractReader import AbstractReader
+from PyMimircache.profiler.utils.reuseDist import get_future_reuse_dist, \
+    get_byte_reuse_dist, get_hit_count_from_rd, get_hit_count_from_byte_rd, get_hit_ratio_from_hit_count
+from PyMimircache.profiler.utils.parallelReuseDist import get_reuse_dist_parallel
+from PyMimircache.profiler.utils.rdHistIndex import RDHistIndex
+from PyMimircache.profiler.utils.shards import get_hit_ratio_shards
+from PyMimircache.profiler.utils.aet import get_hit_ratio_aet
+from PyMimircache.profiler.profilerUtils import get_breakpoints
+from PyMimircache.utils.artifactCache import get_default_artifact_cache
 import matplotlib.pyplot as plt
 from PyMimircache.utils.printing import *
 from matplotlib.ticker import FuncFormatter
@@ -25,7 +36,12 @@ class PyLRUProfiler:
     """
     all = ["get_hit_count",
            "get_hit_ratio",
+           "get_byte_hit_count",
+           "get_byte_hit_ratio",
            "get_reuse_distance",
+           "get_hit_ratio_shards",
+           "get_hit_ratio_aet",
+           "build_window_index",
            "plotHRC",
            "save_reuse_dist",
            "load_reuse_dist",
@@ -38,7 +54,10 @@ class PyLRUProfiler:
         :param reader: reader for feeding data into profiler
         :param cache_size: size of cache, if -1, then use max possible size
         :param cache_params: parameters about cache, such as block_unit_size
-        :param kwargs: no_load_rd
+        :param kwargs: no_load_rd, use_artifact_cache (whether load or save reuse distance in the persistent
+                        artifact cache, default USE_ARTIFACT_CACHE in const),
+                        num_of_threads (the number of processes for computing reuse distance,
+                        large traces are split into chunks and computed in parallel, default 1)
         """
 
         # make sure reader is valid
@@ -63,20 +82,25 @@ class PyLRUProfiler:
         # this is for deprecated functions, as old version uses hit/miss rate instead of hit/miss ratio
         self.get_hit_rate = self.get_hit_ratio
 
+        # reuse distance is computed once and shared by all hit count/ratio calculation
+        self.rd = None
+        self.frd = None
+        # request size in block units, only used when block_unit_size is set
+        self.req_size = None
+
 
-        # INTERNAL USE to cache intermediate reuse distance
-        self.already_load_rd = False
-        if INTERNAL_USE and not kwargs.get("no_load_rd", False) and \
-                socket.gethostname().lower() in ["master", "node2", "node3"] and \
-                ".." not in reader.file_loc:
-            if not reader.already_load_rd:
-                self.use_precomputedRD()
-                self.already_load_rd = True
+        # reuse distance is loaded from or saved into the persistent artifact cache if it is enabled,
+        # either by use_artifact_cache or USE_ARTIFACT_CACHE in const, unless no_load_rd
+        self.use_artifact_cache = kwargs.get("use_artifact_cache", USE_ARTIFACT_CACHE) and \
+                                  not kwargs.get("no_load_rd", False)
+        self.num_of_threads = kwargs.get("num_of_threads", 1)
+        # cumulative hit count at breakpoints, used by get_hit_count with begin/end, see build_window_index
+        self.window_index = None
 
 
     def save_reuse_dist(self, file_loc, rd_type):
         """
-        save reuse distance to file_loc
+        save reuse distance to file_loc as a numpy .npy file
         allowed reuse distance including normal reuse distance (rd),
         future/forward reuse distance (frd)
         :param file_loc:
@@ -85,11 +109,17 @@ class PyLRUProfiler:
         """
         assert rd_type == 'rd' or rd_type == 'frd', \
             "please provide a valid reuse distance type, currently support rd and frd"
-        raise RuntimeError("Not Implemented")
+        if rd_type == 'rd':
+            rd = self.get_reuse_distance()
+        else:
+            rd = self.get_future_reuse_distance()
+        with open(file_loc, "wb") as ofile:
+            np.save(ofile, rd)
 
     def load_reuse_dist(self, file_loc, rd_type):
         """
-        load reuse distance from file_loc
+        load reuse distance from file_loc, which is saved by save_reuse_dist,
+        the array is memory-mapped
         allowed reuse distance including normal reuse distance (rd),
         future/forward reuse distance (frd)
 
@@ -101,36 +131,26 @@ class PyLRUProfiler:
             "please provide a valid reuse distance type, currently support rd and frd"
         if not os.path.exists(file_loc):
             WARNING("pre-computed reuse distance file does not exist")
-        raise RuntimeError("Not Implemented")
-        self.reader.already_load_rd = True
+            return
+        rd = np.load(file_loc, mmap_mode="r")
+        assert len(rd) == self.reader.get_num_of_req(), \
+            "reuse distance in {} has {} requests, trace has {}".format(file_loc, len(rd),
+                                                                         self.reader.get_num_of_req())
+        if rd_type == 'rd':
+            self.rd = rd
+        else:
+            self.frd = rd
 
 
     def use_precomputedRD(self):
         """
-        this is an internal used function, it tries to load precomputed reuse distance to avoid the expensive
-        O(NlogN) reuse distance computation, if the data does not exists, then compute it and save it
+        load reuse distance from the persistent artifact cache to avoid the expensive
+        O(NlogN) reuse distance computation, if it is not cached, then compute it and save it,
+        after this, get_reuse_distance and hit count/ratio calculation use the artifact cache
         :return:
         """
 
-        has_rd = True
-        if not self.already_load_rd and not self.reader.already_load_rd:
-            if "/home/cloudphysics/traces/" not in self.reader.file_loc and \
-                    "/home/jason/ALL_DATA" not in self.reader.file_loc:
-                has_rd = False
-
-            rd_dat_path = self.reader.file_loc.replace("/home/jason/ALL_DATA/",
-                                                       "/research/jason/preComputedData/RD/")
-            rd_dat_path = rd_dat_path.replace("/home/cloudphysics/traces/",
-                                              "/research/jason/preComputedData/RD/cphyVscsi")
-
-            if has_rd and os.path.exists(rd_dat_path):
-                DEBUG("loading reuse distance from {}".format(rd_dat_path))
-                self.load_reuse_dist(rd_dat_path, "rd")
-            else:
-                if not os.path.exists(os.path.dirname(rd_dat_path)):
-                    os.makedirs(os.path.dirname(rd_dat_path))
-                self.save_reuse_dist(rd_dat_path, "rd")
-                INFO("reuse distance calculated and saved at {}".format(rd_dat_path))
+        self.use_artifact_cache = True
         return self.get_reuse_distance()
 
     def get_hit_count(self, **kargs):
@@ -142,11 +162,16 @@ class PyLRUProfiler:
         """
         if 'cache_size' not in kargs:
             kargs['cache_size'] = self.cache_size
+        hit_count = self._get_hit_count_from_window_index(kargs["cache_size"],
+                                                          kargs.get("begin", 0), kargs.get("end", -1))
+        if hit_count is not None:
+            return hit_count
+        rd = self._get_rd_in_range(kargs.get("begin", 0), kargs.get("end", -1))
         if self.block_unit_size != 0:
-            raise RuntimeError("not supported yet")
-            return None
+            sizes = self._get_size_in_range(kargs.get("begin", 0), kargs.get("end", -1))
+            hit_count = get_hit_count_from_byte_rd(rd, sizes, self._get_cache_size(kargs["cache_size"], rd, sizes))
         else:
-            raise RuntimeError("Not Implemented")
+            hit_count = get_hit_count_from_rd(rd, self._get_cache_size(kargs["cache_size"], rd))
         return hit_count
 
     def get_hit_ratio(self, **kwargs):
@@ -165,58 +190,178 @@ class PyLRUProfiler:
         if 'end' in kwargs:
             kargs['end'] = kwargs['end']
 
-        if self.block_unit_size != 0 :
-            raise RuntimeError("Not Implemented")
-            hit_ratio = c_LRUProfiler.get_hit_ratio_with_size(self.reader.c_reader,
-                                                            block_unit_size=self.block_unit_size, **kargs)
-        else:
-            raise RuntimeError("Not Implemented")
-            hit_ratio = c_LRUProfiler.get_hit_ratio_seq(self.reader.c_reader, **kargs)
+        hit_count = self.get_hit_count(**kargs)
+        hit_ratio = get_hit_ratio_from_hit_count(hit_count)
         return hit_ratio
 
-
-    def get_hit_ratio_shards(self, sample_ratio=0.01, **kwargs):
+    def get_byte_hit_count(self, **kargs):
         """
-        experimental function
-        :param sample_ratio:
-        :param kwargs:
+        the size of hit requests (in block units), it is only available when block_unit_size is set,
+        0~size(included) are for counting size of requests that hit at cache size 0~size, size+1 is
+        out of range, size+2 is cold miss, so total is size+3 buckets
+        :param kargs: cache_size (in block units), begin, end
         :return:
         """
-        from PyMimircache.cacheReader.tracePreprocesser import TracePreprocessor
-        kargs = {}
-        if 'cache_size' not in kwargs:
-            kargs['cache_size'] = self.cache_size
-        else:
-            kargs['cache_size'] = kwargs['cache_size']
+        assert self.block_unit_size != 0, "please set block_unit_size in cache_params for byte hit count"
+        cache_size = kargs.get("cache_size", self.cache_size)
+        rd = self._get_rd_in_range(kargs.get("begin", 0), kargs.get("end", -1))
+        sizes = self._get_size_in_range(kargs.get("begin", 0), kargs.get("end", -1))
+        return get_hit_count_from_byte_rd(rd, sizes, self._get_cache_size(cache_size, rd, sizes), byte_hit=True)
 
-        pp = TracePreprocessor(self.reader)
-        N1, N2, traceName, fmt = pp.prepare_for_shards(sample_ratio=sample_ratio, has_time=False)
-        correction = N2 - N1
-        print("correction: {}".format(correction))
-        # correction = 0
-        tempReader = BinaryReader(traceName, init_params={"label":1, "fmt": fmt})
+    def get_byte_hit_ratio(self, **kwargs):
+        """
+        byte hit ratio, the ratio of hit bytes to requested bytes,
+        it is only available when block_unit_size is set
 
-        if self.block_unit_size != 0:
-            print("not supported yet")
+        :param kwargs: cache_size (in block units), begin, end
+        :return: a numpy array of CACHE_SIZE+3, the layout is the same as get_hit_ratio
+        """
+        byte_hit_count = self.get_byte_hit_count(**kwargs)
+        return get_hit_ratio_from_hit_count(byte_hit_count)
+
+    def build_window_index(self, breakpoints=None, cache_size=-1, time_mode="v",
+                           time_interval=-1, num_of_windows=-1):
+        """
+        build an index of cumulative reuse distance histograms at breakpoints,
+        after that, get_hit_count/get_hit_ratio with begin and end along breakpoints
+        are computed from the index in O(cache_size) without scanning the window
+
+        :param breakpoints: a list of request numbers, if not given, it is computed from
+                    time_mode and time_interval or num_of_windows, see profilerUtils.get_breakpoints
+        :param cache_size: the max cache size of interest, -1 means the cache size of profiler
+        :param time_mode: either real time (r) or virtual time (v)
+        :param time_interval: the time interval of one window
+        :param num_of_windows: the number of windows, used if time_interval is not given
+        :return: the RDHistIndex
+        """
+
+        if cache_size == -1:
+            cache_size = self.cache_size
+        assert cache_size != -1, "please provide cache_size for the window index"
+        if breakpoints is None:
+            breakpoints = get_breakpoints(self.reader, time_mode, time_interval, num_of_windows)
+            self.reader.reset()
+        rd = self.get_reuse_distance()
+        self.window_index = RDHistIndex(rd, breakpoints, cache_size,
+                                        sizes=self.req_size if self.block_unit_size != 0 else None)
+        return self.window_index
+
+    def _get_hit_count_from_window_index(self, cache_size, begin=0, end=-1):
+        """
+        get hit count of [begin, end) from the window index if possible
+
+        :param cache_size: the given cache size
+        :param begin: the first request (included)
+        :param end: the last request (not included), -1 means the end of trace
+        :return: a numpy array of hit count, None if the window index can not be used
+        """
+
+        if self.window_index is None:
             return None
-        else:
-            raise RuntimeError("Not Implemented")
-            hit_ratio = c_LRUProfiler.get_hit_ratio_seq_shards(tempReader.c_reader, sample_ratio=sample_ratio,
-                                                       correction=correction, **kargs)
-        return hit_ratio
+        if end == -1:
+            end = self.window_index.num_of_req
+        if cache_size == -1:
+            # the same as _get_cache_size, the total size of objects is not known without scanning
+            if self.block_unit_size != 0:
+                return None
+            cache_size = end - begin
+        if cache_size > self.window_index.cache_size or not self.window_index.has_window(begin, end):
+            return None
+        return self.window_index.get_hit_count(begin, end, cache_size)
+
+    def _get_rd_in_range(self, begin=0, end=-1):
+        """
+        return the reuse distance of requests in [begin, end), the distance is computed on the whole trace
+
+        :param begin: the first request (included)
+        :param end: the last request (not included), -1 means the end of trace
+        :return: a numpy array of reuse distance
+        """
 
+        rd = self.get_reuse_distance()
+        if begin != 0 or end != -1:
+            rd = rd[begin: end if end != -1 else len(rd)]
+        return rd
+
+    def _get_size_in_range(self, begin=0, end=-1):
+        """
+        return the size (in block units) of requests in [begin, end)
+
+        :param begin: the first request (included)
+        :param end: the last request (not included), -1 means the end of trace
+        :return: a numpy array of request size
+        """
+
+        self.get_reuse_distance()
+        sizes = self.req_size
+        if begin != 0 or end != -1:
+            sizes = sizes[begin: end if end != -1 else len(sizes)]
+        return sizes
+
+    def _get_cache_size(self, cache_size, rd, sizes=None):
+        """
+        the max cache size used for profiling, -1 means the number of requests,
+        which is the same as CMimircache, with size, -1 means the total size of all objects
+
+        :param cache_size: the given cache size
+        :param rd: the reuse distance used for profiling
+        :param sizes: the size of requests, None if profiling without size
+        :return: the cache size
+        """
+
+        if cache_size == -1:
+            if sizes is not None:
+                return int(np.sum(sizes[rd == -1]))
+            return len(rd)
+        return cache_size
+
+
+    def get_hit_ratio_shards(self, sample_ratio=0.01, **kwargs):
+        """
+        estimate hit ratio using SHARDS spatial sampling, see profiler/utils/shards
+
+        :param sample_ratio: the sampling ratio, in fixed-size mode, it is the initial sampling ratio
+        :param kwargs: cache_size, sample_size (the max number of sampled objects, which enables fixed-size mode)
+        :return: a numpy array of CACHE_SIZE+3, the layout is the same as get_hit_ratio
+        """
+
+        if self.block_unit_size != 0:
+            raise RuntimeError("SHARDS does not support block_unit_size (variable object size)")
+        return get_hit_ratio_shards(self.reader, sample_ratio=sample_ratio,
+                                    sample_size=kwargs.get("sample_size", -1),
+                                    cache_size=kwargs.get("cache_size", self.cache_size))
+
+    def get_hit_ratio_aet(self, sample_ratio=1.0, **kwargs):
+        """
+        estimate hit ratio using the AET model from reuse time histogram, see profiler/utils/aet,
+        it does not compute reuse distance
+
+        :param sample_ratio: the probability that a request is sampled, 1.0 means all requests
+        :param kwargs: cache_size, seed (the seed of random sampling)
+        :return: a numpy array of CACHE_SIZE+3, the layout is the same as get_hit_ratio
+        """
+
+        if self.block_unit_size != 0:
+            raise RuntimeError("AET does not support block_unit_size (variable object size)")
+        return get_hit_ratio_aet(self.reader, cache_size=kwargs.get("cache_size", self.cache_size),
+                                 sample_ratio=sample_ratio, seed=kwargs.get("seed", None))
 
     def get_reuse_distance(self, **kargs):
         """
-        get reuse distance as a numpy array
+        get reuse distance as a numpy array,
+        if block_unit_size is set, it is the total size (in block units) of distinct objects
         :param kargs:
         :return:
         """
-        if self.block_unit_size != 0:
-            WARNING("reuse distance calculation does not support variable obj size, "
-                    "calculating without considering size")
-        raise RuntimeError("Not Implemented")
-        return rd
+        if self.rd is None:
+            if self.block_unit_size != 0:
+                self.rd, self.req_size = self._get_artifact(("byte_rd", "req_size"),
+                                                            lambda: get_byte_reuse_dist(self.reader,
+                                                                                        self.block_unit_size),
+                                                            block_unit_size=self.block_unit_size)
+            else:
+                self.rd = self._get_artifact("rd", lambda: get_reuse_dist_parallel(self.reader, self.num_of_threads))
+        return self.rd
 
     def get_future_reuse_distance(self, **kargs):
         """
@@ -227,8 +372,24 @@ class PyLRUProfiler:
         if self.block_unit_size != 0:
             WARNING("future reuse distance calculation does not support variable obj size, "
                 "calculating without considering size")
-        raise RuntimeError("Not Implemented")
-        return frd
+        if self.frd is None:
+            self.frd = self._get_artifact("frd", lambda: get_future_reuse_dist(self.reader))
+        return self.frd
+
+    def _get_artifact(self, names, compute_func, **params):
+        """
+        get reuse distance (or other arrays) from the artifact cache if it is enabled for this profiler,
+        otherwise compute it
+
+        :param names: the name of the array, or a tuple of names if compute_func returns a tuple of arrays
+        :param compute_func: a function without argument that computes the array(s)
+        :param params: other parameters used in computing the array
+        :return: a numpy array or a tuple of numpy arrays
+        """
+
+        if self.use_artifact_cache:
+            return get_default_artifact_cache().get_or_compute(self.reader, names, compute_func, **params)
+        return compute_func()
 
 
     def plotHRC(self, figname="HRC.png", auto_resize=False, threshold=0.98, **kwargs):
@@ -0,0 +1,130 @@
+# coding=utf-8
+"""
+    AET (Average Eviction Time, Hu et al. ATC'16), an LRU miss ratio curve model built from
+    the reuse time histogram in linear time
+
+    the reuse time of a request is its distance to the previous request to the same object
+    (the same as get_last_access_dist), P(t) is the fraction of requests with reuse time larger than t,
+    first accesses have infinite reuse time. An object stays in an LRU cache of size c for AET(c),
+    which is the smallest T with sum_{t<T} P(t) >= c, and the miss ratio is mr(c) = P(AET(c)).
+
+    P(t) is a step function that only changes at distinct reuse times, so the curve is computed from
+    the distinct reuse times and their counts, sum_{t<T} P(t) is piecewise linear between them.
+
+    with sampling, each request is sampled with probability sample_ratio and only sampled requests are
+    watched until the next access to the same object, so memory is proportional to the sampled objects,
+    the reuse time distribution of the sample estimates the one of the whole trace
+
+"""
+
+import numpy as np
+from collections import defaultdict
+from PyMimircache.profiler.utils.reuseDist import DEF_RD_BLOCK_SIZE, iter_label_blocks
+
+
+def get_reuse_time_hist(reader, sample_ratio=1.0, seed=None, block_size=DEF_RD_BLOCK_SIZE):
+    """
+    the reuse time histogram of the trace
+
+    :param reader: reader for data input
+    :param sample_ratio: the probability that a request is sampled, 1.0 means all requests
+    :param seed: the seed of random sampling
+    :param block_size: the number of requests read together
+    :return: (reuse_times, counts, num_of_inf), sorted distinct reuse times, the number of (sampled) requests
+                of each reuse time, and the number of (sampled) requests with infinite reuse time
+    """
+
+    assert 0 < sample_ratio <= 1, "sample ratio must be in (0, 1], given {}".format(sample_ratio)
+    # reuse time -> the number of requests, memory is proportional to the distinct reuse times
+    hist = defaultdict(int)
+    n = 0
+    reader.reset()
+    if sample_ratio == 1:
+        last_seen = {}
+        for block in iter_label_blocks(reader, block_size):
+            for i, label in enumerate(block, n):
+                last_time = last_seen.get(label, -1)
+                if last_time != -1:
+                    hist[i - last_time] += 1
+                last_seen[label] = i
+            n += len(block)
+        num_of_inf = len(last_seen)
+    else:
+        # a sampled request is watched till the next request to the same object,
+        # the reuse time (forward) of a request pair is the same as the backward one
+        rng = np.random.RandomState(seed)
+        watched = {}
+        for block in iter_label_blocks(reader, block_size):
+            sampled = (rng.random_sample(len(block)) < sample_ratio).tolist()
+            for i, label in enumerate(block):
+                sample_time = watched.pop(label, -1)
+                if sample_time != -1:
+                    hist[n + i - sample_time] += 1
+                if sampled[i]:
+                    watched[label] = n + i
+            n += len(block)
+        num_of_inf = len(watched)
+    reader.reset()
+
+    reuse_times = np.array(sorted(hist), dtype=np.int64)
+    counts = np.array([hist[t] for t in reuse_times.tolist()], dtype=np.int64)
+    return reuse_times, counts, num_of_inf
+
+
+def get_miss_ratio_from_reuse_time(reuse_times, counts, num_of_inf, cache_size):
+    """
+    compute the LRU miss ratio of cache size 0~cache_size with AET
+
+    :param reuse_times: sorted distinct reuse times
+    :param counts: the number of requests of each reuse time
+    :param num_of_inf: the number of requests with infinite reuse time
+    :param cache_size: the max cache size
+    :return: a numpy double array of cache_size+1 miss ratio
+    """
+
+    num_of_req = int(np.sum(counts)) + num_of_inf
+    if num_of_req == 0:
+        return np.ones(cache_size + 1, dtype=np.double)
+    reuse_times = np.asarray(reuse_times, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+
+    # p[k] = P(t) for t in [reuse_times[k-1], reuse_times[k]), p[0] is not used,
+    # p[-1] is P(t) beyond the largest reuse time
+    num_of_larger = np.zeros(len(counts) + 1, dtype=np.int64)
+    num_of_larger[:-1] = np.cumsum(counts[::-1])[::-1]
+    p = np.ones(len(counts) + 2, dtype=np.double)
+    p[1:] = (num_of_larger + num_of_inf) / num_of_req
+
+    # s[k] = sum_{t < reuse_times[k-1]} P(t), s[0] = 0
+    s = np.zeros(len(counts) + 1, dtype=np.double)
+    np.cumsum(np.diff(reuse_times, prepend=0) * p[1:-1], out=s[1:])
+
+    # the step that contains AET(c)
+    k = np.searchsorted(s, np.arange(cache_size + 1), side="right")
+    return p[k]
+
+
+def get_hit_ratio_aet(reader, cache_size=-1, sample_ratio=1.0, seed=None, block_size=DEF_RD_BLOCK_SIZE):
+    """
+    estimate the LRU hit ratio curve of the whole trace using AET
+
+    :param reader: reader for data input
+    :param cache_size: the max cache size, -1 means the number of requests
+    :param sample_ratio: the probability that a request is sampled, 1.0 means all requests
+    :param seed: the seed of random sampling
+    :param block_size: the number of requests read together
+    :return: a numpy double array of cache_size+3 estimated hit ratio, the layout is the same as
+                get_hit_ratio_from_hit_count
+    """
+
+    reuse_times, counts, num_of_inf = get_reuse_time_hist(reader, sample_ratio, seed, block_size)
+    if cache_size == -1:
+        cache_size = reader.get_num_of_req()
+    miss_ratio = get_miss_ratio_from_reuse_time(reuse_times, counts, num_of_inf, cache_size)
+    cold_miss_ratio = num_of_inf / max(int(np.sum(counts)) + num_of_inf, 1)
+
+    hit_ratio = np.zeros(cache_size + 3, dtype=np.double)
+    hit_ratio[:cache_size + 1] = 1 - miss_ratio
+    hit_ratio[cache_size + 1] = max(miss_ratio[-1] - cold_miss_ratio, 0)
+    hit_ratio[cache_size + 2] = cold_miss_ratio
+    return hit_ratio
@@ -0,0 +1,245 @@
+# coding=utf-8
+"""
+    Counter Stacks (Wires et al. OSDI'14), an approximate LRU hit ratio curve in one sequential pass
+    with memory sublinear in the number of unique objects
+
+    every interval requests a new HyperLogLog counter is started, and all requests are added to
+    all live counters, so counter i counts the distinct objects accessed since its start time s_i.
+    During interval j, the increase of counter i is the number of requests whose previous access
+    is before s_i (or never), so the difference of increases of two adjacent counters i and i+1
+    is the number of requests whose previous access is in [s_i, s_i+1), the reuse distance
+    of these requests is between the value of counter i+1 and counter i.
+    The increase of the oldest counter is cold miss, the requests that are not counted by the
+    youngest counter are reuses inside the interval.
+
+    counters whose value is within (1 - prune_delta) of the next older counter carry little information,
+    they are pruned, so the number of counters is O(log(#unique objects) / prune_delta)
+
+    all live counters see the same requests in an interval, so the registers of an interval
+    are computed once and merged into all counters with one numpy maximum
+
+"""
+
+import numpy as np
+from PyMimircache.utils.hashing import hash64_many
+
+
+# the number of requests in an interval
+DEF_CS_INTERVAL = 65536
+# a counter is pruned if its value is larger than (1 - prune_delta) * the value of the next older counter
+DEF_CS_PRUNE_DELTA = 0.02
+# HyperLogLog uses 2^precision registers, the relative error is about 1.04/sqrt(2^precision)
+DEF_CS_HLL_PRECISION = 12
+
+
+def hll_registers(hashes, precision=DEF_CS_HLL_PRECISION):
+    """
+    compute the HyperLogLog registers of a batch of 64-bit hash values
+
+    :param hashes: a numpy uint64 array of hash values
+    :param precision: the number of bits used for register index
+    :return: a numpy uint8 array of 2^precision registers
+    """
+
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    if len(hashes) == 0:
+        return registers
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    idx = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+    # rank is the position of the first 1 bit in the remaining 64-precision bits, bit_length is from frexp
+    bit_length = np.frexp(rest.astype(np.float64))[1]
+    rank = (64 - precision - bit_length + 1).astype(np.uint8)
+    np.maximum.at(registers, idx, rank)
+    return registers
+
+
+def hll_estimate(registers):
+    """
+    HyperLogLog estimate of a stack of counters
+
+    :param registers: a 2D numpy uint8 array, each row is the registers of one counter
+    :return: a numpy double array of the estimated number of distinct elements of each counter
+    """
+
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    z = np.ldexp(1.0, -registers.astype(np.int64)).sum(axis=1)
+    estimate = alpha * m * m / z
+    num_of_zeros = np.count_nonzero(registers == 0, axis=1)
+    # small range correction (linear counting)
+    small = (estimate <= 2.5 * m) & (num_of_zeros > 0)
+    estimate[small] = m * np.log(m / num_of_zeros[small])
+    return estimate
+
+
+class CounterStacks:
+    """
+    a streaming Counter Stacks profiler, labels of all requests are fed in arbitrary sized chunks
+
+    """
+
+    def __init__(self, interval=DEF_CS_INTERVAL, prune_delta=DEF_CS_PRUNE_DELTA,
+                 precision=DEF_CS_HLL_PRECISION, cache_size=-1):
+        """
+        :param interval: the number of requests in an interval, a new counter is started every interval
+        :param prune_delta: a counter is pruned if it is within (1 - prune_delta) of the next older counter
+        :param precision: HyperLogLog uses 2^precision registers for each counter
+        :param cache_size: the max cache size of interest, larger distances are only counted as out of range,
+                    -1 means no limit
+        """
+
+        assert interval > 0, "interval must be positive"
+        assert 0 <= prune_delta < 1, "prune_delta must be in [0, 1)"
+        self.interval = interval
+        self.prune_delta = prune_delta
+        self.precision = precision
+        self.cache_size = cache_size
+
+        # each row is a live counter, from the oldest to the youngest
+        self.registers = np.zeros((0, 1 << precision), dtype=np.uint8)
+        # the estimated value of live counters at the end of last interval
+        self.counts = np.zeros(0, dtype=np.double)
+        # the hash values of requests in the current (not finished) interval
+        self.pending = []
+        self.num_of_pending = 0
+
+        self.num_of_req = 0
+        # estimated hit count of reuse distance 0, 1, 2 ...
+        self.hist = np.zeros(1, dtype=np.double)
+        self.num_of_out_of_range = 0.0
+        self.num_of_cold_miss = 0.0
+
+    def feed(self, labels):
+        """
+        feed the labels of requests, which follow the requests fed before
+
+        :param labels: a list of request labels
+        """
+
+        hashes = hash64_many(labels)
+        self.num_of_req += len(hashes)
+        pos = 0
+        while pos < len(hashes):
+            n = min(self.interval - self.num_of_pending, len(hashes) - pos)
+            self.pending.append(hashes[pos: pos + n])
+            self.num_of_pending += n
+            pos += n
+            if self.num_of_pending == self.interval:
+                self._finish_interval()
+
+    def flush(self):
+        """
+        finish the current interval even if it is not full, this is called before getting the result
+        """
+        if self.num_of_pending:
+            self._finish_interval()
+
+    def _finish_interval(self):
+        """
+        add the requests of current interval into all counters, update histogram and prune counters
+        """
+
+        hashes = np.concatenate(self.pending)
+        self.pending = []
+        self.num_of_pending = 0
+        n = len(hashes)
+
+        # start a new counter at the beginning of this interval
+        registers = np.vstack([self.registers, np.zeros((1, self.registers.shape[1]), dtype=np.uint8)])
+        old_counts = np.append(self.counts, 0.0)
+        np.maximum(registers, hll_registers(hashes, self.precision), out=registers)
+        counts = np.maximum(hll_estimate(registers), old_counts)
+        increase = np.minimum(counts - old_counts, n)
+        # the increase of an older counter can not be larger than a younger one
+        increase = np.minimum.accumulate(increase[::-1])[::-1]
+
+        # requests whose previous access is between the start of counter i and counter i+1
+        num_of_reuse = increase[1:] - increase[:-1]
+        # their reuse distance is between the value of counter i+1 and counter i
+        dist = (counts[1:] + counts[:-1]) / 2
+        self._add_to_hist(dist, num_of_reuse)
+        # reuses inside the interval, the distance is less than the number of distinct objects of the interval
+        self._add_to_hist(np.array([increase[-1] / 2]), np.array([n - increase[-1]]))
+        self.num_of_cold_miss += increase[0]
+
+        keep = self._get_live_counters(counts)
+        self.registers = registers[keep]
+        self.counts = counts[keep]
+
+    def _add_to_hist(self, dist, count):
+        """
+        add count of requests with reuse distance dist into histogram
+
+        :param dist: a numpy array of (estimated) reuse distance
+        :param count: a numpy array of the number of requests
+        """
+
+        dist = np.rint(dist).astype(np.int64)
+        if self.cache_size != -1:
+            out_of_range = dist >= self.cache_size
+            self.num_of_out_of_range += np.sum(count[out_of_range])
+            dist = dist[~out_of_range]
+            count = count[~out_of_range]
+        if len(dist) == 0:
+            return
+        if dist.max() >= len(self.hist):
+            hist = np.zeros(max(dist.max() + 1, 2 * len(self.hist)), dtype=np.double)
+            hist[:len(self.hist)] = self.hist
+            self.hist = hist
+        np.add.at(self.hist, dist, count)
+
+    def _get_live_counters(self, counts):
+        """
+        prune the counters that are close to the next older live counter, the oldest counter is never pruned
+
+        :param counts: the values of counters from the oldest to the youngest
+        :return: a list of index of counters to keep
+        """
+
+        keep = [0]
+        for i in range(1, len(counts)):
+            if counts[i] < (1 - self.prune_delta) * counts[keep[-1]]:
+                keep.append(i)
+        return keep
+
+    def get_num_of_counters(self):
+        """
+        :return: the number of live counters
+        """
+        return len(self.counts)
+
+    def get_num_of_uniq_obj(self):
+        """
+        :return: the estimated number of unique objects
+        """
+        self.flush()
+        return int(round(self.counts[0])) if len(self.counts) else 0
+
+    def get_hit_count(self, cache_size=-1):
+        """
+        the estimated hit count, the layout is the same as get_hit_count_from_rd,
+        0~cache_size(included) are for counting hits at size 0~cache_size,
+        cache_size+1 is out of range, cache_size+2 is cold miss
+
+        :param cache_size: the max cache size, -1 means the cache size given at initialization,
+                    or the estimated number of unique objects if it is not given either
+        :return: a numpy double array of estimated hit count
+        """
+
+        self.flush()
+        if cache_size == -1:
+            cache_size = self.cache_size if self.cache_size != -1 else max(self.get_num_of_uniq_obj(), 1)
+        assert self.cache_size == -1 or cache_size <= self.cache_size, \
+            "cache size {} is larger than the profiled cache size {}".format(cache_size, self.cache_size)
+
+        hit_count = np.zeros(cache_size + 3, dtype=np.double)
+        n = min(cache_size, len(self.hist))
+        hit_count[1: n + 1] = self.hist[:n]
+        hit_count[cache_size + 1] = np.sum(self.hist[n:]) + self.num_of_out_of_range
+        hit_count[cache_size + 2] = self.num_of_cold_miss
+        return hit_count
+
+    def __repr__(self):
+        return "CounterStacks ({} requests, {} counters)".format(self.num_of_req, len(self.counts))
@@ -1,7 +1,7 @@
 
 
-from collections import deque
-
+import numpy as np
+from PyMimircache.profiler.utils.reuseDist import get_future_reuse_dist
 
 
 def get_last_access_dist(reader):
@@ -29,28 +29,15 @@ def get_last_access_dist(reader):
 
 def get_next_access_dist(reader):
     """
-    calculate the distance to next access, absolute distance, -1 if there is no next access
+    calculate the distance to next access, absolute distance, -1 if there is no next access,
+    this is computed in a single reverse pass together with future reuse distance,
+    so the trace is not kept in memory
 
     :param reader: reader for data input
     :return: a list of dist to next access
     """
 
+    next_access_dist = np.empty(reader.get_num_of_req(), dtype=np.int64)
+    get_future_reuse_dist(reader, next_access_dist=next_access_dist)
     reader.reset()
-    reversed_dat = deque()
-    next_access_dist = []
-    next_access_time = {}
-
-    # FIXME: try to do this in a more memory-efficient way
-
-    for req in reader:
-        reversed_dat.appendleft(req)
-
-    for n, r in enumerate(reversed_dat):
-        if r in next_access_time:
-            next_access_dist.append(n - next_access_time[r])
-        else:
-            next_access_dist.append(-1)
-        next_access_time[r] = n
-    next_access_dist.reverse()
-    reader.reset()
-    return next_access_dist
\ No newline at end of file
+    return next_access_dist.tolist()
@@ -0,0 +1,127 @@
+# coding=utf-8
+"""
+    a Fenwick tree (binary indexed tree) backed by a numpy array,
+    it is used as the order-statistic structure in reuse distance computation
+
+    both point update and prefix sum are O(logN), and both of them accept either
+    a single position or a numpy array of positions, the array version runs the
+    O(logN) loop once for all positions, so the per-position cost is paid in numpy
+
+"""
+
+import numpy as np
+
+
+class FenwickTree:
+    """
+    Fenwick tree over positions [0, size)
+
+    """
+
+    def __init__(self, size, dtype=np.int64):
+        """
+        initialize an empty Fenwick tree
+
+        :param size: the number of positions
+        :param dtype: the numpy type of the values stored in the tree
+        """
+
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        # tree[0] is never used and always stays 0
+        self.tree = np.zeros(size + 1, dtype=self.dtype)
+
+    @classmethod
+    def from_array(cls, values, size=-1, dtype=None):
+        """
+        build a Fenwick tree from an array of values in O(N)
+
+        :param values: the initial value of position 0, 1, 2 ...
+        :param size: the size of the tree, -1 means len(values)
+        :param dtype: the numpy type of the values, default the type of values
+        :return: a FenwickTree
+        """
+
+        values = np.asarray(values)
+        if size == -1:
+            size = len(values)
+        assert size >= len(values), "size {} is smaller than the number of values {}".format(size, len(values))
+
+        ft = cls(size, dtype=values.dtype if dtype is None else dtype)
+        prefix = np.zeros(size + 1, dtype=ft.dtype)
+        np.cumsum(values, out=prefix[1:len(values) + 1])
+        prefix[len(values) + 1:] = prefix[len(values)]
+        idx = np.arange(1, size + 1)
+        ft.tree[1:] = prefix[idx] - prefix[idx - (idx & -idx)]
+        return ft
+
+    def add(self, pos, delta=1):
+        """
+        add delta to the value at pos
+
+        :param pos: a position or a numpy array of positions (can contain duplicates)
+        :param delta: the value to add, a scalar or an array of the same length as pos
+        """
+
+        if np.isscalar(pos):
+            i = int(pos) + 1
+            while i <= self.size:
+                self.tree[i] += delta
+                i += i & -i
+            return
+
+        i = np.asarray(pos, dtype=np.int64) + 1
+        delta = np.broadcast_to(np.asarray(delta, dtype=self.dtype), i.shape)
+        while len(i):
+            np.add.at(self.tree, i, delta)
+            i = i + (i & -i)
+            in_range = i <= self.size
+            if not in_range.all():
+                i = i[in_range]
+                delta = delta[in_range]
+
+    def prefix_sum(self, pos):
+        """
+        sum of values at position [0, pos], pos is included
+
+        :param pos: a position or a numpy array of positions, -1 gives 0
+        :return: a scalar or a numpy array of prefix sums
+        """
+
+        if np.isscalar(pos):
+            i = int(pos) + 1
+            s = 0
+            while i > 0:
+                s += self.tree[i]
+                i &= i - 1
+            return s
+
+        i = np.asarray(pos, dtype=np.int64) + 1
+        s = np.zeros(i.shape, dtype=self.dtype)
+        while i.any():
+            s += self.tree[i]
+            i &= i - 1
+        return s
+
+    def range_sum(self, begin, end):
+        """
+        sum of values at position [begin, end)
+
+        :param begin: the first position (included)
+        :param end: the last position (not included)
+        :return: a scalar or a numpy array of range sums
+        """
+
+        return self.prefix_sum(np.subtract(end, 1)) - self.prefix_sum(np.subtract(begin, 1))
+
+    def total(self):
+        """
+        :return: the sum of all values
+        """
+        return self.prefix_sum(self.size - 1)
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return "FenwickTree of size {}".format(self.size)
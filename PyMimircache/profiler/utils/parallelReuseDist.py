@@ -0,0 +1,114 @@
+# coding=utf-8
+"""
+    exact reuse distance computed by multiple processes,
+    the result is the same as get_reuse_dist in profiler/utils/reuseDist
+
+    the trace is split into N contiguous chunks (byte ranges from reader.get_partitions if supported),
+    each worker computes the reuse distance of its chunk as if the chunk were the whole trace,
+    which is already exact for requests whose previous access is in the same chunk. The other requests are the first access of an object in the chunk,
+    they are resolved in a sequential merge phase:
+
+    the distinct objects accessed between the previous access of x (in an earlier chunk) and
+    the end of that chunk are exactly the objects whose last access in that chunk is after x,
+    so an earlier chunk can be replaced by its distinct objects ordered by last access,
+    and the objects accessed before the first access of x in the current chunk are the
+    distinct objects of the current chunk ordered by first access.
+    The merge feeds, for each chunk in order, its distinct objects in first-access order
+    (their reuse distance is the result) and then in last-access order (to get the recency right)
+    into one reuse distance engine, so the merge costs O(U log U) where U is the total number of
+    distinct objects of all chunks, which is much smaller than the trace length for most traces
+
+"""
+
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from PyMimircache.const import DEF_NUM_THREADS
+from PyMimircache.profiler.utils.reuseDist import ReuseDistEngine, DEF_RD_BLOCK_SIZE, \
+    iter_label_blocks, seek_req, get_reuse_dist
+
+
+# a chunk has at least this many requests, smaller traces are not worth the cost of processes
+DEF_RD_MIN_CHUNK_SIZE = 1 << 20
+
+
+def _get_chunk_reuse_dist(reader_class, reader_params, begin, end, block_size=DEF_RD_BLOCK_SIZE):
+    """
+    subprocess for computing the reuse distance of requests [begin, end) as if they were the whole trace
+
+    :param reader_class: the __class__ attribute of reader, this will be used to create local reader instance
+    :param reader_params: parameters for reader, used in creating local reader instance
+    :param begin: the first request of the chunk
+    :param end: the end (excluded) of the chunk
+    :param block_size: the number of requests processed together
+    :return: (local reuse distance, positions of first accesses in the chunk,
+                distinct labels in first-access order, distinct labels in last-access order)
+    """
+
+    process_reader = reader_class(**reader_params)
+    seek_req(process_reader, begin)
+
+    rd = np.empty(end - begin, dtype=np.int64)
+    labels = []
+    engine = ReuseDistEngine(block_size=block_size)
+    pos = 0
+    for block in iter_label_blocks(process_reader, min(block_size, end - begin)):
+        block = block[: end - begin - pos]
+        engine.feed(block, out=rd[pos: pos + len(block)])
+        labels.extend(block)
+        pos += len(block)
+        if pos == end - begin:
+            break
+    process_reader.close()
+    assert pos == end - begin, "read {} requests, but chunk has {} requests".format(pos, end - begin)
+
+    first_pos = np.flatnonzero(rd == -1)
+    first_labels = [labels[i] for i in first_pos]
+    last_labels = sorted(engine.last_access, key=engine.last_access.__getitem__)
+    return rd, first_pos, first_labels, last_labels
+
+
+def get_reuse_dist_parallel(reader, num_of_threads=DEF_NUM_THREADS,
+                            min_chunk_size=DEF_RD_MIN_CHUNK_SIZE, block_size=DEF_RD_BLOCK_SIZE):
+    """
+    compute the reuse distance of the whole trace with multiple processes,
+    if the trace is too small to be split, it falls back to the sequential get_reuse_dist
+
+    :param reader: reader for data input
+    :param num_of_threads: the max number of processes
+    :param min_chunk_size: the minimal number of requests in one chunk
+    :param block_size: the number of requests processed together
+    :return: a numpy int64 array of reuse distance, -1 for cold miss
+    """
+
+    num_of_req = reader.get_num_of_req()
+    num_of_chunks = min(num_of_threads, num_of_req // max(min_chunk_size, 1))
+    if num_of_chunks <= 1:
+        return get_reuse_dist(reader, block_size)
+
+    if getattr(reader, "support_partitions", False):
+        # each worker reads only its own byte range of the trace
+        partitions = reader.get_partitions(num_of_chunks)
+        bounds = [(first_req, first_req + n) for _, _, first_req, n in partitions]
+        tasks = [(reader.get_sub_reader_params(partition), 0, partition[3]) for partition in partitions]
+    else:
+        # wrapper readers (such as sampling) are recreated from get_params and seek to their chunk
+        chunk_size = int(math.ceil(num_of_req / num_of_chunks))
+        bounds = [(begin, min(begin + chunk_size, num_of_req)) for begin in range(0, num_of_req, chunk_size)]
+        reader_params = reader.get_params()
+        reader_params["open_c_reader"] = False
+        tasks = [(reader_params, begin, end) for begin, end in bounds]
+
+    rd = np.empty(num_of_req, dtype=np.int64)
+    engine = ReuseDistEngine(block_size=block_size)
+    with ProcessPoolExecutor(max_workers=num_of_chunks) as ppe:
+        futures = [ppe.submit(_get_chunk_reuse_dist, reader.__class__, reader_params, begin, end, block_size)
+                   for reader_params, begin, end in tasks]
+        # chunks must be merged in trace order
+        for (begin, end), future in zip(bounds, futures):
+            chunk_rd, first_pos, first_labels, last_labels = future.result()
+            rd[begin: end] = chunk_rd
+            rd[begin + first_pos] = engine.feed(first_labels)
+            engine.feed(last_labels)
+    reader.reset()
+    return rd
@@ -0,0 +1,102 @@
+# coding=utf-8
+"""
+    an index of cumulative reuse distance histograms at chosen breakpoints,
+    the hit count of requests in [bp_i, bp_j) is the histogram at bp_j minus the one at bp_i,
+    so the LRU hit ratio curve of any window along breakpoints is O(cache_size) instead of
+    a scan of the reuse distance of the window
+
+    the reuse distance is computed on the whole trace, so the result is the same as
+    slicing the reuse distance of the whole trace by [begin, end), the cache is warmed by
+    the requests before the window
+
+"""
+
+import numpy as np
+from PyMimircache.profiler.utils.reuseDist import get_hit_count_from_rd, get_hit_count_from_byte_rd, \
+    get_hit_ratio_from_hit_count
+
+
+class RDHistIndex:
+    """
+    cumulative hit count at breakpoints
+
+    """
+
+    def __init__(self, rd, breakpoints, cache_size, sizes=None):
+        """
+        build the index in one pass over the reuse distance
+
+        :param rd: a numpy array of reuse distance of the whole trace
+        :param breakpoints: a sorted list of request numbers, 0 and len(rd) are added if not included
+        :param cache_size: the max cache size of interest, the index uses O(len(breakpoints) * cache_size) memory
+        :param sizes: the size of requests, if given, rd is size-aware reuse distance
+        """
+
+        assert cache_size > 0, "cache size must be positive"
+        breakpoints = sorted(set(int(bp) for bp in breakpoints) | {0, len(rd)})
+        assert breakpoints[0] >= 0 and breakpoints[-1] <= len(rd), \
+            "breakpoints must be in [0, {}]".format(len(rd))
+        self.breakpoints = np.array(breakpoints, dtype=np.int64)
+        self.cache_size = cache_size
+        self.num_of_req = len(rd)
+        self._bp_index = {bp: i for i, bp in enumerate(breakpoints)}
+
+        # cum_hit_count[i] is the hit count of requests [0, breakpoints[i])
+        self.cum_hit_count = np.zeros((len(breakpoints), cache_size + 3), dtype=np.int64)
+        for i in range(1, len(breakpoints)):
+            begin, end = breakpoints[i - 1], breakpoints[i]
+            if sizes is None:
+                self.cum_hit_count[i] = get_hit_count_from_rd(rd[begin: end], cache_size)
+            else:
+                self.cum_hit_count[i] = get_hit_count_from_byte_rd(rd[begin: end], sizes[begin: end], cache_size)
+        np.cumsum(self.cum_hit_count, axis=0, out=self.cum_hit_count)
+
+    def has_window(self, begin, end):
+        """
+        :param begin: the first request (included)
+        :param end: the last request (not included)
+        :return: whether both begin and end are breakpoints
+        """
+        return begin in self._bp_index and end in self._bp_index
+
+    def get_hit_count(self, begin=0, end=-1, cache_size=-1):
+        """
+        hit count of requests in [begin, end), the layout is the same as get_hit_count_from_rd
+
+        :param begin: the first request (included), must be a breakpoint
+        :param end: the last request (not included), must be a breakpoint, -1 means the end of trace
+        :param cache_size: the max cache size, no larger than the cache size of the index,
+                    -1 means the cache size of the index
+        :return: a numpy int64 array of cache_size+3
+        """
+
+        if end == -1:
+            end = self.num_of_req
+        assert self.has_window(begin, end), "[{}, {}) is not a window along breakpoints".format(begin, end)
+        if cache_size == -1:
+            cache_size = self.cache_size
+        assert cache_size <= self.cache_size, \
+            "cache size {} is larger than the cache size of index {}".format(cache_size, self.cache_size)
+
+        diff = self.cum_hit_count[self._bp_index[end]] - self.cum_hit_count[self._bp_index[begin]]
+        if cache_size == self.cache_size:
+            return diff
+        hit_count = np.empty(cache_size + 3, dtype=np.int64)
+        hit_count[:cache_size + 1] = diff[:cache_size + 1]
+        hit_count[cache_size + 1] = np.sum(diff[cache_size + 1: self.cache_size + 2])
+        hit_count[cache_size + 2] = diff[self.cache_size + 2]
+        return hit_count
+
+    def get_hit_ratio(self, begin=0, end=-1, cache_size=-1):
+        """
+        hit ratio of requests in [begin, end)
+
+        :param begin: the first request (included), must be a breakpoint
+        :param end: the last request (not included), must be a breakpoint, -1 means the end of trace
+        :param cache_size: the max cache size, -1 means the cache size of the index
+        :return: a numpy array of cache_size+3, the layout is the same as get_hit_ratio_from_hit_count
+        """
+        return get_hit_ratio_from_hit_count(self.get_hit_count(begin, end, cache_size))
+
+    def __repr__(self):
+        return "RDHistIndex ({} breakpoints, cache size {})".format(len(self.breakpoints), self.cache_size)
@@ -0,0 +1,584 @@
+# coding=utf-8
+"""
+    this module computes LRU reuse distance (stack distance) in pure Python/numpy,
+    it is used when CMimircache is not available
+
+    the reuse distance of a request is the number of distinct objects accessed between
+    this request and the previous request to the same object, -1 if there is no previous request
+
+    the engine keeps a Fenwick tree over last-access timestamps, a timestamp is marked
+    if it is the most recent access of some object, so the reuse distance of a request is
+    the number of marks between the previous access and now. Requests are processed in blocks,
+    the Fenwick tree is only queried and updated once per block with numpy arrays,
+    and the interaction between requests inside one block is resolved with a vectorized counting.
+    When the timestamp space is used up, live timestamps are compacted,
+    so memory is bounded by the number of unique objects, not the length of the trace.
+
+    with size, each mark is weighted by the size of the object, so the reuse distance becomes
+    the total size of distinct objects accessed between this request and the previous request
+    to the same object, object size is assumed to be fixed, if it changes,
+    the size of one of its requests in between is used
+
+"""
+
+import numpy as np
+from PyMimircache.profiler.utils.fenwick import FenwickTree
+
+
+# the number of requests processed together
+DEF_RD_BLOCK_SIZE = 65536
+# the minimal number of timestamps in the Fenwick tree
+DEF_RD_MIN_CAPACITY = 1 << 20
+
+
+def count_smaller_before(values, weights=None):
+    """
+    for each position i, count the number of positions k < i with values[k] < values[i],
+    this uses a vectorized bottom-up merge which is O(Nlog^2N) in numpy
+
+    :param values: a numpy array of integers
+    :param weights: an optional numpy int64 array, if given, sum weights[k] instead of counting k
+    :return: a numpy int64 array of counts
+    """
+
+    n = len(values)
+    counts = np.zeros(n, dtype=np.int64)
+    if n < 2:
+        return counts
+
+    # dense ranks keep the keys small, ties get the same rank so they are not counted
+    ranks = np.unique(values, return_inverse=True)[1].astype(np.int64).reshape(-1)
+    span = n + 1
+    pos = np.arange(n, dtype=np.int64)
+    width = 1
+    while width < n:
+        group = pos // (2 * width)
+        in_right = ((pos // width) & 1).astype(bool)
+        in_left = ~in_right
+        left_keys = group[in_left] * span + ranks[in_left]
+        right_base = group[in_right] * span
+        if weights is None:
+            left_keys.sort()
+            counts[in_right] += np.searchsorted(left_keys, right_base + ranks[in_right], side="left") - \
+                                np.searchsorted(left_keys, right_base, side="left")
+        else:
+            order = np.argsort(left_keys, kind="stable")
+            left_keys = left_keys[order]
+            cum_weights = np.zeros(len(left_keys) + 1, dtype=np.int64)
+            np.cumsum(weights[in_left][order], out=cum_weights[1:])
+            upper = np.searchsorted(left_keys, right_base + ranks[in_right], side="left")
+            lower = np.searchsorted(left_keys, right_base, side="left")
+            counts[in_right] += cum_weights[upper] - cum_weights[lower]
+        width *= 2
+    return counts
+
+
+class ReuseDistEngine:
+    """
+    a streaming reuse distance engine, labels are fed in arbitrary sized chunks,
+    the engine keeps the recency information of all objects it has seen
+
+    """
+
+    def __init__(self, block_size=DEF_RD_BLOCK_SIZE, min_capacity=DEF_RD_MIN_CAPACITY, with_size=False):
+        """
+        :param block_size: the number of requests processed together
+        :param min_capacity: the minimal number of timestamps in the Fenwick tree
+        :param with_size: whether requests come with size, if True, reuse distance is the total size
+                    of distinct objects, and sizes must be given in feed
+        """
+
+        self.block_size = block_size
+        self.min_capacity = min_capacity
+        self.with_size = with_size
+        # object -> the timestamp of its last access
+        self.last_access = {}
+        # the timestamp of the next request, it is reset when timestamps are compacted
+        self.ts = 0
+        # the number of requests processed
+        self.num_of_req = 0
+        self.fenwick = FenwickTree(min_capacity)
+        # timestamp -> request number, used for the absolute distance to last access
+        self.ts_to_req = np.zeros(min_capacity, dtype=np.int64)
+        # timestamp -> object size and the total size of all marks, only used with size
+        self.ts_to_size = np.zeros(min_capacity, dtype=np.int64) if with_size else None
+        self.total_size = 0
+
+    def feed(self, labels, out=None, out_dist=None, sizes=None):
+        """
+        compute the reuse distance of the given requests, which follow the requests fed before
+
+        :param labels: a list (or numpy array) of request labels
+        :param out: an optional pre-allocated int64 array of len(labels) for the result,
+                    it can be a view, for example a reversed slice of a larger array
+        :param out_dist: an optional pre-allocated int64 array of len(labels),
+                    if given, the absolute distance to last access (-1 if none) is written into it
+        :param sizes: the size of each request, required if the engine is created with_size
+        :return: a numpy int64 array of reuse distance, -1 for cold miss
+        """
+
+        n = len(labels)
+        if out is None:
+            out = np.empty(n, dtype=np.int64)
+        assert len(out) == n, "out has length {}, but {} labels are given".format(len(out), n)
+        assert out_dist is None or len(out_dist) == n, \
+            "out_dist has length {}, but {} labels are given".format(len(out_dist), n)
+        assert (sizes is not None) == self.with_size, \
+            "sizes must be given if and only if the engine is created with_size"
+        if sizes is not None:
+            sizes = np.asarray(sizes, dtype=np.int64)
+            assert len(sizes) == n, "{} sizes are given for {} labels".format(len(sizes), n)
+
+        for begin in range(0, n, self.block_size):
+            end = min(begin + self.block_size, n)
+            out[begin:end] = self._feed_block(labels[begin:end],
+                                              None if out_dist is None else out_dist[begin:end],
+                                              None if sizes is None else sizes[begin:end])
+        return out
+
+    def _feed_block(self, labels, out_dist=None, sizes=None):
+        """
+        compute the reuse distance of one block of requests
+
+        :param labels: the labels of the block
+        :param out_dist: if not None, the absolute distance to last access is written into it
+        :param sizes: a numpy int64 array of request size, None for counting objects
+        :return: a numpy int64 array of reuse distance
+        """
+
+        n = len(labels)
+        self._ensure_capacity(n)
+        block_start = self.ts
+
+        # the timestamp of previous access of each request
+        prev = np.empty(n, dtype=np.int64)
+        last_access = self.last_access
+        num_of_marks = len(last_access)
+        get = last_access.get
+        ts = block_start
+        for i, label in enumerate(labels):
+            prev[i] = get(label, -1)
+            last_access[label] = ts
+            ts += 1
+
+        reused = prev != -1
+        before_block = reused & (prev < block_start)
+        in_block = reused & ~before_block
+
+        # rd[i] = (marks in (prev[i], block_start) at the beginning of block)
+        #           + #{block_start <= k < i, prev[k] < prev[i]}
+        #           - #{block_start <= k <= prev[i]}
+        # the second term counts the objects first seen in the window after block_start,
+        # the third term removes the positions before prev[i] when prev[i] is inside the block
+        # with size, every term sums the size of the objects instead of counting them
+        prev_before_block = prev[before_block]
+        if sizes is None:
+            rd = count_smaller_before(prev)
+            rd -= np.maximum(prev - block_start + 1, 0)
+            rd[before_block] += num_of_marks - self.fenwick.prefix_sum(prev_before_block)
+        else:
+            rd = count_smaller_before(prev, sizes)
+            cum_sizes = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(sizes, out=cum_sizes[1:])
+            rd -= cum_sizes[np.clip(prev - block_start + 1, 0, n)]
+            rd[before_block] += self.total_size - self.fenwick.prefix_sum(prev_before_block)
+        rd[~reused] = -1
+
+        req_ids = np.arange(self.num_of_req, self.num_of_req + n, dtype=np.int64)
+        self.ts_to_req[block_start: block_start + n] = req_ids
+        if out_dist is not None:
+            out_dist[:] = np.where(reused, req_ids - self.ts_to_req[prev], -1)
+
+        # move the marks of objects accessed in this block to their last access in the block
+        is_last = np.ones(n, dtype=bool)
+        is_last[prev[in_block] - block_start] = False
+        last_pos = np.flatnonzero(is_last)
+        if sizes is None:
+            self.fenwick.add(prev_before_block, -1)
+            self.fenwick.add(last_pos + block_start, 1)
+        else:
+            old_sizes = self.ts_to_size[prev_before_block]
+            self.ts_to_size[block_start: block_start + n] = sizes
+            self.fenwick.add(prev_before_block, -old_sizes)
+            self.fenwick.add(last_pos + block_start, sizes[last_pos])
+            self.total_size += int(np.sum(sizes[last_pos])) - int(np.sum(old_sizes))
+
+        self.ts += n
+        self.num_of_req += n
+        return rd
+
+    def _ensure_capacity(self, n):
+        """
+        make sure there are n free timestamps in the Fenwick tree,
+        if not, renumber the last access timestamps to 0 ~ num_of_obj-1 and rebuild the tree
+
+        :param n: the number of timestamps needed
+        """
+
+        if self.ts + n <= self.fenwick.size:
+            return
+
+        num_of_obj = len(self.last_access)
+        old_ts = np.fromiter(self.last_access.values(), dtype=np.int64, count=num_of_obj)
+        order = np.argsort(old_ts)
+        new_ts = np.empty(num_of_obj, dtype=np.int64)
+        new_ts[order] = np.arange(num_of_obj, dtype=np.int64)
+        self.last_access = dict(zip(self.last_access.keys(), new_ts.tolist()))
+
+        capacity = max(self.min_capacity, 2 * (num_of_obj + n))
+        live_ts = old_ts[order]
+        ts_to_req = np.zeros(capacity, dtype=np.int64)
+        ts_to_req[:num_of_obj] = self.ts_to_req[live_ts]
+        self.ts_to_req = ts_to_req
+        if self.with_size:
+            ts_to_size = np.zeros(capacity, dtype=np.int64)
+            ts_to_size[:num_of_obj] = self.ts_to_size[live_ts]
+            self.ts_to_size = ts_to_size
+            self.fenwick = FenwickTree.from_array(ts_to_size[:num_of_obj], size=capacity)
+        else:
+            self.fenwick = FenwickTree.from_array(np.ones(num_of_obj, dtype=np.int64), size=capacity)
+        self.ts = num_of_obj
+
+    def remove(self, labels):
+        """
+        forget the given objects, as if they have never been accessed,
+        the reuse distance of later requests no longer counts them,
+        this is used by sampling which drops objects from the sample set
+
+        :param labels: a list of labels that have been fed before
+        """
+
+        pos = np.array([self.last_access.pop(label) for label in labels], dtype=np.int64)
+        if len(pos) == 0:
+            return
+        if self.with_size:
+            sizes = self.ts_to_size[pos]
+            self.fenwick.add(pos, -sizes)
+            self.total_size -= int(np.sum(sizes))
+        else:
+            self.fenwick.add(pos, -1)
+
+    def get_state(self):
+        """
+        the recency state of the engine, which is all it needs to continue,
+        it is used for checkpointing, sizes are not included
+
+        :return: (labels, req_ids), the labels of all objects from the least recently accessed
+                    to the most recently accessed, and the request number of their last access
+        """
+
+        assert not self.with_size, "the state of an engine with size is not supported"
+        labels = sorted(self.last_access, key=self.last_access.__getitem__)
+        ts = np.fromiter((self.last_access[label] for label in labels), dtype=np.int64, count=len(labels))
+        return labels, self.ts_to_req[ts].copy()
+
+    @classmethod
+    def from_state(cls, labels, req_ids, num_of_req, block_size=DEF_RD_BLOCK_SIZE,
+                   min_capacity=DEF_RD_MIN_CAPACITY):
+        """
+        create an engine from the state returned by get_state
+
+        :param labels: the labels of all objects from the least recently accessed to the most recently accessed
+        :param req_ids: the request number of the last access of each object
+        :param num_of_req: the number of requests processed
+        :param block_size: the number of requests processed together
+        :param min_capacity: the minimal number of timestamps in the Fenwick tree
+        :return: a ReuseDistEngine
+        """
+
+        num_of_obj = len(labels)
+        assert len(req_ids) == num_of_obj, "{} labels, but {} request ids".format(num_of_obj, len(req_ids))
+        engine = cls(block_size=block_size, min_capacity=min_capacity)
+        capacity = max(min_capacity, 2 * num_of_obj)
+        engine.last_access = dict(zip(labels, range(num_of_obj)))
+        assert len(engine.last_access) == num_of_obj, "labels are not unique"
+        engine.fenwick = FenwickTree.from_array(np.ones(num_of_obj, dtype=np.int64), size=capacity)
+        engine.ts_to_req = np.zeros(capacity, dtype=np.int64)
+        engine.ts_to_req[:num_of_obj] = req_ids
+        engine.ts = num_of_obj
+        engine.num_of_req = num_of_req
+        return engine
+
+    def get_num_of_uniq_obj(self):
+        """
+        :return: the number of unique objects seen so far
+        """
+        return len(self.last_access)
+
+    def __repr__(self):
+        return "ReuseDistEngine ({} requests, {} objects)".format(self.num_of_req, len(self.last_access))
+
+
+def iter_label_blocks(reader, block_size=DEF_RD_BLOCK_SIZE):
+    """
+    read labels from reader from current position, block by block
+
+    :param reader: reader for data input
+    :param block_size: the max number of labels in one block
+    :return: a generator of lists of labels
+    """
+
+    # binary readers read a block of records in one call
+    if hasattr(reader, "iter_batches"):
+        for batch in reader.iter_batches(block_size):
+            yield batch["label"].tolist()
+        return
+
+    read_one_req = reader.read_one_req
+    while True:
+        block = []
+        append = block.append
+        for _ in range(block_size):
+            req = read_one_req()
+            if req is None:
+                break
+            append(req)
+        if block:
+            yield block
+        if len(block) < block_size:
+            break
+
+
+def iter_label_blocks_reversed(reader, block_size=DEF_RD_BLOCK_SIZE):
+    """
+    read labels from the end of trace to the beginning, block by block,
+    binary traces are read backward directly, other traces are first encoded into
+    a compact int64 array of object ids in one forward pass, which is then walked backward
+
+    :param reader: reader for data input
+    :param block_size: the max number of labels in one block
+    :return: a generator of (begin, labels), labels are the requests [begin, begin+len(labels))
+                in reversed order
+    """
+
+    num_of_req = reader.get_num_of_req()
+    if getattr(reader, "record_size", 0) > 0:
+        for end in range(num_of_req, 0, -block_size):
+            begin = max(end - block_size, 0)
+            reader.reset()
+            reader.skip_n_req(begin)
+            if hasattr(reader, "read_batch"):
+                block = reader.read_batch(end - begin)["label"][::-1].tolist()
+            else:
+                block = [reader.read_one_req() for _ in range(end - begin)]
+                block.reverse()
+            yield begin, block
+    else:
+        obj_ids = np.empty(num_of_req, dtype=np.int64)
+        obj_id_dict = {}
+        reader.reset()
+        pos = 0
+        for block in iter_label_blocks(reader, block_size):
+            setdefault = obj_id_dict.setdefault
+            obj_ids[pos: pos + len(block)] = [setdefault(req, len(obj_id_dict)) for req in block]
+            pos += len(block)
+        del obj_id_dict
+        for end in range(num_of_req, 0, -block_size):
+            begin = max(end - block_size, 0)
+            yield begin, obj_ids[begin: end][::-1].tolist()
+    reader.reset()
+
+
+def iter_size_blocks(reader, block_unit_size=1, block_size=DEF_RD_BLOCK_SIZE):
+    """
+    read labels and sizes from reader from current position, block by block,
+    the size is converted into the number of block units, which is at least 1
+
+    :param reader: reader for data input, it must support read_size_req
+    :param block_unit_size: the size of one unit, 1 means the size is in bytes
+    :param block_size: the max number of requests in one block
+    :return: a generator of (labels, sizes), labels is a list and sizes is a numpy int64 array
+    """
+
+    if hasattr(reader, "iter_batches"):
+        assert getattr(reader, "size_column", -1) != -1, "you need to provide size in order to use this function"
+        for batch in reader.iter_batches(block_size):
+            sizes = batch["size"].astype(np.int64)
+            if block_unit_size != 1:
+                sizes = (sizes + block_unit_size - 1) // block_unit_size
+            yield batch["label"].tolist(), np.maximum(sizes, 1)
+        return
+
+    read_size_req = reader.read_size_req
+    while True:
+        labels, sizes = [], []
+        for _ in range(block_size):
+            req = read_size_req()
+            if req is None:
+                break
+            labels.append(req[0])
+            sizes.append(req[1])
+        if labels:
+            sizes = np.array(sizes, dtype=np.int64)
+            if block_unit_size != 1:
+                sizes = (sizes + block_unit_size - 1) // block_unit_size
+            yield labels, np.maximum(sizes, 1)
+        if len(labels) < block_size:
+            break
+
+
+def seek_req(reader, n):
+    """
+    reset reader and move it to the n-th request, binary traces and text traces with
+    an offset index seek directly, other traces read and drop the first n requests
+
+    :param reader: reader for data input
+    :param n: the number of requests before the new position
+    :return: the number of requests skipped, smaller than n if the trace is shorter
+    """
+
+    reader.reset()
+    if getattr(reader, "record_size", 0) > 0 or getattr(reader, "use_offset_index", False):
+        n = min(n, reader.get_num_of_req())
+        reader.reset()
+        reader.skip_n_req(n)
+        return n
+    read_one_req = reader.read_one_req
+    for i in range(n):
+        if read_one_req() is None:
+            return i
+    return n
+
+
+def get_reuse_dist(reader, block_size=DEF_RD_BLOCK_SIZE):
+    """
+    compute the reuse distance of the whole trace
+
+    :param reader: reader for data input
+    :param block_size: the number of requests processed together
+    :return: a numpy int64 array of reuse distance, -1 for cold miss
+    """
+
+    reader.reset()
+    num_of_req = reader.get_num_of_req()
+    rd = np.empty(num_of_req, dtype=np.int64)
+    engine = ReuseDistEngine(block_size=block_size)
+    pos = 0
+    for block in iter_label_blocks(reader, block_size):
+        engine.feed(block, out=rd[pos: pos + len(block)])
+        pos += len(block)
+    reader.reset()
+    assert pos == num_of_req, "read {} requests, but trace has {} requests".format(pos, num_of_req)
+    return rd
+
+
+def get_future_reuse_dist(reader, next_access_dist=None, block_size=DEF_RD_BLOCK_SIZE):
+    """
+    compute the future (forward) reuse distance of the whole trace in a single reverse pass,
+    the future reuse distance of a request is the reuse distance of the next request to the same object
+
+    :param reader: reader for data input
+    :param next_access_dist: an optional pre-allocated int64 array of trace length,
+                if given, the absolute distance to next access (-1 if none) is written into it
+    :param block_size: the number of requests processed together
+    :return: a numpy int64 array of future reuse distance, -1 if there is no next access
+    """
+
+    num_of_req = reader.get_num_of_req()
+    frd = np.empty(num_of_req, dtype=np.int64)
+    assert next_access_dist is None or len(next_access_dist) == num_of_req, \
+        "next_access_dist has length {}, trace has {} requests".format(len(next_access_dist), num_of_req)
+
+    engine = ReuseDistEngine(block_size=block_size)
+    for begin, block in iter_label_blocks_reversed(reader, block_size):
+        end = begin + len(block)
+        # a reversed view, so the engine writes the result of the reversed trace in forward order
+        out_dist = None
+        if next_access_dist is not None:
+            out_dist = next_access_dist[begin: end][::-1]
+        engine.feed(block, out=frd[begin: end][::-1], out_dist=out_dist)
+    return frd
+
+
+def get_byte_reuse_dist(reader, block_unit_size=1, block_size=DEF_RD_BLOCK_SIZE):
+    """
+    compute the size-aware reuse distance of the whole trace, which is the total size
+    (in block units) of distinct objects accessed between a request and the previous request to the same object
+
+    :param reader: reader for data input, it must support read_size_req
+    :param block_unit_size: the size of one unit, 1 means bytes
+    :param block_size: the number of requests processed together
+    :return: (rd, sizes), rd is a numpy int64 array, -1 for cold miss,
+                sizes is a numpy int64 array of request size in block units
+    """
+
+    reader.reset()
+    num_of_req = reader.get_num_of_req()
+    rd = np.empty(num_of_req, dtype=np.int64)
+    sizes = np.empty(num_of_req, dtype=np.int64)
+    engine = ReuseDistEngine(block_size=block_size, with_size=True)
+    pos = 0
+    for labels, block_sizes in iter_size_blocks(reader, block_unit_size, block_size):
+        engine.feed(labels, out=rd[pos: pos + len(labels)], sizes=block_sizes)
+        sizes[pos: pos + len(labels)] = block_sizes
+        pos += len(labels)
+    reader.reset()
+    assert pos == num_of_req, "read {} requests, but trace has {} requests".format(pos, num_of_req)
+    return rd, sizes
+
+
+def get_hit_count_from_rd(rd, cache_size):
+    """
+    transform reuse distance into hit count, the layout is the same as CMimircache,
+    0~cache_size(included) are for counting hits at size 0~cache_size (rd=size-1),
+    cache_size+1 is out of range, cache_size+2 is cold miss, so total is cache_size+3 buckets
+
+    :param rd: a numpy array of reuse distance
+    :param cache_size: the max cache size
+    :return: a numpy int64 array of hit count
+    """
+
+    hit_count = np.zeros(cache_size + 3, dtype=np.longlong)
+    rd = np.asarray(rd)
+    cold = rd == -1
+    in_range = (rd < cache_size) & ~cold
+    hit_count[:cache_size + 1] = np.bincount(rd[in_range] + 1, minlength=cache_size + 1)
+    hit_count[cache_size + 2] = np.count_nonzero(cold)
+    hit_count[cache_size + 1] = len(rd) - hit_count[cache_size + 2] - np.count_nonzero(in_range)
+    return hit_count
+
+
+def get_hit_count_from_byte_rd(rd, sizes, cache_size, byte_hit=False):
+    """
+    transform size-aware reuse distance into hit count, the layout is the same as get_hit_count_from_rd,
+    but cache size is in block units, a request hits in a cache of size rd+size or larger
+
+    :param rd: a numpy array of size-aware reuse distance
+    :param sizes: a numpy array of request size in block units
+    :param cache_size: the max cache size in block units
+    :param byte_hit: if True, count the size of hit requests instead of the number of them
+    :return: a numpy int64 array of hit count (or hit size)
+    """
+
+    hit_count = np.zeros(cache_size + 3, dtype=np.longlong)
+    rd = np.asarray(rd)
+    sizes = np.asarray(sizes)
+    cold = rd == -1
+    stack_dist = rd + sizes
+    in_range = (stack_dist <= cache_size) & ~cold
+    weights = sizes if byte_hit else np.ones(len(rd), dtype=np.int64)
+    hit_count[:cache_size + 1] = np.bincount(stack_dist[in_range], weights=weights[in_range],
+                                             minlength=cache_size + 1)
+    hit_count[cache_size + 2] = np.sum(weights[cold])
+    hit_count[cache_size + 1] = np.sum(weights) - hit_count[cache_size + 2] - np.sum(weights[in_range])
+    return hit_count
+
+
+def get_hit_ratio_from_hit_count(hit_count, num_of_req=-1):
+    """
+    transform hit count into hit ratio, 0~cache_size is the hit ratio of size 0~cache_size,
+    cache_size+1 is the ratio of out of range, cache_size+2 is cold miss ratio
+
+    :param hit_count: hit count in the layout of get_hit_count_from_rd
+    :param num_of_req: the number of requests, -1 means the sum of hit_count
+    :return: a numpy double array of hit ratio
+    """
+
+    if num_of_req == -1:
+        num_of_req = int(np.sum(hit_count))
+    hit_ratio = np.zeros(len(hit_count), dtype=np.double)
+    if num_of_req == 0:
+        return hit_ratio
+    hit_ratio[:-2] = np.cumsum(hit_count[:-2]) / num_of_req
+    hit_ratio[-2:] = hit_count[-2:] / num_of_req
+    return hit_ratio
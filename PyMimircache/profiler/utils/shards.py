@@ -0,0 +1,200 @@
+# coding=utf-8
+"""
+    SHARDS (Spatially Hashed Approximate Reuse Distance Sampling, Waldspurger et al. FAST'15),
+    it estimates the LRU hit ratio curve from a spatially hashed sample of objects
+
+    an object is sampled if hash(label) < T, the sampled requests are fed into a reuse distance engine,
+    the reuse distance of a sampled request is scaled by 1/R (R = T/HASH_MODULUS) and counted with weight 1/R
+
+    fixed-rate mode uses a constant R, and the first histogram bucket is adjusted by the difference between
+    the expected number of sampled requests (N1 = N * R) and the actual number (N2),
+    which removes most of the error caused by a few very hot objects being sampled or not
+
+    fixed-size mode bounds the number of tracked objects by sample_size, when it is exceeded,
+    objects with the largest hash value are dropped and T is lowered to that hash value,
+    so memory is constant no matter how long the trace is, the N1/N2 correction is also applied
+    with each sampled request weighted by the ratio at the time it is sampled
+
+"""
+
+import heapq
+import numpy as np
+from PyMimircache.utils.hashing import HASH_MODULUS, spatial_hash_many, ratio_to_threshold
+from PyMimircache.profiler.utils.reuseDist import ReuseDistEngine, DEF_RD_BLOCK_SIZE, \
+    iter_label_blocks, get_hit_ratio_from_hit_count
+
+
+class Shards:
+    """
+    a streaming SHARDS sampler, labels of all requests are fed in arbitrary sized chunks
+
+    """
+
+    def __init__(self, sample_ratio=0.01, sample_size=-1, cache_size=-1, block_size=DEF_RD_BLOCK_SIZE):
+        """
+        :param sample_ratio: the sampling ratio, in fixed-size mode, it is the initial sampling ratio
+        :param sample_size: the max number of tracked objects, -1 means fixed-rate mode
+        :param cache_size: the max cache size of interest, larger distances are only counted as out of range,
+                    -1 means no limit
+        :param block_size: the number of sampled requests processed together
+        """
+
+        assert sample_size == -1 or sample_size > 0, "sample size must be positive, given {}".format(sample_size)
+        self.threshold = ratio_to_threshold(sample_ratio)
+        self.sample_size = sample_size
+        self.cache_size = cache_size
+        self.block_size = block_size
+        if sample_size != -1:
+            self.block_size = max(min(block_size, sample_size), 1)
+
+        self.engine = ReuseDistEngine(block_size=self.block_size)
+        # the number of all requests and sampled requests fed so far
+        self.num_of_req = 0
+        self.num_of_sampled_req = 0
+        # the sum of weight (1/R) of sampled requests, it is num_of_sampled_req/R in fixed-rate mode
+        self.num_of_weighted_req = 0.0
+
+        # estimated hit count (in the unit of full trace) of scaled reuse distance 0, 1, 2 ...
+        self.hist = np.zeros(1, dtype=np.double)
+        self.num_of_out_of_range = 0.0
+        self.num_of_cold_miss = 0.0
+        # max heap of (-hash, label) of tracked objects, only used in fixed-size mode
+        self.obj_heap = []
+
+    @property
+    def sample_ratio(self):
+        """
+        :return: the current sampling ratio
+        """
+        return self.threshold / HASH_MODULUS
+
+    def feed(self, labels):
+        """
+        feed the labels of requests, which follow the requests fed before
+
+        :param labels: a list of request labels
+        """
+
+        self.num_of_req += len(labels)
+        sampled = [(label, h) for label, h in zip(labels, spatial_hash_many(labels)) if h < self.threshold]
+        for begin in range(0, len(sampled), self.block_size):
+            chunk = sampled[begin: begin + self.block_size]
+            if begin and self.sample_size != -1:
+                # the threshold may be lowered by previous chunk
+                chunk = [x for x in chunk if x[1] < self.threshold]
+            if chunk:
+                self._feed_sampled(chunk)
+
+    def _feed_sampled(self, chunk):
+        """
+        feed a chunk of sampled requests into the reuse distance engine and update histogram
+
+        :param chunk: a list of (label, hash)
+        """
+
+        labels = [label for label, _ in chunk]
+        rd = self.engine.feed(labels)
+        self.num_of_sampled_req += len(labels)
+        # each sampled request stands for 1/R requests, counting with the weight of the current ratio
+        # is equivalent to rescaling the histogram every time the ratio is lowered
+        weight = HASH_MODULUS / self.threshold
+        self.num_of_weighted_req += len(labels) * weight
+
+        cold = rd == -1
+        self.num_of_cold_miss += np.count_nonzero(cold) * weight
+        scaled_rd = rd[~cold] * HASH_MODULUS // self.threshold
+        if self.cache_size != -1:
+            out_of_range = scaled_rd >= self.cache_size
+            self.num_of_out_of_range += np.count_nonzero(out_of_range) * weight
+            scaled_rd = scaled_rd[~out_of_range]
+        if len(scaled_rd):
+            counts = np.bincount(scaled_rd)
+            if len(counts) > len(self.hist):
+                hist = np.zeros(max(len(counts), 2 * len(self.hist)), dtype=np.double)
+                hist[:len(self.hist)] = self.hist
+                self.hist = hist
+            self.hist[:len(counts)] += counts * weight
+
+        if self.sample_size != -1:
+            for (label, h), is_cold in zip(chunk, cold.tolist()):
+                if is_cold:
+                    heapq.heappush(self.obj_heap, (-h, label))
+            self._adjust_threshold()
+
+    def _adjust_threshold(self):
+        """
+        drop the objects with the largest hash value until at most sample_size objects are tracked,
+        and lower the threshold to the largest dropped hash value
+        """
+
+        obj_heap = self.obj_heap
+        while len(obj_heap) > self.sample_size:
+            h = -obj_heap[0][0]
+            evicted = []
+            while obj_heap and -obj_heap[0][0] == h:
+                evicted.append(heapq.heappop(obj_heap)[1])
+            self.engine.remove(evicted)
+            self.threshold = h
+
+    def get_hit_count(self, cache_size=-1):
+        """
+        the estimated hit count of the full trace, the layout is the same as get_hit_count_from_rd,
+        0~cache_size(included) are for counting hits at size 0~cache_size,
+        cache_size+1 is out of range, cache_size+2 is cold miss
+
+        :param cache_size: the max cache size, -1 means the cache size given at initialization,
+                    or the number of requests if it is not given either
+        :return: a numpy double array of estimated hit count
+        """
+
+        if cache_size == -1:
+            cache_size = self.cache_size if self.cache_size != -1 else self.num_of_req
+        assert self.cache_size == -1 or cache_size <= self.cache_size, \
+            "cache size {} is larger than the profiled cache size {}".format(cache_size, self.cache_size)
+
+        hist = self.hist.copy()
+        # N1/N2 correction, expected minus actual number of sampled requests, in the unit of full trace
+        hist[0] = max(hist[0] + self.num_of_req - self.num_of_weighted_req, 0)
+
+        hit_count = np.zeros(cache_size + 3, dtype=np.double)
+        n = min(cache_size, len(hist))
+        hit_count[1: n + 1] = hist[:n]
+        hit_count[cache_size + 1] = np.sum(hist[n:]) + self.num_of_out_of_range
+        hit_count[cache_size + 2] = self.num_of_cold_miss
+        return hit_count
+
+    def get_hit_ratio(self, cache_size=-1):
+        """
+        the estimated hit ratio, 0~cache_size is the hit ratio of size 0~cache_size,
+        cache_size+1 is the ratio of out of range, cache_size+2 is cold miss ratio
+
+        :param cache_size: the max cache size, same as get_hit_count
+        :return: a numpy double array of estimated hit ratio
+        """
+
+        hit_count = self.get_hit_count(cache_size)
+        return get_hit_ratio_from_hit_count(hit_count, num_of_req=np.sum(hit_count))
+
+    def __repr__(self):
+        return "Shards (ratio {:.6f}, {} requests, {} sampled, {} objects tracked)".format(
+            self.sample_ratio, self.num_of_req, self.num_of_sampled_req, self.engine.get_num_of_uniq_obj())
+
+
+def get_hit_ratio_shards(reader, sample_ratio=0.01, sample_size=-1, cache_size=-1, block_size=DEF_RD_BLOCK_SIZE):
+    """
+    estimate the LRU hit ratio curve of the whole trace using SHARDS
+
+    :param reader: reader for data input
+    :param sample_ratio: the sampling ratio, in fixed-size mode, it is the initial sampling ratio
+    :param sample_size: the max number of tracked objects, -1 means fixed-rate mode
+    :param cache_size: the max cache size, -1 means the number of requests
+    :param block_size: the number of requests read together
+    :return: a numpy double array of cache_size+3 estimated hit ratio
+    """
+
+    shards = Shards(sample_ratio=sample_ratio, sample_size=sample_size, cache_size=cache_size)
+    reader.reset()
+    for block in iter_label_blocks(reader, block_size):
+        shards.feed(block)
+    reader.reset()
+    return shards.get_hit_ratio()
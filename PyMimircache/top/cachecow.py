@@ -22,9 +22,11 @@ if ALLOW_C_MIMIRCACHE and not INSTALL_PHASE:
     from PyMimircache.profiler.cHeatmap import CHeatmap as CHeatmap
     from PyMimircache.profiler.pyGeneralProfiler import PyGeneralProfiler as PyGeneralProfiler
 else:
+    from PyMimircache.profiler.pyLRUProfiler import PyLRUProfiler as LRUProfiler
     from PyMimircache.profiler.pyGeneralProfiler import PyGeneralProfiler as PyGeneralProfiler
     from PyMimircache.profiler.pyHeatmap import PyHeatmap as PyHeatmap
 
+from PyMimircache.profiler.counterStacksProfiler import CounterStacksProfiler
 from PyMimircache.profiler.profilerUtils import draw_heatmap
 try:
     from PyMimircache.profiler.twoDPlots import *
@@ -39,6 +41,7 @@ from PyMimircache.cacheReader.binaryReader import BinaryReader
 from PyMimircache.cacheReader.csvReader import CsvReader
 from PyMimircache.cacheReader.plainReader import PlainReader
 from PyMimircache.cacheReader.vscsiReader import VscsiReader
+from PyMimircache.cacheReader.encodedReader import EncodedReader
 
 from PyMimircache.cacheReader.traceStat import TraceStat
 from multiprocessing import cpu_count
@@ -54,6 +57,7 @@ class Cachecow:
            "csv",
            "vscsi",
            "binary",
+           "encode",
            "stat",
            "num_of_req",
            "num_of_uniq_req",
@@ -214,6 +218,23 @@ class Cachecow:
         self.reader = VscsiReader(file_path, block_unit_size=block_unit_size, **kwargs)
         return self.reader
 
+    def encode(self, file_path=None, id_fmt="q", **kwargs):
+        """
+        encode the labels of opened trace into dense int ids and switch to the encoded trace,
+        the encoded trace is reused if it is already encoded and the trace has not changed since then,
+        use reader.get_label or reader.decode to get the original labels
+
+        :param file_path: the path to the encoded trace, default <trace>.encoded
+        :param id_fmt: the struct format of id, i/I for 32-bit, q/Q for 64-bit
+        :return: reader object
+        """
+
+        assert self.reader is not None, "you haven't opened a trace yet"
+        reader = EncodedReader.from_reader(self.reader, file_loc=file_path, id_fmt=id_fmt, **kwargs)
+        self.reader.close()
+        self.reader = reader
+        return self.reader
+
 
     def reset(self):
         """
@@ -322,7 +343,7 @@ class Cachecow:
                           bin_size=bin_size,
                           use_general_profiler=use_general_profiler, **kwargs)
         hc = p.get_hit_count(cache_size=cache_size)
-        if isinstance(p, LRUProfiler):
+        if isinstance(p, LRUProfiler) or isinstance(p, CounterStacksProfiler):
             for i in range(len(hc)-2):
                 hit_count_dict[i] = hc[i]
         elif isinstance(p, CGeneralProfiler) or isinstance(p, PyGeneralProfiler):
@@ -356,7 +377,7 @@ class Cachecow:
                           bin_size=bin_size,
                           use_general_profiler=use_general_profiler, **kwargs)
         hr = p.get_hit_ratio(cache_size=cache_size)
-        if isinstance(p, LRUProfiler):
+        if isinstance(p, LRUProfiler) or isinstance(p, CounterStacksProfiler):
             for i in range(len(hr)-2):
                 hit_ratio_dict[i] = hr[i]
         elif isinstance(p, CGeneralProfiler) or isinstance(p, PyGeneralProfiler):
@@ -381,7 +402,9 @@ class Cachecow:
                                         Note: LRUProfiler does not require cache_size/bin_size params,
                                         it does not sample thus provides a smooth curve, however, it is O(logN) at each step,
                                         in constrast, cGeneralProfiler samples the curve, but use O(1) at each step
-        :param kwargs: num_of_threads
+        :param kwargs: num_of_threads, use_counter_stacks (LRU only, return an approximate CounterStacksProfiler,
+                        which uses little memory on very large traces), counter_stacks_params (a dict of
+                        interval, prune_delta and precision passed to CounterStacksProfiler)
         :return: a profiler instance
         """
 
@@ -389,8 +412,11 @@ class Cachecow:
         no_load_rd = kwargs.get("no_load_rd", False)
         assert self.reader is not None, "you haven't opened a trace yet"
 
-        if algorithm.lower() == "lru" and not use_general_profiler:
-            profiler = LRUProfiler(self.reader, cache_size, cache_params, no_load_rd=no_load_rd)
+        if algorithm.lower() == "lru" and kwargs.get("use_counter_stacks", False):
+            profiler = CounterStacksProfiler(self.reader, cache_size, **kwargs.get("counter_stacks_params", {}))
+        elif algorithm.lower() == "lru" and not use_general_profiler:
+            profiler = LRUProfiler(self.reader, cache_size, cache_params, no_load_rd=no_load_rd,
+                                   num_of_threads=num_of_threads)
         else:
             assert cache_size != -1, "you didn't provide size for cache"
             assert cache_size <= self.num_of_req(), "you cannot specify cache size({}) " \
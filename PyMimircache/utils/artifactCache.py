@@ -0,0 +1,300 @@
+# coding=utf-8
+"""
+    a persistent on-disk cache for arrays computed from a trace, such as reuse distance,
+    so that repeated profiling of the same trace skips the expensive computation
+
+    an artifact is addressed by a fingerprint of the trace content, the reader type, the reader parameters
+    that affect what is read (label column, data type, block unit size ...) and the name of the artifact,
+    so a copied or moved trace still hits, and a modified trace never gets a stale array.
+    Arrays are stored as .npy files and loaded memory-mapped, so loading is O(1) and
+    multiple processes share the page cache.
+
+    when the total size of the cache directory exceeds the disk budget,
+    least recently used artifacts are removed first
+
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+from PyMimircache.const import DEF_ARTIFACT_CACHE_DIR, DEF_ARTIFACT_CACHE_DISK_BUDGET
+from PyMimircache.utils.printing import *
+
+
+# bump this when the content of any artifact changes, so old artifacts are never used
+ARTIFACT_VERSION = 1
+# reader parameters that do not change what is read from the trace
+_IGNORED_READER_PARAMS = {"file_loc", "open_c_reader", "lock", "use_mmap", "use_offset_index", "save_offset_index"}
+_HASH_CHUNK_SIZE = 1 << 20
+_default_artifact_cache = None
+
+
+def file_content_hash(file_loc):
+    """
+    hash the whole content of a file
+
+    :param file_loc: location of the file
+    :return: the hex digest
+    """
+
+    h = hashlib.blake2b(digest_size=20)
+    with open(file_loc, "rb") as ifile:
+        chunk = ifile.read(_HASH_CHUNK_SIZE)
+        while chunk:
+            h.update(chunk)
+            chunk = ifile.read(_HASH_CHUNK_SIZE)
+    return h.hexdigest()
+
+
+def get_reader_params(reader):
+    """
+    the parameters of a reader that affect what is read from the trace
+
+    :param reader: the reader of the trace
+    :return: a dictionary of parameters
+    """
+    return {k: v for k, v in reader.get_params().items() if k not in _IGNORED_READER_PARAMS}
+
+
+class ArtifactCache:
+    """
+    a content-addressed cache of arrays in a directory
+
+    """
+
+    def __init__(self, cache_dir=DEF_ARTIFACT_CACHE_DIR, disk_budget=DEF_ARTIFACT_CACHE_DISK_BUDGET):
+        """
+        :param cache_dir: the directory for cached artifacts, created if it does not exist
+        :param disk_budget: the max total size of cached artifacts in bytes
+        """
+
+        self.cache_dir = cache_dir
+        self.disk_budget = disk_budget
+        # (path, size, mtime) -> content hash, so an unchanged trace is only hashed once
+        self._trace_hash = {}
+
+    def get_trace_fingerprint(self, file_loc):
+        """
+        the content hash of a trace, it is memorized in memory and on disk, keyed by path,
+        size and modification time, so a trace is only read again when it changes
+
+        :param file_loc: location of the trace
+        :return: the hex digest, None if it is not a regular file
+        """
+
+        if not os.path.isfile(file_loc):
+            return None
+        stat = os.stat(file_loc)
+        file_id = "{}:{}:{}".format(os.path.realpath(file_loc), stat.st_size, stat.st_mtime_ns)
+        if file_id in self._trace_hash:
+            return self._trace_hash[file_id]
+
+        id_path = os.path.join(self.cache_dir, "trace-{}.hash".format(
+            hashlib.blake2b(file_id.encode(), digest_size=20).hexdigest()))
+        content_hash = None
+        if os.path.exists(id_path):
+            with open(id_path) as ifile:
+                content_hash = ifile.read().strip()
+        if not content_hash:
+            content_hash = file_content_hash(file_loc)
+            self._atomic_write(id_path, lambda ofile: ofile.write(content_hash.encode()))
+        self._trace_hash[file_id] = content_hash
+        return content_hash
+
+    def get_key(self, reader, name, **params):
+        """
+        the key of an artifact of the trace read by reader
+
+        :param reader: the reader of the trace
+        :param name: the name of the artifact, such as rd
+        :param params: other parameters used in computing the artifact
+        :return: the key, None if the reader does not read from a regular file
+        """
+
+        trace_hash = self.get_trace_fingerprint(getattr(reader, "file_loc", ""))
+        if trace_hash is None:
+            return None
+        desc = json.dumps({"version": ARTIFACT_VERSION, "trace": trace_hash,
+                           "reader": reader.__class__.__name__, "reader_params": get_reader_params(reader),
+                           "name": name, "params": params}, sort_keys=True, default=str)
+        return "{}-{}".format(name, hashlib.blake2b(desc.encode(), digest_size=20).hexdigest())
+
+    def get_path(self, key, suffix=".npy"):
+        """
+        :param key: the key of artifact
+        :param suffix: the file suffix
+        :return: the path of artifact
+        """
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def load(self, key):
+        """
+        load an artifact memory-mapped (read only)
+
+        :param key: the key of artifact
+        :return: a numpy array, None if not cached
+        """
+
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            arr = np.load(path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            WARNING("remove broken artifact {}: {}".format(path, e))
+            self._remove(path)
+            return None
+        self.touch(path)
+        return arr
+
+    def save(self, key, arr):
+        """
+        save an artifact, then evict least recently used artifacts if over budget
+
+        :param key: the key of artifact
+        :param arr: a numpy array
+        """
+
+        arr = np.asarray(arr)
+        if arr.nbytes > self.disk_budget:
+            WARNING("artifact {} ({} bytes) is larger than disk budget {}, not cached".format(
+                key, arr.nbytes, self.disk_budget))
+            return
+        self._atomic_write(self.get_path(key), lambda ofile: np.save(ofile, arr))
+        self.evict()
+
+    def get_or_compute(self, reader, names, compute_func, **params):
+        """
+        load artifacts if all of them are cached, otherwise compute and save them
+
+        :param reader: the reader of the trace
+        :param names: the name of the artifact, or a tuple of names if compute_func returns a tuple of arrays
+        :param compute_func: a function without argument that computes the artifact(s)
+        :param params: other parameters used in computing the artifact
+        :return: a numpy array or a tuple of numpy arrays
+        """
+
+        single = isinstance(names, str)
+        if single:
+            names = (names, )
+        keys = [self.get_key(reader, name, **params) for name in names]
+        if None in keys:
+            return compute_func()
+
+        arrs = [self.load(key) for key in keys]
+        if any(arr is None for arr in arrs):
+            arrs = [compute_func()] if single else list(compute_func())
+            for key, arr in zip(keys, arrs):
+                self.save(key, arr)
+        else:
+            DEBUG("load {} of {} from artifact cache".format(", ".join(names), reader.file_loc))
+        return arrs[0] if single else tuple(arrs)
+
+    def touch(self, path):
+        """
+        mark an artifact as recently used
+
+        :param path: the path of artifact
+        """
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """
+        remove least recently used artifacts until the total size is within disk budget
+        """
+
+        if not os.path.isdir(self.cache_dir):
+            return
+        artifacts = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith(".hash") and ".tmp." not in entry.name:
+                stat = entry.stat()
+                artifacts.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+        artifacts.sort()
+        for _, size, path in artifacts:
+            if total_size <= self.disk_budget:
+                break
+            self._remove(path)
+            total_size -= size
+
+    def clear(self):
+        """
+        remove all cached artifacts
+        """
+        if os.path.isdir(self.cache_dir):
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file():
+                    self._remove(entry.path)
+
+    def get_total_size(self):
+        """
+        :return: the total size of cached artifacts in bytes
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.cache_dir)
+                   if entry.is_file() and not entry.name.endswith(".hash"))
+
+    def _atomic_write(self, path, write_func):
+        """
+        write to a temporary file and rename it, so readers never see a partial file
+
+        :param path: the destination
+        :param write_func: a function that writes into the given binary file object
+        """
+
+        tmp_path = "{}.tmp.{}".format(path, os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as ofile:
+                write_func(ofile)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            WARNING("failed to write artifact {}: {}".format(path, e))
+            self._remove(tmp_path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def __repr__(self):
+        return "ArtifactCache at {} (budget {} bytes)".format(self.cache_dir, self.disk_budget)
+
+
+def get_default_artifact_cache():
+    """
+    :return: the artifact cache in DEF_ARTIFACT_CACHE_DIR, it is created the first time it is used
+    """
+
+    global _default_artifact_cache
+    if _default_artifact_cache is None:
+        _default_artifact_cache = ArtifactCache()
+    return _default_artifact_cache
+
+
+def get_cached_array(reader, names, compute_func, **params):
+    """
+    get artifact(s) of a trace from the default artifact cache, or compute them if the cache is disabled
+    (see USE_ARTIFACT_CACHE in const), callers that are enabled explicitly use get_default_artifact_cache
+
+    :param reader: the reader of the trace
+    :param names: the name of the artifact, or a tuple of names if compute_func returns a tuple of arrays
+    :param compute_func: a function without argument that computes the artifact(s)
+    :param params: other parameters used in computing the artifact
+    :return: a numpy array or a tuple of numpy arrays
+    """
+
+    # imported here, so the cache can be turned off at runtime by setting PyMimircache.const.USE_ARTIFACT_CACHE
+    from PyMimircache.const import USE_ARTIFACT_CACHE
+    if not USE_ARTIFACT_CACHE:
+        return compute_func()
+    return get_default_artifact_cache().get_or_compute(reader, names, compute_func, **params)
@@ -0,0 +1,101 @@
+# coding=utf-8
+"""
+    an inter-process lock backed by flock on a lock file, it replaces the lock of a multiprocessing Manager,
+    which needs a server process for every lock
+
+    the lock only holds the path of the lock file, the file is opened at the first acquire,
+    so it is free to create and can be pickled to worker processes, all locks of the same path
+    (in any process) exclude each other
+
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class FileLock:
+    """
+    a lock shared by processes through a lock file
+
+    """
+    all = ["acquire", "release", "for_file"]
+
+    def __init__(self, lock_loc):
+        """
+        :param lock_loc: location of the lock file, it is created if it does not exist
+        """
+
+        assert fcntl is not None, "FileLock needs fcntl, which is not available on this platform"
+        self.lock_loc = lock_loc
+        self._fd = None
+        # flock does not exclude threads sharing the same file descriptor
+        self._thread_lock = threading.Lock()
+
+    @classmethod
+    def for_file(cls, file_loc):
+        """
+        the lock of a file, the lock file is in the temp directory and named by the real path of the file
+
+        :param file_loc: location of the file
+        :return: a FileLock
+        """
+
+        path_hash = hashlib.md5(os.path.realpath(file_loc).encode()).hexdigest()
+        return cls(os.path.join(tempfile.gettempdir(), "PyMimircache-{}.lock".format(path_hash)))
+
+    def acquire(self, blocking=True):
+        """
+        :param blocking: whether wait for the lock
+        :return: whether the lock is acquired
+        """
+
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            if self._fd is None:
+                self._fd = os.open(self.lock_loc, os.O_RDONLY | os.O_CREAT, 0o666)
+            fcntl.flock(self._fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._thread_lock.release()
+            return False
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return True
+
+    def release(self):
+        """
+        release the lock
+        """
+
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def __getstate__(self):
+        # only the path is shared, each process opens its own file descriptor
+        return {"lock_loc": self.lock_loc}
+
+    def __setstate__(self, state):
+        self.__init__(state["lock_loc"])
+
+    def __del__(self):
+        if getattr(self, "_fd", None) is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __repr__(self):
+        return "FileLock({})".format(self.lock_loc)
@@ -0,0 +1,84 @@
+# coding=utf-8
+"""
+    hashing of request labels, it is used by spatial sampling (such as SHARDS)
+    and probabilistic counting (such as HyperLogLog), a label is always mapped to the same value,
+    so either all requests of an object are sampled or none of them is
+
+    labels are hashed by their string form, so the same object read by different readers
+    (for example, int label from vscsi and str label from plain text) gets the same hash value
+
+"""
+
+import numpy as np
+
+try:
+    import mmh3
+
+    def _hash32(data):
+        return mmh3.hash(data, 0) & 0xffffffff
+
+    def _hash64(data):
+        return mmh3.hash64(data, 0)[0] & 0xffffffffffffffff
+except ImportError:
+    import zlib
+    import hashlib
+    from PyMimircache.utils.printing import WARNING
+    WARNING("mmh3 is not installed, fall back to crc32 and blake2b for hashing")
+
+    def _hash32(data):
+        return zlib.crc32(data) & 0xffffffff
+
+    def _hash64(data):
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+# the modulus of the hash value, a sampling ratio R corresponds to threshold R * HASH_MODULUS
+HASH_MODULUS = 1 << 32
+
+
+def spatial_hash(label):
+    """
+    hash a request label into [0, HASH_MODULUS)
+
+    :param label: the label of request
+    :return: an int hash value
+    """
+
+    if not isinstance(label, bytes):
+        label = str(label).encode()
+    return _hash32(label)
+
+
+def spatial_hash_many(labels):
+    """
+    hash a list of request labels
+
+    :param labels: a list of labels
+    :return: a list of int hash values
+    """
+
+    return [_hash32(label if isinstance(label, bytes) else str(label).encode()) for label in labels]
+
+
+def hash64_many(labels):
+    """
+    hash a list of request labels into 64-bit values, used by probabilistic counting
+
+    :param labels: a list of labels
+    :return: a numpy uint64 array of hash values
+    """
+
+    return np.array([_hash64(label if isinstance(label, bytes) else str(label).encode()) for label in labels],
+                    dtype=np.uint64)
+
+
+def ratio_to_threshold(sample_ratio):
+    """
+    the hash threshold of a sampling ratio, a label is sampled if its hash value is smaller than the threshold
+
+    :param sample_ratio: sampling ratio in (0, 1]
+    :return: the threshold
+    """
+
+    assert 0 < sample_ratio <= 1, "sample ratio must be in (0, 1], given {}".format(sample_ratio)
+    return int(round(sample_ratio * HASH_MODULUS))
@@ -0,0 +1,136 @@
+# coding=utf-8
+"""
+    unittest for the persistent artifact cache
+
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.getcwd(), "../"))
+
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from PyMimircache.const import USE_ARTIFACT_CACHE
+from PyMimircache.utils import artifactCache
+from PyMimircache.utils.artifactCache import ArtifactCache
+from PyMimircache.profiler.utils.dist import get_last_access_dist
+from PyMimircache.profiler.pyLRUProfiler import PyLRUProfiler
+from PyMimircache.cacheReader.csvReader import CsvReader
+from PyMimircache.cacheReader.plainReader import PlainReader
+from PyMimircache.cacheReader.vscsiReader import VscsiReader
+
+DAT_FOLDER = "../data/"
+if not os.path.exists(DAT_FOLDER):
+    if os.path.exists("data/"):
+        DAT_FOLDER = "data/"
+    elif os.path.exists("../PyMimircache/data/"):
+        DAT_FOLDER = "../PyMimircache/data/"
+
+
+class ArtifactCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_get_or_compute(self):
+        cache = ArtifactCache(self.cache_dir)
+        reader = PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False)
+        num_of_compute = [0]
+
+        def compute():
+            num_of_compute[0] += 1
+            return np.arange(10, dtype=np.int64)
+
+        arr = cache.get_or_compute(reader, "test", compute)
+        arr2 = cache.get_or_compute(reader, "test", compute)
+        self.assertEqual(num_of_compute[0], 1)
+        self.assertIsInstance(arr2, np.memmap)
+        self.assertListEqual(list(arr), list(arr2))
+
+        # a different artifact parameter is a different artifact
+        cache.get_or_compute(reader, "test", compute, cache_size=20)
+        self.assertEqual(num_of_compute[0], 2)
+
+        # the fingerprint is on content, not on path
+        shutil.copy("{}/trace.txt".format(DAT_FOLDER), self.cache_dir)
+        reader_copy = PlainReader(os.path.join(self.cache_dir, "trace.txt"), open_c_reader=False)
+        self.assertEqual(cache.get_key(reader, "test"), cache.get_key(reader_copy, "test"))
+        reader.close()
+        reader_copy.close()
+
+    def test_reader_params(self):
+        cache = ArtifactCache(self.cache_dir)
+        reader1 = CsvReader("{}/trace.csv".format(DAT_FOLDER), open_c_reader=False,
+                            init_params={"header": True, "label": 5, "delimiter": ","})
+        reader2 = CsvReader("{}/trace.csv".format(DAT_FOLDER), open_c_reader=False,
+                            init_params={"header": True, "label": 4, "delimiter": ","})
+        self.assertNotEqual(cache.get_key(reader1, "rd"), cache.get_key(reader2, "rd"))
+        reader1.close()
+        reader2.close()
+
+        # saving the offset index does not change what is read
+        reader1 = PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False)
+        reader2 = PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False, use_offset_index=False,
+                              save_offset_index=True)
+        self.assertEqual(cache.get_key(reader1, "rd"), cache.get_key(reader2, "rd"))
+        reader1.close()
+        reader2.close()
+
+    def test_evict(self):
+        reader = PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False)
+        cache = ArtifactCache(self.cache_dir, disk_budget=3000)
+        for i in range(4):
+            cache.save(cache.get_key(reader, "test{}".format(i)), np.zeros(100, dtype=np.int64))
+            os.utime(cache.get_path(cache.get_key(reader, "test{}".format(i))), (i, i))
+        cache.evict()
+        self.assertLessEqual(cache.get_total_size(), 3000)
+        # the least recently used ones are evicted
+        self.assertIsNone(cache.load(cache.get_key(reader, "test0")))
+        self.assertIsNotNone(cache.load(cache.get_key(reader, "test3")))
+        reader.close()
+
+    def test_save_load_reuse_dist(self):
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        p = PyLRUProfiler(reader, no_load_rd=True)
+        rd_path = os.path.join(self.cache_dir, "trace.rd.npy")
+        p.save_reuse_dist(rd_path, "rd")
+
+        p2 = PyLRUProfiler(reader, no_load_rd=True)
+        p2.load_reuse_dist(rd_path, "rd")
+        self.assertListEqual(list(p2.get_reuse_distance()[:1000]), list(p.get_reuse_distance()[:1000]))
+        hr = p2.get_hit_ratio(cache_size=2000)
+        self.assertAlmostEqual(hr[2000], 0.172851974146)
+        reader.close()
+
+    def test_opt_in(self):
+        reader = PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False)
+        # nothing is written into the artifact cache unless it is enabled
+        self.assertEqual(PyLRUProfiler(reader).use_artifact_cache, USE_ARTIFACT_CACHE)
+        self.assertTrue(PyLRUProfiler(reader, use_artifact_cache=True).use_artifact_cache)
+        self.assertFalse(PyLRUProfiler(reader, use_artifact_cache=True, no_load_rd=True).use_artifact_cache)
+        self.assertIsInstance(get_last_access_dist(reader), list)
+        reader.close()
+
+    def test_profiler_opt_in(self):
+        # the profiler opt-in does not depend on USE_ARTIFACT_CACHE
+        old_cache = artifactCache._default_artifact_cache
+        artifactCache._default_artifact_cache = ArtifactCache(self.cache_dir)
+        try:
+            reader = PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False)
+            rd = PyLRUProfiler(reader, use_artifact_cache=True).get_reuse_distance()
+            self.assertGreater(artifactCache._default_artifact_cache.get_total_size(), 0)
+            rd2 = PyLRUProfiler(reader, use_artifact_cache=True).get_reuse_distance()
+            self.assertIsInstance(rd2, np.memmap)
+            self.assertListEqual(rd2.tolist(), rd.tolist())
+            reader.close()
+        finally:
+            artifactCache._default_artifact_cache = old_cache
+
+
+if __name__ == "__main__":
+    unittest.main()
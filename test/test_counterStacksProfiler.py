@@ -0,0 +1,60 @@
+# coding=utf-8
+"""
+    unittest for counterStacksProfiler module, the approximate hit ratio curve is compared
+    with the exact one from PyLRUProfiler
+
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.getcwd(), "../"))
+
+import unittest
+import numpy as np
+
+from PyMimircache.profiler.counterStacksProfiler import CounterStacksProfiler
+from PyMimircache.profiler.pyLRUProfiler import PyLRUProfiler
+from PyMimircache.profiler.utils.counterStacks import CounterStacks, hll_registers, hll_estimate
+from PyMimircache.utils.hashing import hash64_many
+from PyMimircache.cacheReader.vscsiReader import VscsiReader
+
+DAT_FOLDER = "../data/"
+if not os.path.exists(DAT_FOLDER):
+    if os.path.exists("data/"):
+        DAT_FOLDER = "data/"
+    elif os.path.exists("../PyMimircache/data/"):
+        DAT_FOLDER = "../PyMimircache/data/"
+
+
+class CounterStacksProfilerTest(unittest.TestCase):
+    def test_hll(self):
+        registers = hll_registers(hash64_many(range(20000)))
+        self.assertAlmostEqual(hll_estimate(registers)[0] / 20000, 1, delta=0.05)
+        # small range uses linear counting
+        registers = hll_registers(hash64_many(range(100)))
+        self.assertAlmostEqual(hll_estimate(registers)[0], 100, delta=3)
+
+    def test_counter_stacks(self):
+        cs = CounterStacks(interval=4)
+        cs.feed([1, 2, 3, 4] * 100)
+        hc = cs.get_hit_count(cache_size=10)
+        self.assertEqual(round(hc[-1]), 4)
+        self.assertEqual(round(hc[:-1].sum()), 396)
+        # the number of counters is bounded by pruning
+        self.assertLessEqual(cs.get_num_of_counters(), 3)
+
+    def test_reader_v(self):
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        p = CounterStacksProfiler(reader, cache_size=20000, interval=1024)
+        hr = p.get_hit_ratio()
+        hr_exact = PyLRUProfiler(reader, no_load_rd=True).get_hit_ratio(cache_size=20000)
+        self.assertEqual(len(hr), len(hr_exact))
+        self.assertLess(np.abs(hr[:-2] - hr_exact[:-2]).mean(), 0.05)
+        self.assertAlmostEqual(hr[2000], hr_exact[2000], delta=0.03)
+        self.assertAlmostEqual(hr[-1], hr_exact[-1], delta=0.05)
+        self.assertLess(p.get_num_of_counters(), 100)
+        reader.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+# coding=utf-8
+"""
+    unittest for incrementalLRUProfiler module, a trace is profiled in several parts as it grows,
+    the result must be the same as profiling the whole trace at once
+
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.getcwd(), "../"))
+
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from PyMimircache.profiler.incrementalLRUProfiler import IncrementalLRUProfiler
+from PyMimircache.profiler.pyLRUProfiler import PyLRUProfiler
+from PyMimircache.cacheReader.plainReader import PlainReader
+from PyMimircache.cacheReader.vscsiReader import VscsiReader
+
+DAT_FOLDER = "../data/"
+if not os.path.exists(DAT_FOLDER):
+    if os.path.exists("data/"):
+        DAT_FOLDER = "data/"
+    elif os.path.exists("../PyMimircache/data/"):
+        DAT_FOLDER = "../PyMimircache/data/"
+
+
+class IncrementalLRUProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_plain(self):
+        with open("{}/trace.txt".format(DAT_FOLDER)) as ifile:
+            lines = ifile.readlines()
+        trace_loc = os.path.join(self.tmp_dir, "trace.txt")
+        checkpoint_loc = os.path.join(self.tmp_dir, "checkpoint.npz")
+
+        with open(trace_loc, "w") as ofile:
+            ofile.writelines(lines[:40000])
+        reader = PlainReader(trace_loc, open_c_reader=False)
+        p = IncrementalLRUProfiler(reader)
+        self.assertEqual(p.update(), 40000)
+        p.save_checkpoint(checkpoint_loc)
+
+        # the same reader continues from where it stopped
+        with open(trace_loc, "a") as ofile:
+            ofile.writelines(lines[40000:80000])
+        self.assertEqual(p.update(from_current_position=True), 40000)
+
+        # a new job loads the checkpoint and skips profiled requests
+        with open(trace_loc, "a") as ofile:
+            ofile.writelines(lines[80000:])
+        reader2 = PlainReader(trace_loc, open_c_reader=False)
+        p2 = IncrementalLRUProfiler.load_checkpoint(checkpoint_loc, reader2)
+        self.assertEqual(p2.num_of_req, 40000)
+        self.assertEqual(p2.update(), len(lines) - 40000)
+        self.assertEqual(p.update(from_current_position=True), len(lines) - 80000)
+
+        hr_exact = PyLRUProfiler(reader2, no_load_rd=True).get_hit_ratio(cache_size=20000)
+        hr = p.get_hit_ratio(cache_size=20000)
+        hr2 = p2.get_hit_ratio(cache_size=20000)
+        self.assertAlmostEqual(hr2[2000], 0.172851974146)
+        self.assertTrue(np.allclose(hr, hr_exact))
+        self.assertTrue(np.allclose(hr2, hr_exact))
+        reader.close()
+        reader2.close()
+
+    def test_vscsi(self):
+        trace_loc = os.path.join(self.tmp_dir, "trace.vscsi")
+        checkpoint_loc = os.path.join(self.tmp_dir, "checkpoint.npz")
+        with open("{}/trace.vscsi".format(DAT_FOLDER), "rb") as ifile:
+            data = ifile.read()
+        record_size = len(data) // 113872
+        with open(trace_loc, "wb") as ofile:
+            ofile.write(data[: 50000 * record_size])
+
+        reader = VscsiReader(trace_loc, open_c_reader=False)
+        p = IncrementalLRUProfiler(reader)
+        p.update()
+        p.save_checkpoint(checkpoint_loc)
+        reader.close()
+
+        with open(trace_loc, "ab") as ofile:
+            ofile.write(data[50000 * record_size:])
+        reader = VscsiReader(trace_loc, open_c_reader=False)
+        p = IncrementalLRUProfiler.load_checkpoint(checkpoint_loc, reader)
+        self.assertEqual(p.update(), 113872 - 50000)
+        hr = p.get_hit_ratio()
+        self.assertAlmostEqual(hr[2000], 0.172851974146)
+        self.assertAlmostEqual(hr[-1], 0.43007939)
+
+        # a checkpoint can not be applied to a shorter trace
+        p.save_checkpoint(checkpoint_loc)
+        with open(trace_loc, "wb") as ofile:
+            ofile.write(data[: 50000 * record_size])
+        with self.assertRaises(RuntimeError):
+            IncrementalLRUProfiler.load_checkpoint(checkpoint_loc).update(
+                VscsiReader(trace_loc, open_c_reader=False))
+        reader.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
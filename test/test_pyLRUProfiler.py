@@ -0,0 +1,255 @@
+# coding=utf-8
+"""
+    unittest for pyLRUProfiler module, the expected values are the same as cLRUProfiler
+
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.getcwd(), "../"))
+
+import unittest
+from collections import Counter
+
+from PyMimircache.profiler.pyLRUProfiler import PyLRUProfiler
+from PyMimircache.profiler.utils.reuseDist import ReuseDistEngine, get_reuse_dist
+from PyMimircache.profiler.utils.parallelReuseDist import get_reuse_dist_parallel
+from PyMimircache.profiler.utils.shards import Shards
+from PyMimircache.profiler.utils.aet import get_miss_ratio_from_reuse_time, get_reuse_time_hist
+from PyMimircache.profiler.utils.dist import get_last_access_dist, get_next_access_dist
+from PyMimircache.cacheReader.csvReader import CsvReader
+from PyMimircache.cacheReader.plainReader import PlainReader
+from PyMimircache.cacheReader.vscsiReader import VscsiReader
+from PyMimircache.cacheReader.prefetchReader import PrefetchReader
+from PyMimircache.cacheReader.samplingReader import SamplingReader
+
+DAT_FOLDER = "../data/"
+if not os.path.exists(DAT_FOLDER):
+    if os.path.exists("data/"):
+        DAT_FOLDER = "data/"
+    elif os.path.exists("../PyMimircache/data/"):
+        DAT_FOLDER = "../PyMimircache/data/"
+
+
+class PyLRUProfilerTest(unittest.TestCase):
+    def test_reader_v(self):
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        p = PyLRUProfiler(reader, no_load_rd=True)
+
+        hr = p.get_hit_ratio()
+        self.assertAlmostEqual(hr[2000], 0.172851974146)
+        hc = p.get_hit_count()
+        self.assertEqual(hc[20002], 0)
+        self.assertEqual(hc[0], 0)
+
+        rd = p.get_reuse_distance()
+        self.assertEqual(rd[1024], -1)
+        self.assertEqual(rd[113860], 1)
+
+        frd = p.get_future_reuse_distance()
+        self.assertEqual(frd[20], 10)
+        self.assertEqual(frd[21], 56)
+
+        hr = p.get_hit_ratio(cache_size=20)
+        self.assertAlmostEqual(hr[1], 0.02357911)
+
+        reader.close()
+
+    def test_reader_p(self):
+        reader = PlainReader("{}/trace.txt".format(DAT_FOLDER), data_type='c', open_c_reader=False)
+        p = PyLRUProfiler(reader, no_load_rd=True)
+        hr = p.get_hit_ratio()
+        self.assertAlmostEqual(hr[2000], 0.172851974146)
+
+        hc = p.get_hit_count()
+        self.assertEqual(hc[20002], 0)
+        self.assertEqual(hc[0], 0)
+
+        rd = p.get_reuse_distance()
+        self.assertEqual(rd[1024], -1)
+        self.assertEqual(rd[113860], 1)
+
+        frd = p.get_future_reuse_distance()
+        self.assertEqual(frd[20], 10)
+        self.assertEqual(frd[21], 56)
+
+        hr = p.get_hit_ratio(cache_size=20)
+        self.assertAlmostEqual(hr[1], 0.02357911)
+
+        reader.close()
+
+    def test_reader_c(self):
+        reader = CsvReader("{}/trace.csv".format(DAT_FOLDER),
+                           init_params={"header": True, "label": 5}, open_c_reader=False)
+        p = PyLRUProfiler(reader, no_load_rd=True)
+
+        rd = p.get_reuse_distance()
+        self.assertEqual(rd[1024], -1)
+        self.assertEqual(rd[113860], 1)
+
+        hr = p.get_hit_ratio()
+        self.assertAlmostEqual(hr[2000], 0.172851974146)
+
+        hr = p.get_hit_ratio(cache_size=20)
+        self.assertAlmostEqual(hr[1], 0.02357911)
+
+        p.plotHRC("test.png", cache_unit_size=32*1024)
+
+        reader.close()
+
+    def test_engine(self):
+        # a b c a b b d a, compacting timestamps on every block
+        engine = ReuseDistEngine(block_size=3, min_capacity=1)
+        rd = list(engine.feed(list("abca"))) + list(engine.feed(list("bbda")))
+        self.assertListEqual(rd, [-1, -1, -1, 2, 2, 0, -1, 2])
+        self.assertEqual(engine.get_num_of_uniq_obj(), 4)
+
+        # b is forgotten, so it is neither counted nor reused
+        engine.remove(["b"])
+        self.assertListEqual(list(engine.feed(list("cab"))), [2, 1, -1])
+
+    def test_engine_with_size(self):
+        # a(3) b(1) c(2) a b b d(5) a
+        engine = ReuseDistEngine(block_size=3, min_capacity=1, with_size=True)
+        rd = list(engine.feed(list("abca"), sizes=[3, 1, 2, 3])) + \
+             list(engine.feed(list("bbda"), sizes=[1, 1, 5, 3]))
+        self.assertListEqual(rd, [-1, -1, -1, 3, 5, 0, -1, 6])
+
+    def test_reader_with_size(self):
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), block_unit_size=4096, open_c_reader=False)
+        p = PyLRUProfiler(reader, cache_params={"block_unit_size": 4096}, no_load_rd=True)
+
+        hc = p.get_hit_count(cache_size=20000)
+        self.assertEqual(hc[0], 0)
+        self.assertEqual(hc[-1], 44774)
+        self.assertEqual(len(p.get_hit_count()), 486565)
+
+        hr = p.get_hit_ratio(cache_size=20000)
+        self.assertAlmostEqual(hr[2000], 0.19294470984965575)
+        self.assertAlmostEqual(hr[-3], 0.2079879162568498)
+
+        byte_hr = p.get_byte_hit_ratio(cache_size=20000)
+        self.assertAlmostEqual(byte_hr[2000], 0.02905804758251673)
+        self.assertAlmostEqual(byte_hr[-1], 0.4695162138559594)
+        reader.close()
+
+    def test_next_access_dist(self):
+        for reader in (VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False),
+                       PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False)):
+            next_access = get_next_access_dist(reader)
+            last_access = get_last_access_dist(reader)
+            self.assertEqual(len(next_access), 113872)
+            # every next access is the last access of a later request
+            for i in range(0, 113872, 97):
+                if next_access[i] != -1:
+                    self.assertEqual(last_access[i + next_access[i]], next_access[i])
+            self.assertEqual(sum(1 for i in next_access if i == -1), sum(1 for i in last_access if i == -1))
+            reader.close()
+
+    def test_shards(self):
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        p = PyLRUProfiler(reader, no_load_rd=True)
+        hr = p.get_hit_ratio(cache_size=20000)
+
+        # sampling everything is the same as no sampling
+        hr_all = p.get_hit_ratio_shards(sample_ratio=1.0, cache_size=20000)
+        self.assertAlmostEqual(hr_all[2000], hr[2000])
+        self.assertAlmostEqual(hr_all[-1], hr[-1])
+
+        hr_rate = p.get_hit_ratio_shards(sample_ratio=0.1, cache_size=20000)
+        self.assertEqual(len(hr_rate), 20003)
+        self.assertLess(abs(hr_rate[-3] - hr[-3]), 0.02)
+        self.assertLess(abs(hr_rate[:-2] - hr[:-2]).mean(), 0.02)
+
+        hr_size = p.get_hit_ratio_shards(sample_ratio=1.0, sample_size=5000, cache_size=20000)
+        self.assertLess(abs(hr_size[:-2] - hr[:-2]).mean(), 0.02)
+
+        # the number of tracked objects is bounded in fixed-size mode
+        shards = Shards(sample_ratio=1.0, sample_size=100)
+        shards.feed(list(range(10000)))
+        self.assertLessEqual(shards.engine.get_num_of_uniq_obj(), 100)
+        self.assertLess(shards.sample_ratio, 0.02)
+        self.assertAlmostEqual(shards.get_hit_ratio()[-1], 1.0)
+
+        p = PyLRUProfiler(reader, cache_params={"block_unit_size": 4096}, no_load_rd=True)
+        self.assertRaises(RuntimeError, p.get_hit_ratio_shards)
+        reader.close()
+
+    def test_parallel_reuse_dist(self):
+        reader = PlainReader("{}/trace.txt".format(DAT_FOLDER), data_type='c', open_c_reader=False)
+        rd = get_reuse_dist(reader)
+        for num_of_threads in (2, 5):
+            rd_parallel = get_reuse_dist_parallel(reader, num_of_threads=num_of_threads, min_chunk_size=1000)
+            self.assertListEqual(list(rd_parallel), list(rd))
+        reader.close()
+
+        # wrapper readers can not be partitioned, each worker recreates the wrapper and seeks to its chunk
+        for reader in (SamplingReader(PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False),
+                                      sample_ratio=0.5),
+                       PrefetchReader(PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False))):
+            self.assertFalse(reader.support_partitions)
+            self.assertRaises(RuntimeError, reader.get_partitions, 2)
+            rd = get_reuse_dist(reader)
+            rd_parallel = get_reuse_dist_parallel(reader, num_of_threads=4, min_chunk_size=1000)
+            self.assertListEqual(list(rd_parallel), list(rd))
+            reader.close()
+
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        p = PyLRUProfiler(reader, no_load_rd=True, num_of_threads=4)
+        hr = p.get_hit_ratio()
+        self.assertAlmostEqual(hr[2000], 0.172851974146)
+        reader.close()
+
+    def test_window_index(self):
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        p = PyLRUProfiler(reader, no_load_rd=True)
+        hr_expected = p.get_hit_ratio(cache_size=2000, begin=20000, end=60000)
+        hr_all = p.get_hit_ratio(cache_size=2000)
+
+        index = p.build_window_index(breakpoints=range(0, 113872, 10000), cache_size=5000)
+        self.assertTrue(index.has_window(20000, 60000))
+        self.assertFalse(index.has_window(20000, 60001))
+        hr = p.get_hit_ratio(cache_size=2000, begin=20000, end=60000)
+        self.assertListEqual(list(hr), list(hr_expected))
+        self.assertListEqual(list(p.get_hit_ratio(cache_size=2000)), list(hr_all))
+        # not along breakpoints, computed from reuse distance
+        hr = p.get_hit_ratio(cache_size=2000, begin=20000, end=60001)
+        self.assertEqual(len(hr), 2003)
+
+        index = p.build_window_index(num_of_windows=8, cache_size=2000)
+        bp = index.breakpoints
+        self.assertEqual(len(bp), 9)
+        self.assertListEqual(list(index.get_hit_count(bp[2], bp[5])),
+                             list(index.get_hit_count(bp[2], bp[3]) + index.get_hit_count(bp[3], bp[5])))
+        reader.close()
+
+    def test_aet(self):
+        self.assertListEqual(list(get_miss_ratio_from_reuse_time([4], [100], 0, 6)), [1, 1, 1, 1, 0, 0, 0])
+
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        p = PyLRUProfiler(reader, no_load_rd=True)
+        hr = p.get_hit_ratio(cache_size=20000)
+        hr_aet = p.get_hit_ratio_aet(cache_size=20000)
+        self.assertEqual(len(hr_aet), 20003)
+        self.assertAlmostEqual(hr_aet[-1], hr[-1])
+        self.assertLess(abs(hr_aet[:-2] - hr[:-2]).mean(), 0.02)
+
+        hr_aet = p.get_hit_ratio_aet(sample_ratio=0.1, cache_size=20000, seed=1)
+        self.assertLess(abs(hr_aet[:-2] - hr[:-2]).mean(), 0.03)
+
+        # the histogram is the same as the one of last access distance
+        reuse_times, counts, num_of_inf = get_reuse_time_hist(reader, block_size=1000)
+        last_access_dist = get_last_access_dist(reader)
+        self.assertEqual(num_of_inf, last_access_dist.count(-1))
+        self.assertDictEqual(dict(zip(reuse_times.tolist(), counts.tolist())),
+                             dict(Counter(t for t in last_access_dist if t != -1)))
+        reader.close()
+
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        p = PyLRUProfiler(reader, cache_params={"block_unit_size": 4096}, no_load_rd=True)
+        self.assertRaises(RuntimeError, p.get_hit_ratio_aet)
+        reader.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
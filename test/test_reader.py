@@ -10,12 +10,32 @@ import os
 import sys
 sys.path.append(os.path.join(os.getcwd(), "../"))
 
+import gzip
+import struct
+import shutil
+import multiprocessing
+import tempfile
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 import PyMimircache.CMimircache.CacheReader as c_cacheReader
 from PyMimircache.cacheReader.csvReader import CsvReader
 from PyMimircache.cacheReader.plainReader import PlainReader
-from PyMimircache.cacheReader.vscsiReader import VscsiReader
+from PyMimircache.cacheReader.vscsiReader import VscsiReader, VSCSI1_DTYPE
 from PyMimircache.cacheReader.binaryReader import BinaryReader
+from PyMimircache.cacheReader.multiReader import MultiReader
+from PyMimircache.cacheReader.requestItem import Req, RequestBatch
+from PyMimircache.cacheReader.prefetchReader import PrefetchReader
+from PyMimircache.cacheReader.samplingReader import SamplingReader
+from PyMimircache.cacheReader.encodedReader import EncodedReader, ENCODED_TRACE_SUFFIX
+from PyMimircache.cacheReader.traceContainer import ContainerReader, convert_to_container
+from PyMimircache.cacheReader.compressedFile import CompressedFile, BlockIndex, write_blocks, \
+    BLOCK_INDEX_SUFFIX
+from PyMimircache.cacheReader.offsetIndex import OffsetIndex, OFFSET_INDEX_SUFFIX
+from PyMimircache.utils.fileLock import FileLock
+from PyMimircache.utils.hashing import spatial_hash
+from PyMimircache.cache.lru import LRU
+from PyMimircache.cache.arc import ARC
+from PyMimircache.cache.abstractCache import Cache
 
 DAT_FOLDER = "../data/"
 if not os.path.exists(DAT_FOLDER):
@@ -130,6 +150,105 @@ class PyReaderTest(unittest.TestCase):
         line = reader.read_complete_req()
         self.assertListEqual(line, [2147483880, 512, 1, 42, 256, 42932747, 5633898745540])
 
+    def test_reader_binary_batch(self):
+        reader = BinaryReader("{}/trace.vscsi".format(DAT_FOLDER), data_type='l', open_c_reader=False,
+                              init_params={"label": 6, "real_time": 7, "fmt": "<3I2H2Q"})
+        batch = reader.read_batch(3)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(reader.counter, 3)
+        self.assertListEqual(list(batch["label"]), [42932745, 42932746, 42932747])
+        self.assertAlmostEqual(float(batch["real_time"][1]), 5633898611441.0)
+        self.assertListEqual(list(batch[2].tolist()), [2147483880, 512, 1, 42, 256, 42932747, 5633898745540])
+        # batch read starts from the current position
+        next_req = reader.read_one_req()
+        reader.reset()
+        self.assertEqual(reader.read_batch(5)["label"][3], next_req)
+
+        reader.reset()
+        labels = []
+        for batch in reader.iter_batches(10000):
+            labels.extend(batch["label"].tolist())
+        self.assertEqual(reader.counter, 113872)
+        reader.reset()
+        self.assertListEqual(labels, [req for req in reader])
+        reader.close()
+
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), block_unit_size=4096, open_c_reader=False)
+        batch = reader.read_batch(100)
+        reader.reset()
+        self.assertListEqual(batch["label"].tolist(), [reader.read_one_req() for _ in range(100)])
+        reader.close()
+
+        # label * disk_sector_size does not fit in a 4-byte label
+        lbns = [4000000000, 3000000001, 42]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trace_loc = os.path.join(tmp_dir, "trace.bin")
+            with open(trace_loc, "wb") as ofile:
+                for lbn in lbns:
+                    ofile.write(struct.pack("<II", lbn, 4096))
+            for use_mmap in (False, True):
+                reader = BinaryReader(trace_loc, data_type='l', open_c_reader=False, use_mmap=use_mmap,
+                                      block_unit_size=4096, disk_sector_size=512,
+                                      init_params={"label": 1, "size": 2, "fmt": "<II"})
+                expected = [lbn * 512 // 4096 for lbn in lbns]
+                self.assertListEqual([req for req in reader], expected)
+                reader.reset()
+                batch = reader.read_batch(3)
+                self.assertListEqual(batch["label"].tolist(), expected)
+                self.assertListEqual(batch["size"].tolist(), [4096] * 3)
+                self.assertListEqual(reader.get_column("label").tolist(), expected)
+                self.assertListEqual(reader[0:3].tolist(), expected)
+                reader.close()
+
+    def test_reader_vscsi_columns(self):
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        complete_reqs = list(iter(reader.read_complete_req, None))
+        reader.reset()
+        self.assertEqual(reader.get_records().dtype, VSCSI1_DTYPE)
+        self.assertListEqual(reader.get_timestamp_list(), [req[6] for req in complete_reqs])
+        self.assertListEqual(reader.get_sizes().tolist(), [req[1] for req in complete_reqs])
+        self.assertListEqual(reader.get_ops().tolist(), [req[3] for req in complete_reqs])
+        self.assertListEqual(reader.get_lbas().tolist(), [req[5] for req in complete_reqs])
+        self.assertEqual(reader.get_lbas(in_bytes=True)[0], 42932745 * 512)
+        self.assertAlmostEqual(reader.get_average_size(),
+                               sum(req[1] for req in complete_reqs) / len(complete_reqs))
+        # columns do not move the reader
+        self.assertEqual(reader.read_one_req(), 42932745)
+        reader.close()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trace_loc = os.path.join(tmp_dir, "trace.vscsi.gz")
+            with open("{}/trace.vscsi".format(DAT_FOLDER), "rb") as ifile, gzip.open(trace_loc, "wb") as ofile:
+                shutil.copyfileobj(ifile, ofile)
+            reader = VscsiReader(trace_loc, open_c_reader=False)
+            self.assertListEqual(reader.get_timestamp_list(), [req[6] for req in complete_reqs])
+            self.assertEqual(reader.read_one_req(), 42932745)
+            reader.close()
+
+    def test_reader_binary_mmap(self):
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        mmap_reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False, use_mmap=True)
+        self.assertListEqual([req for req in mmap_reader], [req for req in reader])
+        mmap_reader.reset()
+        reader.reset()
+        self.assertListEqual(mmap_reader.read_complete_req(), reader.read_complete_req())
+        self.assertListEqual(mmap_reader.read_last_req(), reader.read_last_req())
+
+        # O(1) skip and random access
+        mmap_reader.skip_n_req(2)
+        self.assertEqual(mmap_reader.read_one_req(), 42932747)
+        self.assertEqual(mmap_reader[1], 42932746)
+        self.assertListEqual(list(mmap_reader[0:3]), [42932745, 42932746, 42932747])
+
+        # columns are views of the mapped trace
+        real_time = mmap_reader.get_column("real_time")
+        self.assertEqual(len(real_time), 113872)
+        self.assertEqual(int(real_time[1]), 5633898611441)
+        self.assertFalse(real_time.flags.owndata)
+        self.assertTrue(mmap_reader.copy().use_mmap)
+        reader.close()
+        mmap_reader.close()
+
     def test_reader_csv(self):
         reader = CsvReader("{}/trace.csv".format(DAT_FOLDER),
                            init_params={"header": True, "real_time": 2, "op": 3, "size": 4, 'label': 5,
@@ -153,6 +272,520 @@ class PyReaderTest(unittest.TestCase):
         line = reader.read_complete_req()
         self.assertListEqual(line, ['1', '5633898745540', '2a', '512', '42932747'])
 
+    def test_reader_encoded(self):
+        tmp_dir = tempfile.mkdtemp()
+        trace_loc = os.path.join(tmp_dir, "trace.txt")
+        shutil.copy("{}/trace.txt".format(DAT_FOLDER), trace_loc)
+        reader = PlainReader(trace_loc, open_c_reader=False)
+        labels = [reader.read_one_req() for _ in range(reader.get_num_of_req())]
+        encoded = EncodedReader.from_reader(reader, open_c_reader=False)
+        self.assertEqual(encoded.get_num_of_req(), 113872)
+        self.assertEqual(encoded.get_num_of_uniq_req(), 48974)
+        ids = encoded.read_batch(113872)["label"]
+        self.assertEqual(int(ids.max()), 48973)
+        self.assertListEqual(encoded.decode(ids).tolist(), labels)
+        self.assertEqual(encoded.get_label(int(ids[5])), labels[5])
+        encoded.close()
+        # the encoded trace is reused
+        mtime = os.stat(trace_loc + ENCODED_TRACE_SUFFIX).st_mtime_ns
+        EncodedReader.from_reader(reader, open_c_reader=False).close()
+        self.assertEqual(os.stat(trace_loc + ENCODED_TRACE_SUFFIX).st_mtime_ns, mtime)
+        reader.close()
+
+        # time and size are kept
+        init_params = {"header": True, "real_time": 2, "op": 3, "size": 4, 'label': 5, 'delimiter': ','}
+        reader = CsvReader("{}/trace.csv".format(DAT_FOLDER), open_c_reader=False, init_params=init_params)
+        encoded_loc = os.path.join(tmp_dir, "trace.csv.encoded")
+        encoded = EncodedReader.from_reader(reader, file_loc=encoded_loc, id_fmt="i", open_c_reader=False)
+        self.assertTrue(encoded.support_real_time and encoded.support_size)
+        self.assertEqual(encoded.record_size, 4 + 8 + 8)
+        t, obj = encoded.read_time_req()
+        self.assertEqual(t, 5633898368802.0)
+        self.assertEqual(encoded.get_label(obj), "42932745")
+        self.assertEqual(encoded.read_size_req()[1], 512)
+        self.assertEqual(encoded.copy().get_num_of_uniq_req(), 48974)
+        encoded.close()
+        reader.close()
+        shutil.rmtree(tmp_dir)
+
+    def test_reader_container(self):
+        tmp_dir = tempfile.mkdtemp()
+        container_loc = os.path.join(tmp_dir, "trace.vscsi.ptc")
+        vscsi_reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        convert_to_container(vscsi_reader, container_loc)
+        reader = ContainerReader(container_loc, open_c_reader=False)
+        self.assertEqual(reader.get_num_of_req(), 113872)
+        self.assertEqual(reader.get_num_of_uniq_req(), 48974)
+        self.assertEqual(reader.get_time_range(), (5633898368802, 5641098458687))
+        self.assertEqual(reader.get_column_stats("size")["max"], 69632)
+        self.assertListEqual(reader.read_complete_req(), vscsi_reader.read_complete_req())
+        self.assertListEqual(reader.read_last_req(), vscsi_reader.read_last_req())
+        reader.reset()
+        vscsi_reader.reset()
+        self.assertListEqual(reader.read_batch(1000)["label"].tolist(),
+                             vscsi_reader.read_batch(1000)["label"].tolist())
+        # the body is a plain binary trace
+        body_reader = BinaryReader(reader.export_body(), reader.init_params, data_type='l', open_c_reader=False)
+        self.assertEqual(body_reader.read_one_req(), 42932745)
+        body_reader.close()
+        reader.close()
+        vscsi_reader.close()
+
+        reader = ContainerReader(container_loc, open_c_reader=False, use_mmap=True)
+        reader.skip_n_req(3)
+        self.assertEqual(reader.read_one_req(), 40409911)
+        reader.close()
+
+        # the body is only exported when asked
+        os.remove(container_loc + ".body")
+        reader = ContainerReader(container_loc)
+        self.assertIsNone(reader.c_reader)
+        self.assertFalse(os.path.exists(container_loc + ".body"))
+        reader.close()
+
+        # the label converted by block_unit_size is stored in the label format
+        trace_loc = os.path.join(tmp_dir, "trace.bin")
+        with open(trace_loc, "wb") as ofile:
+            for i in range(100):
+                ofile.write(struct.pack("<III", 4000000000 - i, 4096, i))
+        bin_reader = BinaryReader(trace_loc, data_type='l', open_c_reader=False, block_unit_size=4096,
+                                  disk_sector_size=512, init_params={"label": 1, "size": 2, "fmt": "<III"})
+        labels = [req for req in bin_reader]
+        container_loc = os.path.join(tmp_dir, "trace.bin.ptc")
+        convert_to_container(bin_reader, container_loc, block_size=30)
+        reader = ContainerReader(container_loc)
+        self.assertEqual(reader.get_num_of_req(), 100)
+        self.assertListEqual([req for req in reader], labels)
+        reader.close()
+        bin_reader.close()
+
+        # string labels are encoded
+        plain_reader = PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False)
+        container_loc = os.path.join(tmp_dir, "trace.txt.ptc")
+        convert_to_container(plain_reader, container_loc)
+        reader = ContainerReader(container_loc, open_c_reader=False)
+        self.assertEqual(reader.get_num_of_uniq_req(), 48974)
+        self.assertEqual(reader.get_time_range(), (None, None))
+        self.assertListEqual(reader.decode(reader.read_batch(3)["label"]).tolist(),
+                             ["42932745", "42932746", "42932747"])
+        reader.close()
+        plain_reader.close()
+
+        with self.assertRaises(RuntimeError):
+            ContainerReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        shutil.rmtree(tmp_dir)
+
+    def test_reader_compressed(self):
+        tmp_dir = tempfile.mkdtemp()
+        with open("{}/trace.txt".format(DAT_FOLDER), "rb") as ifile:
+            data = ifile.read()
+        with open(os.path.join(tmp_dir, "trace.txt.gz"), "wb") as ofile:
+            ofile.write(gzip.compress(data))
+        write_blocks("{}/trace.txt".format(DAT_FOLDER), os.path.join(tmp_dir, "trace.txt.xz"), block_size=100000)
+        write_blocks("{}/trace.vscsi".format(DAT_FOLDER), os.path.join(tmp_dir, "trace.vscsi.bz2"))
+
+        for name in ["trace.txt.gz", "trace.txt.xz"]:
+            reader = PlainReader(os.path.join(tmp_dir, name), open_c_reader=False)
+            self.assertEqual(reader.read_one_req(), "42932745")
+            self.assertEqual(reader.get_num_of_req(), 113872)
+            self.assertEqual(reader.read_last_req(), "42936150")
+            reader.skip_n_req(100000)
+            self.assertEqual(reader.read_one_req(), "48673980")
+            # the end of a compressed trace is the end of decompressed data, not the compressed size
+            reader.reset()
+            reader.skip_n_req(113872)
+            self.assertIsNone(reader.read_one_req())
+            offset_index = reader.get_offset_index()
+            self.assertEqual(offset_index.end, len(data))
+            self.assertEqual(offset_index.get_req_id(len(data)), 113872)
+            reader.close()
+
+        # the block index is kept in memory unless it is asked to be saved
+        self.assertListEqual([name for name in os.listdir(tmp_dir) if name.endswith(BLOCK_INDEX_SUFFIX)], [])
+        reader = PlainReader(os.path.join(tmp_dir, "trace.txt.gz"), open_c_reader=False, save_offset_index=True)
+        reader.skip_n_req(10)
+        reader.reset()
+        self.assertTrue(os.path.exists(os.path.join(tmp_dir, "trace.txt.gz" + BLOCK_INDEX_SUFFIX)))
+        reader.close()
+
+        # the block index of independently compressed members
+        index = BlockIndex.build(os.path.join(tmp_dir, "trace.txt.xz"))
+        self.assertEqual(len(index.comp_offsets), 11)
+        self.assertEqual(index.decomp_size, len(data))
+        with CompressedFile(os.path.join(tmp_dir, "trace.txt.xz")) as ifile:
+            for pos in [500000, 10, 900000, len(data) - 5]:
+                ifile.seek(pos)
+                self.assertEqual(ifile.read(20), data[pos: pos + 20])
+
+        reader = VscsiReader(os.path.join(tmp_dir, "trace.vscsi.bz2"), open_c_reader=False, use_mmap=True)
+        self.assertEqual(reader.get_num_of_req(), 113872)
+        self.assertEqual(reader.read_last_req()[5], 42936150)
+        reader.skip_n_req(3)
+        self.assertEqual(reader.read_one_req(), 40409911)
+        reader.close()
+        shutil.rmtree(tmp_dir)
+
+    def test_reader_lock(self):
+        reader = PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False)
+        # no manager process is started for the lock
+        self.assertListEqual(multiprocessing.active_children(), [])
+        lock = reader.get_params()["lock"]
+        self.assertIsInstance(lock, FileLock)
+        reader2 = reader.copy()
+        with reader.lock:
+            self.assertFalse(reader2.lock.acquire(blocking=False))
+            with ProcessPoolExecutor(max_workers=1) as ppe:
+                self.assertFalse(ppe.submit(lock.acquire, False).result())
+        self.assertTrue(reader2.lock.acquire(blocking=False))
+        reader2.lock.release()
+        reader.close()
+        reader2.close()
+
+    def test_reader_offset_index(self):
+        tmp_dir = tempfile.mkdtemp()
+        trace_loc = os.path.join(tmp_dir, "trace.txt")
+        shutil.copy("{}/trace.txt".format(DAT_FOLDER), trace_loc)
+        labels = []
+        reader = PlainReader(trace_loc, open_c_reader=False, use_offset_index=False)
+        req = reader.read_one_req()
+        while req is not None:
+            labels.append(req)
+            req = reader.read_one_req()
+        reader.close()
+
+        # the index is kept in memory unless it is asked to be saved
+        reader = PlainReader(trace_loc, open_c_reader=False)
+        self.assertEqual(reader.get_num_of_req(), 113872)
+        self.assertFalse(os.path.exists(trace_loc + OFFSET_INDEX_SUFFIX))
+        reader.close()
+
+        reader = PlainReader(trace_loc, open_c_reader=False, save_offset_index=True)
+        self.assertEqual(reader.get_num_of_req(), 113872)
+        self.assertTrue(os.path.exists(trace_loc + OFFSET_INDEX_SUFFIX))
+        self.assertTrue(reader.copy().save_offset_index)
+        for n in [0, 1, 65535, 65536, 100000, 113871]:
+            reader.reset()
+            reader.skip_n_req(n)
+            self.assertEqual(reader.read_one_req(), labels[n])
+        reader.reset()
+        reader.skip_n_req(113872)
+        self.assertIsNone(reader.read_one_req())
+        self.assertEqual(reader.read_last_req(), labels[-1])
+        reader.close()
+
+        # the index is rebuilt after the trace grows
+        with open(trace_loc, "a") as ofile:
+            ofile.write("new_req\n\n")
+        reader = PlainReader(trace_loc, open_c_reader=False)
+        self.assertEqual(reader.get_num_of_req(), 113873)
+        self.assertEqual(reader.read_last_req(), "new_req")
+        reader.close()
+
+        index = OffsetIndex.build(trace_loc, interval=1000)
+        self.assertEqual(len(index.offsets), 114)
+        offset, num_of_lines = index.get_offset(2500)
+        self.assertEqual((index.get_req_id(offset), num_of_lines), (2000, 500))
+
+        init_params = {"header": True, "real_time": 2, "op": 3, "size": 4, 'label': 5, 'delimiter': ','}
+        trace_loc = os.path.join(tmp_dir, "trace.csv")
+        shutil.copy("{}/trace.csv".format(DAT_FOLDER), trace_loc)
+        reader = CsvReader(trace_loc, open_c_reader=False, init_params=init_params)
+        self.assertEqual(reader.get_num_of_req(), 113872)
+        reader.skip_n_req(5)
+        self.assertEqual(reader.read_one_req(), "6238199")
+        self.assertEqual(reader.read_last_req(), ['1', '5641098458687', '2a', '512', '42936150'])
+        reader.close()
+        shutil.rmtree(tmp_dir)
+
+    def test_reader_partition(self):
+        tmp_dir = tempfile.mkdtemp()
+        init_params = {"header": True, "real_time": 2, "op": 3, "size": 4, 'label': 5, 'delimiter': ','}
+        shutil.copy("{}/trace.txt".format(DAT_FOLDER), tmp_dir)
+        shutil.copy("{}/trace.csv".format(DAT_FOLDER), tmp_dir)
+        readers = [PlainReader(os.path.join(tmp_dir, "trace.txt"), open_c_reader=False),
+                   CsvReader(os.path.join(tmp_dir, "trace.csv"), data_type="l", open_c_reader=False,
+                             init_params=init_params),
+                   VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False),
+                   VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False, use_mmap=True)]
+        for reader in readers:
+            labels = list(iter(reader.read_one_req, None))
+            reader.reset()
+            for num_of_partitions in (1, 3, 7):
+                partitions = reader.get_partitions(num_of_partitions)
+                self.assertEqual(len(partitions), num_of_partitions)
+                self.assertEqual(sum(p[3] for p in partitions), 113872)
+                for partition in partitions:
+                    with reader.get_sub_reader(partition) as sub_reader:
+                        begin, end, first_req, num_of_req = partition
+                        self.assertEqual(sub_reader.get_num_of_req(), num_of_req)
+                        self.assertListEqual(list(iter(sub_reader.read_one_req, None)),
+                                             labels[first_req: first_req + num_of_req])
+                        sub_reader.reset()
+                        self.assertEqual(sub_reader.read_one_req(), labels[first_req])
+                        self.assertEqual(sub_reader.read_last_req(label_only=True),
+                                         labels[first_req + num_of_req - 1])
+            reader.close()
+
+        # small ranges, the reader of a range can be created from its parameters in other processes
+        reader = PlainReader(os.path.join(tmp_dir, "trace.txt"), open_c_reader=False)
+        partitions = reader.get_partitions(1000)
+        self.assertEqual(partitions[1][2], partitions[0][3])
+        with PlainReader(**reader.get_sub_reader_params(partitions[1])) as sub_reader:
+            self.assertEqual(sub_reader.get_num_of_req(), partitions[1][3])
+        reader.close()
+        shutil.rmtree(tmp_dir)
+
+    def test_reader_multi(self):
+        # the partitions of a sorted trace are merged back into the trace
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False, use_mmap=True)
+        labels = reader.get_column("label").tolist()
+        partitions = reader.get_partitions(3)
+        m_reader = MultiReader([reader.get_sub_reader(p) for p in partitions], batch_size=1000)
+        self.assertEqual(m_reader.read_with_readerID(), (0, 42932745))
+        self.assertListEqual([m_reader.read_one_req() for _ in range(2)], labels[1:3])
+        batch, batch_ids = m_reader.read_batch_with_readerID(5)
+        self.assertListEqual(batch["label"].tolist(), labels[3:8])
+        self.assertListEqual(batch_ids.tolist(), [0] * 5)
+        self.assertListEqual(batch["real_time"].tolist(), reader.get_column("real_time")[3:8].tolist())
+        merged = []
+        for batch in m_reader.iter_batches(999):
+            self.assertLessEqual(len(batch), 999)
+            merged.extend(batch["label"].tolist())
+        self.assertListEqual(merged, labels[8:])
+        self.assertEqual(len(m_reader.read_batch(10)), 0)
+        m_reader.reset()
+        reader_ids = []
+        batch, batch_ids = m_reader.read_batch_with_readerID(113872)
+        while len(batch):
+            reader_ids.extend(batch_ids.tolist())
+            batch, batch_ids = m_reader.read_batch_with_readerID(113872)
+        self.assertListEqual(reader_ids[-1:] + reader_ids[:1], [2, 0])
+        m_reader.reset()
+        self.assertListEqual(list(m_reader), labels)
+        m_reader.close_all_readers()
+
+        # ties are broken by reader id, labels of different types are kept
+        c_reader = CsvReader("{}/trace.csv".format(DAT_FOLDER), open_c_reader=False,
+                             init_params={"header": True, "real_time": 2, "op": 3, "size": 4, 'label': 5,
+                                          'delimiter': ','})
+        m_reader = MultiReader([c_reader, reader], batch_size=777)
+        self.assertListEqual([m_reader.read_with_readerID() for _ in range(4)],
+                             [(0, "42932745"), (1, 42932745), (0, "42932746"), (1, 42932746)])
+        self.assertEqual(sum(len(batch) for batch in m_reader.iter_batches(1000)), 113872 * 2 - 4)
+        m_reader.close_all_readers()
+
+        # round robin, the longer trace continues after the shorter one is exhausted
+        reader = PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False)
+        short_reader = reader.get_sub_reader(reader.get_partitions(10)[0])
+        short_labels = list(iter(short_reader.read_one_req, None))
+        labels = list(iter(reader.read_one_req, None))
+        short_reader.reset()
+        reader.reset()
+        expected = [req for pair in zip(labels, short_labels) for req in pair] + labels[len(short_labels):]
+        m_reader = MultiReader([reader, short_reader], reading_type="virtual_time", batch_size=1000)
+        self.assertListEqual(list(m_reader), expected)
+        m_reader.close_all_readers()
+
+    def test_reader_req_batch(self):
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        req_batch = reader.read_req_batch(3)
+        self.assertEqual(len(req_batch), 3)
+        self.assertListEqual(req_batch.item_id.tolist(), [42932745, 42932746, 42932747])
+        self.assertListEqual(req_batch.size.tolist(), [512, 512, 512])
+        req = req_batch[1]
+        self.assertEqual((req.item_id, req.size, req.op, req.real_time), (42932746, 512, 42, 5633898611441))
+        self.assertFalse(hasattr(req, "__dict__"))
+        self.assertListEqual(req_batch[1:].item_id.tolist(), [42932746, 42932747])
+        self.assertEqual(Req(1, path="/").path, "/")
+
+        # every cache accepts a RequestBatch
+        reader.reset()
+        cache = LRU(2000)
+        hits = 0
+        req_batch = reader.read_req_batch(10000)
+        while len(req_batch):
+            hits += cache.access(req_batch).sum()
+            req_batch = reader.read_req_batch(10000)
+        self.assertAlmostEqual(hits / 113872, 0.172851974146)
+        reader.close()
+
+        reader = PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False)
+        req_batch = reader.read_req_batch(5)
+        self.assertIsNone(req_batch.size)
+        self.assertListEqual(ARC(2).access(req_batch).tolist(), [False] * 5)
+        reader.close()
+
+        # a new cache accepts a RequestBatch without handling it in access
+        class SetCache(Cache):
+            def __init__(self, cache_size, **kwargs):
+                super().__init__(cache_size, **kwargs)
+                self.cache_set = set()
+
+            def access(self, req_item, **kwargs):
+                hit = req_item in self.cache_set
+                self.cache_set.add(req_item)
+                return hit
+
+        self.assertListEqual(SetCache(2).access(RequestBatch([1, 2, 1, 1])).tolist(), [False, False, True, True])
+        self.assertEqual(SetCache.access.__name__, "access")
+
+    def test_reader_prefetch(self):
+        reader = PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False)
+        labels = list(iter(reader.read_one_req, None))
+        reader.reset()
+        p_reader = PrefetchReader(reader, batch_size=1000, depth=3)
+        self.assertListEqual(list(p_reader), labels)
+        self.assertIsNone(p_reader.read_one_req())
+        stats = p_reader.get_stats()
+        self.assertEqual(stats["num_of_batches"], 114)
+        self.assertLessEqual(stats["read_ahead"], 3)
+        self.assertGreaterEqual(stats["stall_time"], 0)
+        self.assertEqual(p_reader.get_num_of_req(), 113872)
+
+        p_reader.reset()
+        self.assertListEqual([p_reader.read_one_req() for _ in range(3)], labels[:3])
+        # the wrapped reader continues after the requests read ahead
+        p_reader.stop()
+        self.assertIn(reader.read_one_req(), labels[3:])
+        p_reader.close()
+
+        p_reader = PrefetchReader(PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False))
+        self.assertEqual(p_reader.read_last_req(label_only=True), labels[-1])
+        self.assertRaises(RuntimeError, p_reader.get_offset_index)
+        self.assertEqual(p_reader.read_one_req(), labels[0])
+        p_reader.close()
+
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        time_reqs = list(iter(reader.read_time_req, None))
+        reader.reset()
+        p_reader = PrefetchReader(reader, read_func="read_time_req", batch_size=999)
+        self.assertListEqual(list(iter(p_reader.read_time_req, None)), time_reqs)
+        with PrefetchReader(**p_reader.get_params()) as p_reader2:
+            self.assertEqual(p_reader2.read_time_req(), time_reqs[0])
+        p_reader.close()
+
+    def test_reader_sampling(self):
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False)
+        freq = reader.get_req_freq_distribution()
+        s_reader = SamplingReader(reader, sample_ratio=0.1)
+        sampled = list(s_reader)
+        stats = s_reader.get_sample_stats()
+        self.assertEqual(stats["num_of_total_req"], 113872)
+        self.assertEqual(stats["num_of_sampled_req"], len(sampled))
+        # all requests of a sampled object are sampled
+        self.assertEqual(sum(freq[label] for label in set(sampled)), len(sampled))
+        self.assertTrue(all(spatial_hash(label) < s_reader.threshold for label in sampled))
+        self.assertGreater(len(sampled), 113872 * 0.05)
+        self.assertLess(len(sampled), 113872 * 0.2)
+        self.assertEqual(s_reader.get_num_of_req(), len(sampled))
+        self.assertEqual(s_reader.scale_cache_size(2000), 200)
+        self.assertEqual(s_reader.unscale_cache_size(200), 2000)
+
+        s_reader.reset()
+        time_reqs = list(iter(s_reader.read_time_req, None))
+        self.assertListEqual([req[1] for req in time_reqs], sampled)
+        self.assertEqual(s_reader.read_last_req()[s_reader.label_column - 1], sampled[-1])
+        with SamplingReader(**s_reader.get_params()) as s_reader2:
+            self.assertListEqual(list(s_reader2), sampled)
+        s_reader.close()
+
+        # fixed-size mode lowers the threshold to keep at most sample_size objects
+        s_reader = SamplingReader(PlainReader("{}/trace.txt".format(DAT_FOLDER), open_c_reader=False),
+                                  sample_ratio=1, sample_size=500)
+        sampled = list(s_reader)
+        stats = s_reader.get_sample_stats()
+        self.assertLessEqual(stats["num_of_sampled_obj"], 500)
+        self.assertLess(stats["sample_ratio"], 1)
+        self.assertTrue(all(spatial_hash(label) < s_reader.threshold for label in s_reader.sampled_obj))
+        s_reader.reset()
+        self.assertListEqual(list(s_reader), sampled)
+        s_reader.close()
+
+    def test_reader_time_slice(self):
+        reader = VscsiReader("{}/trace.vscsi".format(DAT_FOLDER), open_c_reader=False, use_mmap=True)
+        time_reqs = list(iter(reader.read_time_req, None))
+        reader.reset()
+        t0, t1 = time_reqs[20000][0], time_reqs[50000][0]
+        with reader.time_slice(t0, t1) as sub_reader:
+            self.assertEqual(sub_reader.get_num_of_req(), 30000)
+            self.assertListEqual(list(iter(sub_reader.read_time_req, None)), time_reqs[20000: 50000])
+        with reader.time_slice(t0 + 1, t1 + 1) as sub_reader:
+            self.assertEqual(sub_reader.read_one_req(), time_reqs[20001][1])
+        with reader.time_slice(0, t0) as sub_reader:
+            self.assertEqual(sub_reader.get_num_of_req(), 20000)
+        with reader.time_slice(time_reqs[-1][0] + 1, time_reqs[-1][0] + 2) as sub_reader:
+            self.assertIsNone(sub_reader.read_one_req())
+        # the reader is not moved
+        self.assertEqual(reader.read_one_req(), time_reqs[0][1])
+        reader.close()
+
+        reader = CsvReader("{}/trace.csv".format(DAT_FOLDER), open_c_reader=False,
+                           init_params={"header": True, "real_time": 2, "op": 3, "size": 4, 'label': 5,
+                                        'delimiter': ','})
+        self.assertEqual(len(reader.get_time_index()), len(reader.get_offset_index().offsets))
+        with reader.time_slice(t0, t1) as sub_reader:
+            self.assertEqual(sub_reader.get_num_of_req(), 30000)
+            self.assertListEqual([req[1] for req in iter(sub_reader.read_time_req, None)],
+                                 [str(req[1]) for req in time_reqs[20000: 50000]])
+        with reader.time_slice(0, time_reqs[-1][0] + 1) as sub_reader:
+            self.assertEqual(sub_reader.get_num_of_req(), 113872)
+            self.assertEqual(sub_reader.read_one_req(), str(time_reqs[0][1]))
+        reader.close()
+
+    def test_reader_csv_batch(self):
+        init_params = {"header": True, "real_time": 2, "op": 3, "size": 4, 'label': 5, 'delimiter': ','}
+        reader = CsvReader("{}/trace.csv".format(DAT_FOLDER), open_c_reader=False, init_params=init_params)
+        batch = reader.read_batch(3)
+        self.assertListEqual(batch["label"].tolist(), ["42932745", "42932746", "42932747"])
+        self.assertAlmostEqual(float(batch["real_time"][1]), 5633898611441.0)
+        self.assertListEqual(batch["size"].tolist(), [512, 512, 512])
+        self.assertEqual(reader.counter, 3)
+        # the next request is right after the batch
+        self.assertEqual(reader.read_one_req(), "40409911")
+        with CsvReader("{}/trace.csv".format(DAT_FOLDER), open_c_reader=False, init_params=init_params) as r:
+            first_labels = [r.read_one_req() for _ in range(9)]
+        self.assertListEqual(reader.read_batch(2)["label"].tolist(), first_labels[4:6])
+        reader.skip_n_req(2)
+        self.assertEqual(reader.read_complete_req()[4], first_labels[8])
+
+        reader.reset()
+        labels = []
+        for batch in reader.iter_batches(10000):
+            labels.extend(batch["label"].tolist())
+        self.assertEqual(reader.counter, 113872)
+        reader.reset()
+        self.assertListEqual(labels, [req for req in reader])
+        reader.close()
+
+        # the lines read past a batch are kept, the compressed trace is not read again from the beginning
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trace_loc = os.path.join(tmp_dir, "trace.csv.gz")
+            with open("{}/trace.csv".format(DAT_FOLDER), "rb") as ifile, gzip.open(trace_loc, "wb") as ofile:
+                shutil.copyfileobj(ifile, ofile)
+            reader = CsvReader(trace_loc, open_c_reader=False, init_params=init_params)
+            reader.trace_file.seek = None
+            self.assertListEqual([label for batch in reader.iter_batches(999) for label in batch["label"].tolist()],
+                                 labels)
+            reader.close()
+
+        reader = CsvReader("{}/trace.csv".format(DAT_FOLDER), data_type='l', open_c_reader=False,
+                           init_params=init_params, block_unit_size=4096, disk_sector_size=512)
+        batch = reader.read_batch(100)
+        reader.reset()
+        self.assertListEqual(batch["label"].tolist(), [reader.read_one_req() for _ in range(100)])
+        reader.close()
+
+        # blank lines are skipped, multi-byte delimiter is supported
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as ofile:
+            ofile.write("a::1\n\n  \nb :: 2\r\nc::3")
+        reader = CsvReader(ofile.name, open_c_reader=False, init_params={"label": 1, "size": 2, "delimiter": "::"})
+        batch = reader.read_batch(10)
+        self.assertListEqual(batch["label"].tolist(), ["a", "b", "c"])
+        self.assertListEqual(batch["size"].tolist(), [1, 2, 3])
+        self.assertEqual(len(reader.read_batch(10)), 0)
+        reader.close()
+        os.remove(ofile.name)
+
     def test_reader_csv_datatype_l(self):
         reader = CsvReader("{}/trace.csv".format(DAT_FOLDER), data_type="l",
                            init_params={"header": True, "real_time": 2, "op": 3, "size": 4, 'label': 5,